@@ -0,0 +1,332 @@
+"""
+本地模拟大模型服务
+模拟 DashScope 文本生成/多模态接口、Ollama 的 /api/generate、/api/chat、/api/tags 接口
+以及 OpenWeatherMap 的地理编码/当前天气/5天预报接口，
+按可配置的首字延迟和token速率返回回复，用于离线压测，不产生任何云端调用费用
+
+用法：
+    python mock_server.py --port 8765 --latency 200 --token-rate 50
+
+    # 让Streamlit应用指向模拟服务
+    DASHSCOPE_BASE_URL=http://127.0.0.1:8765/api/v1 streamlit run case1_sentiment_analysis/app.py
+    OPENWEATHER_BASE_URL=http://127.0.0.1:8765 DASHSCOPE_BASE_URL=http://127.0.0.1:8765/api/v1 streamlit run case2_weather/app.py
+"""
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+DASHSCOPE_PREFIX = "/api/v1"
+GENERATION_PATH = DASHSCOPE_PREFIX + "/services/aigc/text-generation/generation"
+MULTIMODAL_PATH = DASHSCOPE_PREFIX + "/services/aigc/multimodal-generation/generation"
+
+# 通用回复的文本，按需重复到指定token数
+FILLER = "根据您提供的信息，我们进行了综合分析，建议您关注关键指标的变化并及时采取相应措施。"
+
+
+class MockConfig:
+    """模拟服务的延迟与回复配置"""
+
+    def __init__(self, latency=0.2, token_rate=50.0, reply_tokens=60, jitter=0.1, chunk_tokens=4,
+                 weather_latency=0.05):
+        """
+        Args:
+            latency: 首字延迟（秒）
+            token_rate: 每秒生成的token数，0表示不限速
+            reply_tokens: 通用回复的token数（按字计）
+            jitter: 延迟的随机波动比例
+            chunk_tokens: 流式输出时每个分片包含的token数
+            weather_latency: 天气接口的响应延迟（秒）
+        """
+        self.latency = latency
+        self.token_rate = token_rate
+        self.reply_tokens = reply_tokens
+        self.jitter = jitter
+        self.chunk_tokens = chunk_tokens
+        self.weather_latency = weather_latency
+
+    def first_token_delay(self):
+        return self.latency * (1 + random.uniform(-self.jitter, self.jitter))
+
+    def token_delay(self, tokens):
+        return tokens / self.token_rate if self.token_rate > 0 else 0
+
+
+def extract_text(model_input):
+    """取出请求中的全部文本（prompt或消息内容）"""
+    if "prompt" in model_input:
+        return model_input["prompt"] or ""
+    parts = []
+    for message in model_input.get("messages", []):
+        content = message.get("content", "")
+        if isinstance(content, list):
+            parts.extend(item.get("text", "") for item in content if isinstance(item, dict))
+        else:
+            parts.append(content)
+    return "\n".join(parts)
+
+
+def build_reply(text, config):
+    """按提示词生成格式合理的回复，使各案例的解析逻辑能正常走通"""
+    packed = re.search(r"请分别分析以下(\d+)条文本的情感倾向", text)
+    if packed:
+        count = int(packed.group(1))
+        return json.dumps([
+            {"id": i + 1, "sentiment": "正面", "confidence": 90, "keywords": ["满意"]}
+            for i in range(count)
+        ], ensure_ascii=False)
+    if "情感倾向" in text:
+        return "1. 情感倾向：正面\n2. 置信度：90%\n3. 关键词：满意\n4. 详细分析：文本整体表达了满意的情绪。"
+    if "天气查询需求" in text:
+        return json.dumps({"city": "北京", "query_type": "当前天气", "time": "今天"}, ensure_ascii=False)
+    return (FILLER * (config.reply_tokens // len(FILLER) + 1))[:config.reply_tokens]
+
+
+def build_weather(lat, lon, timestamp):
+    """按坐标生成确定性的当前天气数据，字段与OpenWeatherMap一致"""
+    rng = random.Random(f"{lat:.2f},{lon:.2f},{int(timestamp // 3600)}")
+    return {
+        "coord": {"lat": lat, "lon": lon},
+        "weather": [{"id": 800, "main": "Clear", "description": rng.choice(["晴", "多云", "小雨", "阴"])}],
+        "main": {
+            "temp": round(rng.uniform(-5, 35), 1),
+            "feels_like": round(rng.uniform(-5, 35), 1),
+            "pressure": rng.randint(990, 1030),
+            "humidity": rng.randint(20, 95)
+        },
+        "visibility": 10000,
+        "wind": {"speed": round(rng.uniform(0, 10), 1), "deg": rng.randint(0, 359)},
+        "clouds": {"all": rng.randint(0, 100)},
+        "dt": int(timestamp),
+        "sys": {"country": "CN"},
+        "timezone": 28800,
+        "name": f"{lat:.2f},{lon:.2f}"
+    }
+
+
+def build_forecast(lat, lon, timestamp):
+    """生成5天、每3小时一条的预报数据"""
+    start = int(timestamp // 10800 * 10800)
+    items = []
+    for i in range(40):
+        current = build_weather(lat, lon, start + i * 10800)
+        items.append({
+            "dt": current["dt"],
+            "main": current["main"],
+            "weather": current["weather"],
+            "wind": current["wind"],
+            "pop": round(random.Random(current["dt"]).random(), 2)
+        })
+    return {
+        "list": items,
+        "city": {"name": f"{lat:.2f},{lon:.2f}", "country": "CN", "coord": {"lat": lat, "lon": lon}, "timezone": 28800}
+    }
+
+
+def split_chunks(reply, size):
+    return [reply[i:i + size] for i in range(0, len(reply), size)] or [""]
+
+
+def make_handler(config):
+    """创建绑定了配置的请求处理类"""
+
+    class MockHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            query = {key: values[0] for key, values in parse_qs(url.query).items()}
+            if url.path == "/api/tags":
+                self._send_json(200, {"models": [{"name": "deepseek-r1:1.5b"}, {"name": "deepseek-r1:7b"}]})
+            elif url.path in ("/geo/1.0/direct", "/data/2.5/weather", "/data/2.5/forecast"):
+                self._openweather(url.path, query)
+            else:
+                self._send_json(404, {"message": f"unknown path {self.path}"})
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            if self.path in (GENERATION_PATH, MULTIMODAL_PATH):
+                self._dashscope(body)
+            elif self.path == "/api/generate":
+                self._ollama(body, chat=False)
+            elif self.path == "/api/chat":
+                self._ollama(body, chat=True)
+            else:
+                self._send_json(404, {"message": f"unknown path {self.path}"})
+
+        def _dashscope(self, body):
+            if not self.headers.get("Authorization", "").startswith("Bearer "):
+                self._send_json(401, {"code": "InvalidApiKey", "message": "Invalid API-key provided."})
+                return
+
+            model_input = body.get("input", {})
+            text = extract_text(model_input)
+            reply = build_reply(text, config)
+            usage = {"input_tokens": len(text), "output_tokens": len(reply), "total_tokens": len(text) + len(reply)}
+            multimodal = self.path == MULTIMODAL_PATH
+
+            def choice(content, finish_reason):
+                if multimodal:
+                    content = [{"text": content}]
+                return {"finish_reason": finish_reason, "message": {"role": "assistant", "content": content}}
+
+            time.sleep(config.first_token_delay())
+            if self.headers.get("X-DashScope-SSE") == "enable":
+                self._start_stream("text/event-stream")
+                chunks = split_chunks(reply, config.chunk_tokens)
+                for i, chunk in enumerate(chunks, 1):
+                    time.sleep(config.token_delay(len(chunk)))
+                    finish_reason = "stop" if i == len(chunks) else "null"
+                    data = {"output": {"choices": [choice(chunk, finish_reason)]}, "usage": usage, "request_id": "mock"}
+                    self._write_event(f"id:{i}\nevent:result\n:HTTP_STATUS/200\ndata:{json.dumps(data, ensure_ascii=False)}\n\n")
+                return
+
+            time.sleep(config.token_delay(len(reply)))
+            self._send_json(200, {"output": {"choices": [choice(reply, "stop")]}, "usage": usage, "request_id": "mock"})
+
+        def _openweather(self, path, query):
+            time.sleep(config.weather_latency)
+            if not query.get("appid"):
+                self._send_json(401, {"cod": 401, "message": "Invalid API key."})
+                return
+            if path == "/geo/1.0/direct":
+                # 按名称生成稳定的虚拟坐标
+                rng = random.Random(query.get("q", ""))
+                place = {"name": query.get("q", ""), "country": "CN",
+                         "lat": round(rng.uniform(20, 45), 4), "lon": round(rng.uniform(100, 125), 4)}
+                self._send_json(200, [place])
+                return
+            lat, lon = float(query.get("lat", 0)), float(query.get("lon", 0))
+            builder = build_weather if path == "/data/2.5/weather" else build_forecast
+            self._send_json(200, builder(lat, lon, time.time()))
+
+        def _ollama(self, body, chat):
+            text = extract_text(body)
+            reply = build_reply(text, config)
+            model = body.get("model", "deepseek-r1:1.5b")
+
+            def payload(content, done):
+                data = {"model": model, "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ"), "done": done}
+                if chat:
+                    data["message"] = {"role": "assistant", "content": content}
+                else:
+                    data["response"] = content
+                if done:
+                    data.update({"prompt_eval_count": len(text), "eval_count": len(reply)})
+                return data
+
+            time.sleep(config.first_token_delay())
+            if body.get("stream", True):
+                self._start_stream("application/x-ndjson")
+                for chunk in split_chunks(reply, config.chunk_tokens):
+                    time.sleep(config.token_delay(len(chunk)))
+                    self._write_event(json.dumps(payload(chunk, False), ensure_ascii=False) + "\n")
+                self._write_event(json.dumps(payload("", True), ensure_ascii=False) + "\n")
+                return
+
+            time.sleep(config.token_delay(len(reply)))
+            self._send_json(200, payload(reply, True))
+
+        def _send_json(self, status, data):
+            out = json.dumps(data, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(out)))
+            self.end_headers()
+            self.wfile.write(out)
+
+        def _start_stream(self, content_type):
+            # 流式响应不带Content-Length，以关闭连接表示结束
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.close_connection = True
+
+        def _write_event(self, text):
+            self.wfile.write(text.encode("utf-8"))
+            self.wfile.flush()
+
+    return MockHandler
+
+
+class MockServer:
+    """在后台线程中运行的模拟服务"""
+
+    def __init__(self, config=None, host="127.0.0.1", port=0):
+        """
+        Args:
+            config: MockConfig，默认使用默认配置
+            host: 监听地址
+            port: 监听端口，0表示随机可用端口
+        """
+        self.config = config or MockConfig()
+        self.httpd = ThreadingHTTPServer((host, port), make_handler(self.config))
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        """服务根地址，Ollama客户端直接使用"""
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def dashscope_url(self):
+        """DashScope接口地址，可作为 LLMClient 的 base_url 或 DASHSCOPE_BASE_URL"""
+        return self.url + DASHSCOPE_PREFIX
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地模拟 DashScope / Ollama 服务")
+    parser.add_argument("--host", default="127.0.0.1", help="监听地址")
+    parser.add_argument("--port", type=int, default=8765, help="监听端口")
+    parser.add_argument("--latency", type=float, default=200, help="首字延迟（毫秒）")
+    parser.add_argument("--token-rate", type=float, default=50, help="每秒生成的token数，0表示不限速")
+    parser.add_argument("--reply-tokens", type=int, default=60, help="通用回复的token数")
+    parser.add_argument("--weather-latency", type=float, default=50, help="天气接口的响应延迟（毫秒）")
+    args = parser.parse_args()
+
+    config = MockConfig(
+        latency=args.latency / 1000,
+        token_rate=args.token_rate,
+        reply_tokens=args.reply_tokens,
+        weather_latency=args.weather_latency / 1000
+    )
+    server = MockServer(config, args.host, args.port)
+    print(f"模拟服务已启动：{server.url}")
+    print(f"DashScope地址：{server.dashscope_url}（设置 DASHSCOPE_BASE_URL 即可让应用使用）")
+    print(f"OpenWeatherMap地址：{server.url}（设置 OPENWEATHER_BASE_URL 即可让应用使用）")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,460 @@
+"""
+离线压测
+启动本地模拟服务（或使用 --base-url 指定的服务），以无界面的方式并发执行各案例的大模型调用流程，
+输出每个场景的 p50/p95/p99 延迟和每秒请求数
+
+用法：
+    python benchmark/run_benchmark.py
+    python benchmark/run_benchmark.py --scenarios case1_single,case6_chat --requests 100 --concurrency 16
+    python benchmark/run_benchmark.py --latency 500 --token-rate 30 --json results.json
+"""
+
+import argparse
+import io
+import json
+import math
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import pandas as pd
+from PIL import Image, ImageDraw
+
+SECTION_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(SECTION_DIR)
+sys.path.append(os.path.join(SECTION_DIR, "case1_sentiment_analysis"))
+sys.path.append(os.path.join(SECTION_DIR, "case2_weather"))
+sys.path.append(os.path.join(SECTION_DIR, "case3_table_extraction"))
+sys.path.append(os.path.join(SECTION_DIR, "case4_article_summary"))
+sys.path.append(os.path.join(SECTION_DIR, "case5_ops_incident"))
+sys.path.append(os.path.join(SECTION_DIR, "case6_ai_customer_service"))
+sys.path.append(os.path.join(SECTION_DIR, "case7_insurance_fraud"))
+sys.path.append(os.path.join(os.path.dirname(SECTION_DIR), "section_2"))
+
+from answer_templates import render_answer, weather_prompt
+from batch_analysis import analyze_packed, analyze_text
+from common.llm_client import LLMClient
+from conversation_context import ConversationContext
+from deepseek_ollama_example import DeepSeekOllamaClient
+from fraud_prompt import build_fraud_prompt
+from geocoder import Geocoder
+from image_extraction import recognize_regions
+from image_preprocess import preprocess
+from incident_prompt import build_analysis_prompt
+from mock_server import MockConfig, MockServer
+from query_parser import PARSE_PROMPT, QueryParser, parse_llm_result
+from summary_prompt import build_summary_prompt
+from table_extraction import extract_table, extract_text
+from weather_cache import WeatherCache
+from weather_service import WeatherService
+
+SAMPLE_TEXTS = [
+    "这个产品真的很棒，我非常喜欢！",
+    "快递太慢了，等了一个星期才到。",
+    "质量一般，和描述的差不多。",
+    "客服态度很好，耐心解答了我的问题。",
+    "用了两天就坏了，非常失望。",
+]
+
+SAMPLE_TABLE = "\n".join(
+    f"订单{i:04d}\t客户{i}\t{100 + i * 7}元\t{'已发货' if i % 2 else '待发货'}" for i in range(30)
+)
+
+# 1000行的大表格，用于分块提取
+SAMPLE_LARGE_TABLE = pd.DataFrame({
+    "订单号": [f"订单{i:04d}" for i in range(1000)],
+    "金额": [100 + i * 7 for i in range(1000)],
+    "状态": ["已发货" if i % 2 else "待发货" for i in range(1000)],
+})
+
+SAMPLE_ARTICLE = "人工智能技术正在深刻改变各行各业的生产方式。" * 60
+
+# 天气查询：简单问题按模板回复，开放性问题由大模型回复
+SAMPLE_QUERIES = ["北京今天天气怎么样？", "北京今天适合跑步吗？"]
+
+# 运维故障分析：与应用收集的系统信息字段一致
+SAMPLE_SYSTEM_INFO = {
+    "系统信息": {
+        "操作系统": "Linux",
+        "系统版本": "#1 SMP PREEMPT_DYNAMIC",
+        "架构": "x86_64",
+        "处理器": "x86_64",
+        "主机名": "app-server-01",
+        "Python版本": "3.10.12"
+    },
+    "硬件信息": {
+        "CPU核心数": 8,
+        "CPU使用率": "95.0%",
+        "内存总量": "16.00 GB",
+        "内存使用率": "88.0%",
+        "可用内存": "1.92 GB"
+    },
+    "磁盘信息": {
+        "/dev/sda1": {"挂载点": "/", "文件系统": "ext4", "总容量": "100.00 GB", "已使用": "70.00 GB"}
+    }
+}
+SAMPLE_INCIDENT = "服务响应变慢，接口超时率明显上升"
+SAMPLE_ERROR_LOG = "ERROR [pool-3] java.net.SocketTimeoutException: Read timed out"
+
+# 保险欺诈分析：与应用输入表单的字段一致
+SAMPLE_CLAIM = {
+    "months_as_customer": 1,
+    "age": 35,
+    "policy_state": "OH",
+    "policy_csl": "250/500",
+    "policy_deductable": 1000,
+    "policy_annual_premium": 1200.0,
+    "umbrella_limit": 0,
+    "insured_zip": 45000,
+    "insured_sex": "MALE",
+    "insured_education_level": "College",
+    "insured_occupation": "sales",
+    "insured_hobbies": "reading",
+    "insured_relationship": "husband",
+    "capital-gains": 0,
+    "capital-loss": 0,
+    "incident_type": "Single Vehicle Collision",
+    "collision_type": "Front Collision",
+    "incident_severity": "Total Loss",
+    "authorities_contacted": "None",
+    "incident_state": "NY",
+    "incident_city": "Columbus",
+    "incident_location": "123 Main St",
+    "incident_hour_of_the_day": 3,
+    "number_of_vehicles_involved": 1,
+    "property_damage": "NO",
+    "bodily_injuries": 0,
+    "witnesses": 0,
+    "police_report_available": "NO",
+    "total_claim_amount": 50000,
+    "injury_claim": 5000,
+    "property_claim": 5000,
+    "vehicle_claim": 40000,
+    "auto_make": "Toyota",
+    "auto_model": "Camry",
+    "auto_year": 2015,
+}
+
+
+def make_table_image(rows=80, columns=5, cell=(220, 48), margin=160):
+    """生成一张带线框表格的扫描页面（PNG），用于图片识别场景"""
+    width, height = columns * cell[0], (rows + 1) * cell[1]
+    image = Image.new("RGB", (width + margin * 2, height + margin * 2), "white")
+    draw = ImageDraw.Draw(image)
+    draw.text((margin, margin // 2), "Order report", fill="black")
+    for row in range(rows + 2):
+        draw.line([(margin, margin + row * cell[1]), (margin + width, margin + row * cell[1])], fill="black", width=2)
+    for column in range(columns + 1):
+        draw.line([(margin + column * cell[0], margin), (margin + column * cell[0], margin + height)], fill="black", width=2)
+    for row in range(rows + 1):
+        for column in range(columns):
+            text = f"col{column}" if row == 0 else f"{row * 7 + column}"
+            draw.text((margin + column * cell[0] + 10, margin + row * cell[1] + 16), text, fill="black")
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+SAMPLE_IMAGE = make_table_image()
+
+
+class NullCache:
+    """不缓存任何内容，保证每次调用都真正发出请求"""
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value):
+        pass
+
+
+def scenario_case1_single(env):
+    """CASE 1 单条情感分析"""
+    text = SAMPLE_TEXTS[env.iteration % len(SAMPLE_TEXTS)]
+    record = analyze_text(text, env.client, env.model)
+    if not record["sentiment"]:
+        raise RuntimeError("未能解析情感倾向")
+
+
+def scenario_case1_packed(env):
+    """CASE 1 批量分析（10条打包为一次请求）"""
+    texts = [SAMPLE_TEXTS[(env.iteration + i) % len(SAMPLE_TEXTS)] for i in range(10)]
+    results, _ = analyze_packed(texts, env.client, env.model)
+    errors = [error for _, error in results if error]
+    if errors:
+        raise RuntimeError(errors[0])
+
+
+def query_weather(env, weather_service):
+    """天气查询流程：本地解析，失败时大模型解析 + 天气数据 + 模板或大模型回复"""
+    query = SAMPLE_QUERIES[env.iteration % len(SAMPLE_QUERIES)]
+    parsed = env.parser.parse(query)
+    if parsed is None:
+        response = env.client.generate(model=env.model, prompt=PARSE_PROMPT.format(query=query))
+        check(response)
+        parsed = parse_llm_result(response.text)
+    weather = weather_service.get_weather_data(parsed["city"], env.openweather_key)
+    if not weather["success"]:
+        raise RuntimeError(weather["error"])
+    if parsed.get("simple") and render_answer(parsed, weather["data"], weather["city_info"]["name"]) is not None:
+        return
+    check(env.client.generate(model=env.model, prompt=weather_prompt(query, weather["data"]["current"])))
+
+
+def scenario_case2_weather(env):
+    """CASE 2 天气查询（冷缓存，每次都请求天气接口）"""
+    query_weather(env, env.weather_cold)
+
+
+def scenario_case2_weather_warm(env):
+    """CASE 2 天气查询（共享天气缓存，只有首次请求天气接口）"""
+    query_weather(env, env.weather)
+
+
+def scenario_case3_text(env):
+    """CASE 3 文本表格提取"""
+    extract_text(SAMPLE_TABLE, env.client, env.model)
+
+
+def scenario_case3_chunked(env):
+    """CASE 3 大表格分块并发提取（1000行，每块200行）"""
+    extract_table(SAMPLE_LARGE_TABLE, env.client, env.model, chunk_rows=200)
+
+
+def scenario_case3_image(env):
+    """CASE 3 图片表格识别（预处理、裁剪表格区域、切块并发识别）"""
+    regions, info = preprocess(SAMPLE_IMAGE)
+    recognize_regions(regions, env.client, cropped=info["tables"] > 0)
+
+
+def scenario_case4_summary(env):
+    """CASE 4 长文摘要"""
+    check(env.client.generate(model=env.model, prompt=build_summary_prompt(SAMPLE_ARTICLE)))
+
+
+def scenario_case5_ops(env):
+    """CASE 5 运维故障分析"""
+    prompt = build_analysis_prompt(SAMPLE_SYSTEM_INFO, SAMPLE_INCIDENT, SAMPLE_ERROR_LOG)
+    check(env.client.generate(model=env.model, prompt=prompt))
+
+
+def scenario_case6_chat(env):
+    """CASE 6 AI客服（按token预算管理上下文 + 流式输出）"""
+    context = ConversationContext(budget=2000)
+    ttft = None
+    for turn in range(3):
+        context.append("user", f"我的订单{env.iteration}还没发货，第{turn + 1}次询问")
+        context.compact(lambda prompt: env.client.generate(model=env.model, prompt=prompt).text)
+        start = time.perf_counter()
+        chunks = []
+        for chunk in env.client.stream_generate(model=env.model, prompt=context.build_prompt("你是一名电商客服")):
+            if ttft is None:
+                ttft = time.perf_counter() - start
+            chunks.append(chunk)
+        context.append("assistant", "".join(chunks))
+    return {"ttft": ttft}
+
+
+def scenario_case7_fraud(env):
+    """CASE 7 保险欺诈分析"""
+    check(env.client.generate(model=env.model, prompt=build_fraud_prompt(SAMPLE_CLAIM, "高风险", 0.82)))
+
+
+def scenario_ollama_generate(env):
+    """Section 2 DeepSeekOllamaClient.generate_text"""
+    result = env.ollama.generate_text("请用一句话介绍大模型")
+    if "error" in result:
+        raise RuntimeError(result["error"])
+
+
+def scenario_ollama_chat(env):
+    """Section 2 DeepSeekOllamaClient.chat"""
+    result = env.ollama.chat([{"role": "user", "content": "你好，请介绍一下你自己"}])
+    if "error" in result:
+        raise RuntimeError(result["error"])
+
+
+def scenario_ollama_stream(env):
+    """Section 2 DeepSeekOllamaClient.stream_generate"""
+    start = time.perf_counter()
+    ttft = None
+    for chunk in env.ollama.stream_generate("请写一首关于春天的短诗"):
+        if chunk.startswith("错误:"):
+            raise RuntimeError(chunk)
+        if ttft is None:
+            ttft = time.perf_counter() - start
+    return {"ttft": ttft}
+
+
+SCENARIOS = {
+    "case1_single": scenario_case1_single,
+    "case1_packed": scenario_case1_packed,
+    "case2_weather": scenario_case2_weather,
+    "case2_weather_warm": scenario_case2_weather_warm,
+    "case3_text": scenario_case3_text,
+    "case3_chunked": scenario_case3_chunked,
+    "case3_image": scenario_case3_image,
+    "case4_summary": scenario_case4_summary,
+    "case5_ops": scenario_case5_ops,
+    "case6_chat": scenario_case6_chat,
+    "case7_fraud": scenario_case7_fraud,
+    "ollama_generate": scenario_ollama_generate,
+    "ollama_chat": scenario_ollama_chat,
+    "ollama_stream": scenario_ollama_stream,
+}
+
+
+def check(response):
+    """非200响应视为失败"""
+    if response.status_code != 200:
+        raise RuntimeError(f"API调用失败：{response.message}")
+
+
+def percentile(values, p):
+    """最近秩法计算百分位数"""
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def run_scenario(name, services, requests_count, concurrency):
+    """
+    并发执行一个场景
+
+    Args:
+        services: 场景使用的客户端和参数（client、ollama、weather、model等）
+
+    Returns:
+        包含延迟分位数、RPS和失败数的统计字典
+    """
+    scenario = SCENARIOS[name]
+
+    def run_once(iteration):
+        env = SimpleNamespace(**services, iteration=iteration)
+        start = time.perf_counter()
+        try:
+            extra = scenario(env) or {}
+            return time.perf_counter() - start, extra, None
+        except Exception as e:
+            return time.perf_counter() - start, {}, str(e)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(run_once, range(requests_count)))
+    elapsed = time.perf_counter() - start
+
+    latencies = [latency for latency, _, error in results if error is None]
+    errors = [error for _, _, error in results if error is not None]
+    ttfts = [extra["ttft"] for _, extra, _ in results if extra.get("ttft") is not None]
+
+    stats = {
+        "scenario": name,
+        "requests": requests_count,
+        "failed": len(errors),
+        "elapsed": elapsed,
+        "rps": len(latencies) / elapsed if elapsed > 0 else 0,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+    }
+    if ttfts:
+        stats["ttft_p50"] = percentile(ttfts, 50)
+    if errors:
+        stats["first_error"] = errors[0]
+    return stats
+
+
+def format_ms(seconds):
+    return "-" if math.isnan(seconds) else f"{seconds * 1000:.0f}"
+
+
+def print_report(results):
+    print(f"{'场景':<16}{'请求':>6}{'失败':>6}{'RPS':>9}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}{'首字p50(ms)':>14}")
+    for stats in results:
+        ttft = format_ms(stats["ttft_p50"]) if "ttft_p50" in stats else "-"
+        print(
+            f"{stats['scenario']:<16}{stats['requests']:>6}{stats['failed']:>6}{stats['rps']:>9.1f}"
+            f"{format_ms(stats['p50']):>10}{format_ms(stats['p95']):>10}{format_ms(stats['p99']):>10}{ttft:>14}"
+        )
+    for stats in results:
+        if "first_error" in stats:
+            print(f"⚠️ {stats['scenario']} 失败示例：{stats['first_error']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="各案例大模型调用流程的离线压测")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="逗号分隔的场景名称")
+    parser.add_argument("--requests", type=int, default=50, help="每个场景的执行次数")
+    parser.add_argument("--concurrency", type=int, default=8, help="并发数")
+    parser.add_argument("--model", default="qwen-turbo", help="文本模型名称")
+    parser.add_argument("--latency", type=float, default=200, help="模拟服务的首字延迟（毫秒）")
+    parser.add_argument("--token-rate", type=float, default=50, help="模拟服务每秒生成的token数，0表示不限速")
+    parser.add_argument("--reply-tokens", type=int, default=60, help="模拟服务通用回复的token数")
+    parser.add_argument("--base-url", help="DashScope服务地址，指定后不启动模拟服务")
+    parser.add_argument("--ollama-url", help="Ollama服务地址，默认使用模拟服务")
+    parser.add_argument("--openweather-url", help="OpenWeatherMap服务地址，默认使用模拟服务")
+    parser.add_argument("--openweather-key", default=os.getenv("OPENWEATHER_API_KEY", "mock-key"), help="OpenWeatherMap API Key")
+    parser.add_argument("--api-key", default=os.getenv("DASHSCOPE_API_KEY", "mock-key"), help="DashScope API Key")
+    parser.add_argument("--json", help="把结果另存为JSON文件")
+    args = parser.parse_args()
+
+    names = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"未知场景：{', '.join(unknown)}，可选：{', '.join(SCENARIOS)}")
+
+    server = None
+    if not args.base_url or not args.ollama_url or not args.openweather_url:
+        config = MockConfig(latency=args.latency / 1000, token_rate=args.token_rate, reply_tokens=args.reply_tokens)
+        server = MockServer(config).start()
+        print(f"模拟服务：{server.url}（首字延迟 {args.latency:.0f}ms，{args.token_rate:.0f} token/s）")
+
+    client = LLMClient(
+        args.api_key,
+        base_url=args.base_url or server.dashscope_url,
+        pool_size=max(16, args.concurrency),
+        cache=NullCache(),
+        app="benchmark"
+    )
+    openweather_url = args.openweather_url or server.url
+    # 使用临时地理编码库，避免压测数据写入应用的缓存
+    geocoder = Geocoder(db_path=os.path.join(tempfile.mkdtemp(), "geocode.sqlite3"), base_url=openweather_url)
+    services = {
+        "client": client,
+        "ollama": DeepSeekOllamaClient(base_url=args.ollama_url or server.url),
+        "weather": WeatherService(geocoder, pool_size=max(16, args.concurrency), base_url=openweather_url),
+        # 新鲜期和过期可用时长都为0，每次查询都请求天气接口
+        "weather_cold": WeatherService(
+            geocoder,
+            cache=WeatherCache(ttl=0, max_stale=0),
+            pool_size=max(16, args.concurrency),
+            base_url=openweather_url
+        ),
+        "parser": QueryParser(geocoder),
+        "openweather_key": args.openweather_key,
+        "model": args.model,
+    }
+
+    try:
+        results = []
+        for name in names:
+            results.append(run_scenario(name, services, args.requests, args.concurrency))
+        print_report(results)
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump(results, f, ensure_ascii=False, indent=2)
+            print(f"结果已保存到 {args.json}")
+    finally:
+        client.close()
+        services["weather"].close()
+        services["weather_cold"].close()
+        if server:
+            server.stop()
+
+
+if __name__ == "__main__":
+    main()
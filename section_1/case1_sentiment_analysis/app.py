@@ -1,11 +1,53 @@
 import streamlit as st
-import dashscope
 import os
+import tempfile
+import uuid
+from datetime import datetime
 from dotenv import load_dotenv
+import sys
+
+# 引入 section_1 公共模块
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.llm_cache import get_default_cache
+from common.llm_client import LLMClient
+from common.metrics import start_metrics_server
+from batch_analysis import build_prompt, load_table, run_batch
+from history_store import HistoryStore, session_log_path, sweep_session_logs
+from lexicon_classifier import classify, format_result
 
 # 加载环境变量
 load_dotenv()
 
+# 设置了 METRICS_PORT 时暴露Prometheus格式的调用指标
+start_metrics_server()
+
+
+@st.cache_resource
+def get_llm_client(api_key):
+    """按API Key复用大模型客户端，连接池在所有会话间共享"""
+    return LLMClient(api_key, app="case1_sentiment_analysis")
+
+
+def get_history_store():
+    """
+    当前会话的历史记录存储，每个会话使用独立的环形缓冲和日志文件，互相不可见
+
+    新会话创建日志时顺带清理过期或超出数量上限的会话日志；
+    本会话的日志已被清理（长时间未写入）时重新创建
+    """
+    store = st.session_state.get("history_store")
+    if store is None or not os.path.exists(store.index_path):
+        log_path = session_log_path(uuid.uuid4().hex)
+        sweep_session_logs()
+        store = st.session_state.history_store = HistoryStore(log_path)
+    return store
+
+# 每页显示的历史记录条数
+HISTORY_PAGE_SIZE = 10
+
+# 结果来源的显示名称
+TIER_LABELS = {"local": "本地词典（未调用大模型）", "llm": "大模型"}
+
 # 设置页面配置
 st.set_page_config(
     page_title="情感分析工具",
@@ -23,6 +65,28 @@ with st.sidebar:
     api_key = st.text_input("阿里云API Key", type="password", value=os.getenv("DASHSCOPE_API_KEY", ""))
     model = st.selectbox("选择模型", ["qwen-turbo", "qwen-plus", "qwen-max"], index=0)
     
+    cache_stats = get_default_cache().stats()
+    st.caption(f"响应缓存：命中 {cache_stats['hits']} 次 / 未命中 {cache_stats['misses']} 次")
+    
+    st.markdown("---")
+    st.markdown("### 分级处理")
+    use_local = st.checkbox("启用本地词典分类", value=True, help="先用本地情感词典分类，置信度不足时才调用大模型")
+    local_threshold = st.slider(
+        "本地分类置信度阈值", 0, 100, 80,
+        disabled=not use_local,
+        help="阈值越低，本地直接返回的比例越高、成本越低，但准确率可能下降"
+    )
+    
+    if "tier_counts" not in st.session_state:
+        st.session_state.tier_counts = {"local": 0, "llm": 0}
+    tier_counts = st.session_state.tier_counts
+    tier_total = tier_counts["local"] + tier_counts["llm"]
+    if tier_total:
+        st.caption(
+            f"本地 {tier_counts['local']} 条 / 大模型 {tier_counts['llm']} 条，"
+            f"升级率 {tier_counts['llm'] / tier_total:.0%}"
+        )
+    
     st.markdown("---")
     st.markdown("### 使用说明")
     st.markdown("1. 输入您的阿里云API Key")
@@ -31,83 +95,166 @@ with st.sidebar:
     st.markdown("4. 点击分析按钮获取结果")
 
 # 主界面
-col1, col2 = st.columns([1, 1])
-
-with col1:
-    st.subheader("输入文本")
-    text_input = st.text_area(
-        "请输入要分析的文本",
-        height=200,
-        placeholder="例如：这个产品真的很棒，我非常喜欢！"
-    )
+tab1, tab2 = st.tabs(["📝 单条分析", "📁 批量分析"])
+
+with tab1:
+    col1, col2 = st.columns([1, 1])
+
+    with col1:
+        st.subheader("输入文本")
+        text_input = st.text_area(
+            "请输入要分析的文本",
+            height=200,
+            placeholder="例如：这个产品真的很棒，我非常喜欢！"
+        )
     
-    if st.button("🔍 开始分析", type="primary"):
-        if not api_key:
-            st.error("请输入阿里云API Key")
-        elif not text_input.strip():
-            st.error("请输入要分析的文本")
-        else:
-            with st.spinner("正在分析中..."):
-                try:
-                    # 设置API key
-                    dashscope.api_key = api_key
-                    
-                    # 构建prompt
-                    prompt = f"""
-                    请分析以下文本的情感倾向，并给出详细的分析结果。
-                    
-                    文本：{text_input}
-                    
-                    请按以下格式输出：
-                    1. 情感倾向：[正面/负面/中性]
-                    2. 置信度：[0-100%]
-                    3. 关键词：[提取的关键情感词]
-                    4. 详细分析：[详细的情感分析说明]
-                    """
-                    
-                    # 调用API
-                    response = dashscope.Generation.call(
-                        model=model,
-                        prompt=prompt,
-                        result_format='message'
-                    )
-                    
-                    if response.status_code == 200:
-                        result = response.output.choices[0].message.content
+        if st.button("🔍 开始分析", type="primary"):
+            if not text_input.strip():
+                st.error("请输入要分析的文本")
+            else:
+                with st.spinner("正在分析中..."):
+                    try:
+                        result, tier = None, None
                         
-                        # 保存结果
-                        st.session_state.last_result = result
+                        # 第一级：本地词典分类，置信度足够时直接返回
+                        local = classify(text_input) if use_local else None
+                        if local and local["confidence"] >= local_threshold:
+                            result, tier = format_result(local), "local"
+                        elif not api_key:
+                            st.error("请输入阿里云API Key")
+                        else:
+                            # 第二级：调用大模型
+                            client = get_llm_client(api_key)
+                            
+                            # 构建prompt
+                            prompt = build_prompt(text_input)
+                            
+                            # 调用API
+                            response = client.generate(
+                                model=model,
+                                prompt=prompt,
+                                result_format='message'
+                            )
+                            
+                            if response.status_code == 200:
+                                result, tier = response.output.choices[0].message.content, "llm"
+                            else:
+                                st.error(f"API调用失败：{response.message}")
                         
-                        # 添加到历史记录
-                        import datetime
-                        st.session_state.analysis_history.append({
-                            'text': text_input,
-                            'result': result,
-                            'timestamp': datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                        })
+                        if result is not None:
+                            # 保存结果
+                            st.session_state.last_result = result
+                            st.session_state.last_tier = tier
+                            st.session_state.tier_counts[tier] += 1
+                            
+                            # 添加到历史记录
+                            get_history_store().append({
+                                'text': text_input,
+                                'result': result,
+                                'tier': tier,
+                                'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                            })
+                            
+                            st.success("分析完成！")
                         
-                        st.success("分析完成！")
-                    else:
-                        st.error(f"API调用失败：{response.message}")
-                        
-                except Exception as e:
-                    st.error(f"分析失败：{str(e)}")
+                    except Exception as e:
+                        st.error(f"分析失败：{str(e)}")
 
-with col2:
-    st.subheader("分析结果")
-    if 'last_result' in st.session_state:
-        st.markdown(st.session_state.last_result)
-    else:
-        st.info("请在左侧输入文本并点击分析按钮")
+    with col2:
+        st.subheader("分析结果")
+        if 'last_result' in st.session_state:
+            st.markdown(st.session_state.last_result)
+            st.caption(f"结果来源：{TIER_LABELS[st.session_state.last_tier]}")
+        else:
+            st.info("请在左侧输入文本并点击分析按钮")
 
-# 历史记录
-if 'analysis_history' not in st.session_state:
-    st.session_state.analysis_history = []
+with tab2:
+    st.subheader("批量分析")
+    batch_file = st.file_uploader(
+        "上传包含待分析文本的文件",
+        type=['csv', 'jsonl'],
+        help="支持CSV和JSONL（每行一个JSON对象）格式"
+    )
+
+    if batch_file is not None:
+        try:
+            batch_df = load_table(batch_file)
+            st.success(f"已加载 {len(batch_df)} 行数据")
+            st.dataframe(batch_df.head(5), use_container_width=True)
+
+            text_column = st.selectbox("选择文本所在列", list(batch_df.columns))
+            max_workers = st.slider("最大并发数", 1, 32, 4, help="同时进行的API调用数量，过高可能触发限流")
+            pack_size = st.slider(
+                "每次请求打包条数", 1, 50, 10,
+                help="把多条短文本放进同一个请求以减少请求次数；1表示逐条分析，超过200字的文本始终单独分析"
+            )
+
+            if st.button("🚀 开始批量分析", type="primary"):
+                if not api_key:
+                    st.error("请输入阿里云API Key")
+                else:
+                    texts = batch_df[text_column].tolist()
+                    # 每次任务使用唯一的临时文件，避免并发会话互相覆盖
+                    fd, output_path = tempfile.mkstemp(
+                        prefix=f"sentiment_batch_{datetime.now().strftime('%Y%m%d_%H%M%S')}_", suffix=".csv"
+                    )
+                    os.close(fd)
 
-if st.button("📊 查看历史记录"):
-    if st.session_state.analysis_history:
-        st.subheader("历史分析记录")
-        for i, record in enumerate(st.session_state.analysis_history[-5:], 1):
+                    progress_bar = st.progress(0.0)
+                    metric_cols = st.columns(4)
+                    done_metric = metric_cols[0].empty()
+                    failed_metric = metric_cols[1].empty()
+                    throughput_metric = metric_cols[2].empty()
+                    eta_metric = metric_cols[3].empty()
+
+                    def update_progress(stats):
+                        progress_bar.progress(stats["done"] / max(stats["total"], 1))
+                        done_metric.metric("已完成", f"{stats['done']}/{stats['total']}")
+                        failed_metric.metric("失败", stats["failed"])
+                        throughput_metric.metric("吞吐量", f"{stats['throughput']:.2f} 条/秒")
+                        remaining = stats["total"] - stats["done"]
+                        eta = remaining / stats["throughput"] if stats["throughput"] > 0 else 0
+                        eta_metric.metric("预计剩余", f"{eta:.0f} 秒")
+
+                    stats = run_batch(
+                        texts, get_llm_client(api_key), model, output_path,
+                        max_workers, update_progress, pack_size,
+                        local_threshold if use_local else None
+                    )
+                    st.session_state.batch_output_path = output_path
+                    st.session_state.tier_counts["local"] += stats["local"]
+                    st.session_state.tier_counts["llm"] += stats["escalated"]
+                    st.success(
+                        f"批量分析完成！共 {stats['done']} 条，失败 {stats['failed']} 条，"
+                        f"请求 {stats['requests']} 次，耗时 {stats['elapsed']:.1f} 秒"
+                    )
+                    st.info(
+                        f"本地词典判定 {stats['local']} 条，升级到大模型 {stats['escalated']} 条"
+                        f"（升级率 {stats['escalated'] / max(stats['total'], 1):.0%}）"
+                    )
+
+        except Exception as e:
+            st.error(f"批量分析失败：{str(e)}")
+
+    if 'batch_output_path' in st.session_state and os.path.exists(st.session_state.batch_output_path):
+        with open(st.session_state.batch_output_path, "rb") as f:
+            st.download_button(
+                label="📥 下载批量分析结果",
+                data=f,
+                file_name=os.path.basename(st.session_state.batch_output_path),
+                mime="text/csv"
+            )
+
+# 历史记录
+if st.checkbox("📊 查看历史记录"):
+    history_store = get_history_store()
+    total = history_store.count()
+    if total:
+        st.subheader(f"历史分析记录（共 {total} 条）")
+        page_count = (total + HISTORY_PAGE_SIZE - 1) // HISTORY_PAGE_SIZE
+        page = st.number_input("页码", min_value=1, max_value=page_count, value=1, step=1)
+        st.caption(f"第 {page}/{page_count} 页，按时间倒序排列")
+        for i, record in history_store.page(page - 1, HISTORY_PAGE_SIZE):
             with st.expander(f"记录 {i} - {record['timestamp']}"):
                 st.write(f"**文本：** {record['text'][:100]}...")
                 st.write(f"**结果：** {record['result']}")
@@ -117,4 +264,4 @@ if st.button("📊 查看历史记录"):
 # 页脚
 st.markdown("---")
 st.markdown("**技术栈：** Streamlit + 阿里云百炼")
-st.markdown("**功能：** 文本情感分析、关键词提取、置信度评估") 
\ No newline at end of file
+st.markdown("**功能：** 文本情感分析、关键词提取、置信度评估、批量分析") 
\ No newline at end of file
@@ -0,0 +1,323 @@
+"""
+情感分析批量处理
+将CSV/JSONL中的文本分发到有界线程池并发调用大模型，结果边完成边写入输出文件
+"""
+
+import csv
+import json
+import re
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import pandas as pd
+
+from lexicon_classifier import classify, format_result
+
+SENTIMENT_PROMPT = """
+请分析以下文本的情感倾向，并给出详细的分析结果。
+
+文本：{text}
+
+请按以下格式输出：
+1. 情感倾向：[正面/负面/中性]
+2. 置信度：[0-100%]
+3. 关键词：[提取的关键情感词]
+4. 详细分析：[详细的情感分析说明]
+"""
+
+PACKED_PROMPT = """
+请分别分析以下{count}条文本的情感倾向。
+
+{items}
+
+请只输出一个JSON数组，不要输出其他内容。数组按编号顺序包含{count}个元素，每个元素格式为：
+{{"id": 编号, "sentiment": "正面/负面/中性", "confidence": 0-100的整数, "keywords": ["关键情感词"]}}
+"""
+
+# 超过该长度的文本不参与打包，单独分析
+PACK_MAX_CHARS = 200
+
+# 输出文件的列
+OUTPUT_FIELDS = ["index", "text", "sentiment", "confidence", "keywords", "result", "tier", "error"]
+
+
+def build_prompt(text):
+    """构建单条文本的情感分析prompt"""
+    return SENTIMENT_PROMPT.format(text=text)
+
+
+def parse_result(result):
+    """从模型回复中提取情感倾向、置信度和关键词"""
+    parsed = {"sentiment": "", "confidence": "", "keywords": ""}
+
+    sentiment = re.search(r"情感倾向[：:]\s*\[?\s*(正面|负面|中性)", result)
+    if sentiment:
+        parsed["sentiment"] = sentiment.group(1)
+
+    confidence = re.search(r"置信度[：:]\s*\[?\s*(\d+(?:\.\d+)?)\s*%?", result)
+    if confidence:
+        parsed["confidence"] = confidence.group(1)
+
+    keywords = re.search(r"关键词[：:]\s*\[?([^\]\n]*)\]?", result)
+    if keywords:
+        parsed["keywords"] = keywords.group(1).strip()
+
+    return parsed
+
+
+def analyze_text(text, client, model):
+    """分析单条文本，返回包含原始回复和结构化字段的字典"""
+    response = client.generate(
+        model=model,
+        prompt=build_prompt(text),
+        result_format='message'
+    )
+    if response.status_code != 200:
+        raise RuntimeError(f"API调用失败：{response.message}")
+
+    result = response.output.choices[0].message.content
+    return {"result": result, **parse_result(result)}
+
+
+def build_packed_prompt(texts):
+    """把多条短文本打包进一个prompt，编号从1开始"""
+    items = "\n".join(f"[{i}] {text}" for i, text in enumerate(texts, 1))
+    return PACKED_PROMPT.format(count=len(texts), items=items)
+
+
+def parse_packed_result(content, count):
+    """
+    把模型返回的JSON数组拆分回每条文本的结果
+
+    Returns:
+        长度为count的列表，解析失败的位置为None
+    """
+    results = [None] * count
+
+    start, end = content.find("["), content.rfind("]")
+    if start == -1 or end <= start:
+        return results
+    try:
+        items = json.loads(content[start:end + 1])
+    except json.JSONDecodeError:
+        return results
+    if not isinstance(items, list):
+        return results
+
+    for position, item in enumerate(items):
+        if not isinstance(item, dict) or item.get("sentiment") not in ("正面", "负面", "中性"):
+            continue
+        # 优先按id对齐，缺少id时按位置对齐
+        index = item.get("id", position + 1)
+        if not isinstance(index, int) or not 1 <= index <= count:
+            continue
+
+        keywords = item.get("keywords", [])
+        if isinstance(keywords, list):
+            keywords = ", ".join(str(k) for k in keywords)
+        results[index - 1] = {
+            "sentiment": item["sentiment"],
+            "confidence": str(item.get("confidence", "")),
+            "keywords": keywords,
+            "result": json.dumps(item, ensure_ascii=False)
+        }
+
+    return results
+
+
+def analyze_packed(texts, client, model, max_retries=2):
+    """
+    一次请求分析多条文本，只把解析失败的条目重新打包发送
+
+    第一次请求失败时抛出异常；重试请求失败时保留此前已解析的结果，只把仍未解析的条目记为失败
+
+    Returns:
+        (与texts对齐的 (结果, 错误信息) 列表, 实际发出的请求数)
+    """
+    results = [None] * len(texts)
+    pending = list(range(len(texts)))
+    error = "结果解析失败"
+    calls = 0
+
+    for attempt in range(max_retries + 1):
+        if not pending:
+            break
+        calls += 1
+        try:
+            response = client.generate(
+                model=model,
+                prompt=build_packed_prompt([texts[i] for i in pending]),
+                use_cache=attempt == 0,
+                result_format='message'
+            )
+            if response.status_code != 200:
+                raise RuntimeError(f"API调用失败：{response.message}")
+        except Exception as e:
+            if attempt == 0:
+                raise
+            error = f"重试失败：{e}"
+            break
+
+        parsed = parse_packed_result(response.output.choices[0].message.content, len(pending))
+        for index, record in zip(pending, parsed):
+            results[index] = record
+        pending = [i for i in pending if results[i] is None]
+
+    return [(record, "" if record else error) for record in results], calls
+
+
+def load_table(uploaded_file):
+    """读取上传的CSV/JSONL文件"""
+    if uploaded_file.name.endswith('.jsonl'):
+        return pd.read_json(uploaded_file, lines=True)
+    return pd.read_csv(uploaded_file)
+
+
+def iter_batch_results(items, worker, max_workers=4):
+    """
+    有界并发地对每个任务执行worker，按完成顺序产出 (序号, 结果, 错误信息)
+
+    同时在途的任务不超过 max_workers * 2 个，避免一次性为数万行创建任务。
+    """
+    max_pending = max_workers * 2
+    items = iter(enumerate(items))
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = {}
+
+        def fill():
+            while len(pending) < max_pending:
+                try:
+                    index, item = next(items)
+                except StopIteration:
+                    return
+                pending[executor.submit(worker, item)] = index
+
+        fill()
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                index = pending.pop(future)
+                try:
+                    yield index, future.result(), ""
+                except Exception as e:
+                    yield index, None, str(e)
+            fill()
+
+
+def make_packs(texts, indices, pack_size):
+    """
+    按pack_size把文本序号分组，空文本和长文本各自单独成组
+
+    Returns:
+        序号列表的列表
+    """
+    packs, current = [], []
+    for index in indices:
+        text = texts[index]
+        if pack_size > 1 and isinstance(text, str) and text.strip() and len(text) <= PACK_MAX_CHARS:
+            current.append(index)
+            if len(current) == pack_size:
+                packs.append(current)
+                current = []
+        else:
+            packs.append([index])
+    if current:
+        packs.append(current)
+    return packs
+
+
+def classify_locally(texts, threshold):
+    """
+    用本地词典对所有文本做第一级分类
+
+    Returns:
+        (本地已判定的行列表, 需要升级到大模型的序号列表)
+    """
+    rows, escalated = [], []
+    for index, text in enumerate(texts):
+        if isinstance(text, str) and text.strip():
+            local = classify(text)
+            if local["confidence"] >= threshold:
+                rows.append({
+                    "index": index, "text": text, "sentiment": local["sentiment"],
+                    "confidence": str(local["confidence"]), "keywords": local["keywords"],
+                    "result": format_result(local), "tier": "local", "error": ""
+                })
+                continue
+        escalated.append(index)
+    return rows, escalated
+
+
+def run_batch(texts, client, model, output_path, max_workers=4, on_progress=None, pack_size=1,
+              local_threshold=None):
+    """
+    批量分析文本，每完成一条立即追加写入CSV输出文件
+
+    Args:
+        texts: 待分析的文本列表
+        client: LLMClient 实例
+        model: 模型名称
+        output_path: 输出CSV路径
+        max_workers: 最大并发数
+        on_progress: 进度回调，在调用线程中执行，参数为统计信息字典
+        pack_size: 每次请求打包的短文本条数，1表示不打包
+        local_threshold: 本地词典分类的置信度阈值（0-100），达到阈值的文本不再调用大模型；None表示不启用
+
+    Returns:
+        最终的统计信息字典，requests 为实际发出的请求数（含重试）
+    """
+    def worker(pack):
+        if len(pack) > 1:
+            return analyze_packed([texts[i] for i in pack], client, model)
+        text = texts[pack[0]]
+        if not isinstance(text, str) or not text.strip():
+            return [(None, "空文本")], 0
+        return [(analyze_text(text, client, model), "")], 1
+
+    start = time.time()
+    if local_threshold is None:
+        local_rows, escalated = [], list(range(len(texts)))
+    else:
+        local_rows, escalated = classify_locally(texts, local_threshold)
+
+    packs = make_packs(texts, escalated, pack_size)
+    stats = {
+        "total": len(texts), "done": len(local_rows), "failed": 0, "requests": 0,
+        "local": len(local_rows), "escalated": len(escalated), "elapsed": 0.0, "throughput": 0.0
+    }
+
+    def report():
+        stats["elapsed"] = time.time() - start
+        stats["throughput"] = stats["done"] / stats["elapsed"] if stats["elapsed"] > 0 else 0.0
+        if on_progress:
+            on_progress(stats)
+
+    with open(output_path, "w", newline="", encoding="utf-8-sig") as f:
+        writer = csv.DictWriter(f, fieldnames=OUTPUT_FIELDS)
+        writer.writeheader()
+        writer.writerows(local_rows)
+        f.flush()
+        report()
+
+        for pack_index, pack_results, error in iter_batch_results(packs, worker, max_workers):
+            pack = packs[pack_index]
+            if pack_results is None:
+                # 第一次请求即失败，整包记为失败
+                pack_results, calls = [(None, error)] * len(pack), 1
+            else:
+                pack_results, calls = pack_results
+            stats["requests"] += calls
+
+            for index, (record, item_error) in zip(pack, pack_results):
+                row = {"index": index, "text": texts[index], "tier": "llm", "error": item_error}
+                if record:
+                    row.update(record)
+                writer.writerow(row)
+                stats["done"] += 1
+                if item_error:
+                    stats["failed"] += 1
+            f.flush()
+            report()
+
+    return stats
@@ -0,0 +1,165 @@
+"""
+分析历史存储
+内存中只保留固定条数的环形缓冲，完整历史追加写入磁盘日志（JSONL + 定长偏移索引），
+分页查看时按需读取，内存占用与历史总量无关
+"""
+
+import glob
+import json
+import os
+import struct
+import threading
+import time
+from collections import deque
+
+# 每条索引记录为8字节的日志偏移量
+OFFSET_FORMAT = "<Q"
+OFFSET_SIZE = struct.calcsize(OFFSET_FORMAT)
+
+# 默认历史目录，可通过环境变量 SENTIMENT_HISTORY_DIR 覆盖
+DEFAULT_HISTORY_DIR = os.getenv(
+    "SENTIMENT_HISTORY_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "history")
+)
+
+
+# 每个会话一个日志文件，超过保留时间未写入的会话日志会被清理；可通过环境变量 SENTIMENT_HISTORY_TTL（秒）覆盖
+SESSION_LOG_TTL = int(os.getenv("SENTIMENT_HISTORY_TTL", str(24 * 3600)))
+
+# 最多保留的会话日志数，超出时删除最久未写入的
+MAX_SESSION_LOGS = 1000
+
+SESSION_LOG_PREFIX = "analysis_history_"
+
+
+def session_log_path(session_id, directory=None):
+    """会话日志文件路径"""
+    return os.path.join(directory or DEFAULT_HISTORY_DIR, f"{SESSION_LOG_PREFIX}{session_id}.jsonl")
+
+
+def sweep_session_logs(directory=None, ttl=SESSION_LOG_TTL, max_logs=MAX_SESSION_LOGS, keep=()):
+    """
+    删除过期的会话日志（连同索引文件）
+
+    Args:
+        directory: 日志目录
+        ttl: 超过该时长（秒）未写入的日志视为过期
+        max_logs: 最多保留的日志数，超出时按最后写入时间删除最旧的
+        keep: 不删除的日志路径（如当前会话正在使用的日志）
+
+    Returns:
+        删除的日志数
+    """
+    logs = []
+    for path in glob.glob(os.path.join(directory or DEFAULT_HISTORY_DIR, f"{SESSION_LOG_PREFIX}*.jsonl")):
+        try:
+            modified = max(os.path.getmtime(path), os.path.getmtime(path + ".idx"))
+        except OSError:
+            modified = 0
+        logs.append((modified, path))
+    logs.sort(reverse=True)
+
+    now = time.time()
+    keep = set(keep)
+    removed = 0
+    for position, (modified, path) in enumerate(logs):
+        if path in keep or (position < max_logs and now - modified <= ttl):
+            continue
+        for item in (path, path + ".idx"):
+            try:
+                os.remove(item)
+            except FileNotFoundError:
+                pass
+        removed += 1
+    return removed
+
+
+class HistoryStore:
+    """环形缓冲 + 追加写日志的历史记录（线程安全）"""
+
+    def __init__(self, log_path=None, buffer_size=50):
+        """
+        Args:
+            log_path: 日志文件路径，索引文件为同名加 .idx 后缀
+            buffer_size: 内存环形缓冲保留的最近记录条数
+        """
+        self.log_path = log_path or os.path.join(DEFAULT_HISTORY_DIR, "analysis_history.jsonl")
+        self.index_path = self.log_path + ".idx"
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.log_path)), exist_ok=True)
+        for path in (self.log_path, self.index_path):
+            if not os.path.exists(path):
+                open(path, "ab").close()
+
+        # 启动时只加载最近 buffer_size 条到缓冲
+        self.recent = deque(maxlen=buffer_size)
+        self._reload_recent()
+
+    def append(self, record):
+        """追加一条记录"""
+        line = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+        with self._lock:
+            # 其他进程写入过日志时，缓冲已不是最新的若干条，需要重新加载
+            stale = self.count() != self._synced_count
+            with open(self.log_path, "ab") as log:
+                log.seek(0, os.SEEK_END)
+                offset = log.tell()
+                log.write(line)
+            with open(self.index_path, "ab") as index:
+                index.write(struct.pack(OFFSET_FORMAT, offset))
+            if stale:
+                self._reload_recent()
+            else:
+                self.recent.append(record)
+                self._synced_count += 1
+
+    def count(self):
+        """历史记录总条数"""
+        return os.path.getsize(self.index_path) // OFFSET_SIZE
+
+    def page(self, page, page_size=10):
+        """
+        按时间倒序分页读取
+
+        Args:
+            page: 页码，从0开始
+            page_size: 每页条数
+
+        Returns:
+            (序号, 记录) 列表，序号从1开始按写入顺序编号
+        """
+        with self._lock:
+            count = self.count()
+            end = max(0, count - page * page_size)
+            start = max(0, end - page_size)
+
+            # 最近的记录直接从环形缓冲读取，避免磁盘IO
+            buffered_start = count - len(self.recent)
+            if count == self._synced_count and start >= buffered_start:
+                records = list(self.recent)[start - buffered_start:end - buffered_start]
+            else:
+                records = self._read_range(start, end)
+
+        return list(reversed(list(enumerate(records, start + 1))))
+
+    def _reload_recent(self):
+        count = self.count()
+        self.recent.clear()
+        self.recent.extend(self._read_range(max(0, count - self.recent.maxlen), count))
+        self._synced_count = count
+
+    def _read_range(self, start, end):
+        if end <= start:
+            return []
+        with open(self.index_path, "rb") as index:
+            index.seek(start * OFFSET_SIZE)
+            data = index.read((end - start) * OFFSET_SIZE)
+        offsets = [item[0] for item in struct.iter_unpack(OFFSET_FORMAT, data)]
+
+        records = []
+        with open(self.log_path, "rb") as log:
+            for offset in offsets:
+                log.seek(offset)
+                records.append(json.loads(log.readline()))
+        return records
@@ -0,0 +1,136 @@
+"""
+本地情感词典分类器
+基于jieba分词 + 情感词典 + 否定词/程度副词规则，微秒级给出结果；
+置信度不足的文本再交给大模型（分级处理）
+"""
+
+import re
+
+import jieba
+
+POSITIVE_WORDS = {
+    "好", "棒", "赞", "爱", "喜欢", "满意", "不错", "优秀", "完美", "惊喜", "推荐", "值得", "开心",
+    "高兴", "快乐", "舒服", "舒适", "漂亮", "好看", "好吃", "好用", "实惠", "划算", "超值", "给力",
+    "精致", "耐用", "清晰", "流畅", "稳定", "方便", "快捷", "及时", "热情", "耐心", "周到", "专业",
+    "贴心", "细心", "靠谱", "放心", "感谢", "谢谢", "点赞", "好评", "五星", "物美价廉", "性价比高",
+    "质量好", "正品", "新鲜", "美味", "可口", "干净", "整洁", "温馨", "优惠", "顺利", "成功", "喜爱",
+    "欣赏", "感动", "幸福", "愉快", "满分", "回购", "必买", "神器", "高效", "准时", "细腻", "柔软",
+    "结实", "大气", "时尚", "可爱", "合身", "省心", "超赞", "厉害", "惊艳", "完好"
+}
+
+NEGATIVE_WORDS = {
+    "差", "烂", "坏", "垃圾", "失望", "讨厌", "糟糕", "难用", "难吃", "难看", "后悔", "生气", "愤怒",
+    "投诉", "退货", "退款", "骗子", "欺骗", "假货", "劣质", "破损", "损坏", "故障", "卡顿", "闪退",
+    "慢", "贵", "坑", "忽悠", "敷衍", "冷漠", "态度差", "差评", "恶心", "难受", "不满", "抱怨",
+    "麻烦", "问题", "缺陷", "瑕疵", "异味", "发霉", "过期", "漏发", "错发", "延迟", "拖延", "粗糙",
+    "掉色", "起球", "开线", "变形", "松动", "噪音", "发热", "耗电", "断网", "无语", "崩溃", "伤心",
+    "难过", "郁闷", "烦", "气愤", "心疼", "上当", "吐槽", "一星", "不值", "鸡肋", "无法", "失败"
+}
+
+# 否定词：翻转其后情感词的极性
+NEGATIONS = {"不", "没", "没有", "无", "非", "别", "未", "不是", "并不", "毫无", "从不", "从未", "不太", "不怎么"}
+
+# 程度副词及其权重
+DEGREE_WORDS = {
+    "极其": 2.0, "极": 2.0, "超级": 2.0, "最": 2.0, "非常": 1.8, "特别": 1.8, "十分": 1.8, "太": 1.8,
+    "相当": 1.5, "很": 1.5, "挺": 1.3, "真": 1.3, "好": 1.3, "比较": 1.1, "较": 1.1, "还": 0.9,
+    "有点": 0.7, "有些": 0.7, "稍微": 0.6, "略": 0.6
+}
+
+# 遇到标点或转折词时清空否定/程度修饰
+CLAUSE_BREAK = re.compile(r"^[，。！？；,.!?;~\s]+$|^(但|但是|可是|不过|然而)$")
+
+# 情感词之前最多回看的词数
+MODIFIER_WINDOW = 3
+
+SENTIMENT_WORDS = POSITIVE_WORDS | NEGATIVE_WORDS
+MODIFIERS = NEGATIONS | set(DEGREE_WORDS)
+# 按长度倒序，优先匹配较长的修饰词前缀
+MODIFIER_PREFIXES = sorted(MODIFIERS, key=len, reverse=True)
+
+for _word in SENTIMENT_WORDS | MODIFIERS:
+    jieba.add_word(_word)
+
+
+def tokenize(text):
+    """分词，并把“很棒”“太慢”“不好”这类词典外的合成词拆成 修饰词 + 情感词"""
+    tokens = []
+    for token in jieba.lcut(text):
+        if token not in SENTIMENT_WORDS and token not in MODIFIERS:
+            for prefix in MODIFIER_PREFIXES:
+                if token.startswith(prefix) and token[len(prefix):] in SENTIMENT_WORDS:
+                    tokens.extend([prefix, token[len(prefix):]])
+                    break
+            else:
+                tokens.append(token)
+        else:
+            tokens.append(token)
+    return tokens
+
+
+def classify(text):
+    """
+    本地词典分类
+
+    Returns:
+        包含 sentiment、confidence（0-100）、keywords、score 的字典
+    """
+    positive, negative = 0.0, 0.0
+    keywords = []
+    modifiers = []
+
+    tokens = tokenize(text)
+    for i, token in enumerate(tokens):
+        if CLAUSE_BREAK.match(token):
+            modifiers = []
+            continue
+
+        polarity = 1 if token in POSITIVE_WORDS else -1 if token in NEGATIVE_WORDS else 0
+        # “好”等词既是情感词也是程度副词，后面紧跟情感词时按程度副词处理（如“好喜欢”）
+        next_token = tokens[i + 1] if i + 1 < len(tokens) else ""
+        if polarity and token in DEGREE_WORDS and next_token in SENTIMENT_WORDS:
+            polarity = 0
+
+        if polarity:
+            weight = 1.0
+            for modifier in modifiers[-MODIFIER_WINDOW:]:
+                if modifier in NEGATIONS:
+                    weight = -weight * 0.8
+                elif modifier in DEGREE_WORDS:
+                    weight *= DEGREE_WORDS[modifier]
+            score = polarity * weight
+            if score > 0:
+                positive += score
+            else:
+                negative -= score
+            keywords.append(token)
+            modifiers = []
+        elif token in MODIFIERS:
+            modifiers.append(token)
+
+    total = positive + negative
+    if total == 0:
+        return {"sentiment": "中性", "confidence": 0, "keywords": "", "score": 0.0}
+
+    # 极性越一致、情感证据越多，置信度越高；两个中等强度的情感词即可达到满分
+    polarity = (positive - negative) / total
+    evidence = min(1.0, total / 2.5)
+    confidence = round(abs(polarity) * evidence * 100)
+    sentiment = "正面" if polarity > 0 else "负面" if polarity < 0 else "中性"
+
+    return {
+        "sentiment": sentiment,
+        "confidence": confidence,
+        "keywords": ", ".join(dict.fromkeys(keywords)),
+        "score": round(positive - negative, 2)
+    }
+
+
+def format_result(result):
+    """把本地分类结果格式化为与大模型一致的输出格式"""
+    return (
+        f"1. 情感倾向：{result['sentiment']}\n"
+        f"2. 置信度：{result['confidence']}%\n"
+        f"3. 关键词：{result['keywords']}\n"
+        f"4. 详细分析：由本地情感词典判定（情感得分 {result['score']}），未调用大模型"
+    )
@@ -0,0 +1,160 @@
+"""
+简单天气问题的模板回复
+当前温度、湿度、风力、明天是否下雨等问题只是复述已有的天气数据，
+直接按模板生成回复，无需再调用大模型；开放性问题和多城市对比仍交给大模型，其prompt也在这里生成
+"""
+
+from datetime import datetime, timedelta
+
+from weather_service import TIME_OFFSETS, city_today
+
+WIND_DIRECTIONS = ["北", "东北", "东", "东南", "南", "西南", "西", "西北"]
+
+
+def wind_direction(deg):
+    """风向角度转换为八方位名称"""
+    if deg is None:
+        return None
+    return WIND_DIRECTIONS[int((deg % 360 + 22.5) // 45) % 8] + "风"
+
+
+def rain_advice(pop):
+    """按降水概率给出带伞建议"""
+    if pop >= 0.5:
+        return "降水可能性较大，出门记得带伞"
+    if pop >= 0.2:
+        return "有可能降水，建议备一把伞"
+    return "降水可能性较小，一般不需要带伞"
+
+
+def day_row(data, offset):
+    """取城市当地第 offset 天的按天汇总预报，没有时返回None"""
+    target = (city_today(data["forecast"]) + timedelta(days=offset)).isoformat()
+    rows = data["daily"][data["daily"]["date"] == target]
+    return None if rows.empty else rows.iloc[0]
+
+
+def _current_answer(name, query_type, current, today):
+    main = current["main"]
+    wind = current["wind"]
+    direction = wind_direction(wind.get("deg"))
+    if query_type == "温度":
+        text = f"{name}现在气温 {main['temp']:.1f}°C，体感温度 {main['feels_like']:.1f}°C"
+        if today is not None:
+            text += f"，今天气温 {today['temp_min']:.1f}~{today['temp_max']:.1f}°C"
+        return text + "。"
+    if query_type == "湿度":
+        return f"{name}现在相对湿度 {main['humidity']}%，天气{current['weather'][0]['description']}。"
+    if query_type == "风力":
+        return f"{name}现在{direction + '，' if direction else ''}风速 {wind['speed']} m/s。"
+    if query_type == "降水":
+        if today is None:
+            return None
+        return f"{name}今天{today['description']}，降水概率最高 {today['pop_max'] * 100:.0f}%，{rain_advice(today['pop_max'])}。"
+
+    text = (
+        f"{name}现在{current['weather'][0]['description']}，气温 {main['temp']:.1f}°C"
+        f"（体感 {main['feels_like']:.1f}°C），湿度 {main['humidity']}%，"
+        f"{direction + ' ' if direction else '风速 '}{wind['speed']} m/s"
+    )
+    if today is not None:
+        text += f"。今天气温 {today['temp_min']:.1f}~{today['temp_max']:.1f}°C，降水概率最高 {today['pop_max'] * 100:.0f}%"
+    return text + "。"
+
+
+def _day_answer(name, label, query_type, day):
+    if query_type == "温度":
+        return f"{name}{label}气温 {day['temp_min']:.1f}~{day['temp_max']:.1f}°C，{day['description']}。"
+    if query_type == "湿度":
+        return f"{name}{label}相对湿度约 {day['humidity']}%，{day['description']}。"
+    if query_type == "风力":
+        return f"{name}{label}风速约 {day['wind_speed']} m/s，{day['description']}。"
+    if query_type == "降水":
+        return f"{name}{label}{day['description']}，降水概率最高 {day['pop_max'] * 100:.0f}%，{rain_advice(day['pop_max'])}。"
+    return (
+        f"{name}{label}{day['description']}，气温 {day['temp_min']:.1f}~{day['temp_max']:.1f}°C，"
+        f"湿度约 {day['humidity']}%，降水概率最高 {day['pop_max'] * 100:.0f}%。"
+    )
+
+
+def render_answer(parsed, data, city_name):
+    """
+    按模板回答简单天气问题
+
+    Args:
+        parsed: 查询解析结果 {"query_type", "time"}
+        data: 天气数据 {"current", "forecast", "daily"}
+        city_name: 回复中使用的城市名称
+
+    Returns:
+        回复文本；问题类型没有对应模板或缺少所需预报时返回None，应改用大模型回复
+    """
+    query_type = parsed.get("query_type", "当前天气")
+    query_time = parsed.get("time", "今天")
+    if query_type not in ("当前天气", "未来天气", "温度", "湿度", "风力", "降水"):
+        return None
+
+    offset = TIME_OFFSETS.get(query_time)
+    if offset == 0:
+        return _current_answer(city_name, query_type, data["current"], day_row(data, 0))
+
+    if offset is not None:
+        day = day_row(data, offset)
+        return None if day is None else _day_answer(city_name, query_time, query_type, day)
+
+    # 未来几天：逐天列出
+    daily = data["daily"].head(5)
+    if daily.empty:
+        return None
+    lines = [f"{city_name}未来几天的天气预报："]
+    for day in daily.to_dict("records"):
+        lines.append(f"- {day['date']}（{day['weekday']}）：" + _day_answer("", "", query_type, day))
+    return "\n".join(lines)
+
+
+def weather_prompt(query, current):
+    """单个城市交给大模型回答时的prompt"""
+    weather_info = f"""
+城市：{current['name']}, {current['sys']['country']}
+温度：{current['main']['temp']}°C
+体感温度：{current['main']['feels_like']}°C
+天气：{current['weather'][0]['description']}
+湿度：{current['main']['humidity']}%
+气压：{current['main']['pressure']} hPa
+风速：{current['wind']['speed']} m/s
+风向：{current['wind'].get('deg', 'N/A')}°
+能见度：{current.get('visibility', 'N/A')} m
+云量：{current['clouds']['all']}%
+更新时间：{datetime.fromtimestamp(current['dt']).strftime('%Y-%m-%d %H:%M:%S')}
+"""
+    return f"""
+你是一个专业的天气助手。以下是真实的天气数据，请基于这些数据回答用户的问题。
+
+用户查询：{query}
+
+当前天气数据（这是真实数据，请直接使用）：
+{weather_info}
+请直接使用上述天气数据回答用户问题。数据中包含：
+- 城市名称
+- 当前温度
+- 天气状况
+- 湿度
+- 风向和风力
+- 发布时间
+
+请基于这些真实数据生成自然友好的回复，不要否认数据的存在。
+"""
+
+
+def comparison_prompt(query, table):
+    """多城市对比交给大模型回答时的prompt，table 为 format_table() 生成的对比表"""
+    return f"""
+你是一个专业的天气助手。以下是多个城市的真实天气数据，请基于这些数据回答用户的比较问题。
+
+用户查询：{query}
+
+各城市天气数据（这是真实数据，请直接使用）：
+{table}
+
+请直接比较上述数据并回答用户问题，给出明确结论，不要否认数据的存在。
+"""
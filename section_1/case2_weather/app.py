@@ -1,14 +1,97 @@
 import streamlit as st
-import dashscope
-import requests
-import json
+import time
 import os
 from dotenv import load_dotenv
 from datetime import datetime
+import sys
+
+# 引入 section_1 公共模块
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.llm_cache import get_default_cache
+from common.llm_client import LLMClient
+from common.metrics import start_metrics_server
+from cache_warmer import DEFAULT_HOT_CITIES, CacheWarmer
+from geocoder import Geocoder
+from answer_templates import comparison_prompt, render_answer, weather_prompt
+from query_parser import PARSE_PROMPT, QueryParser, parse_llm_result
+from weather_service import WeatherService, comparison_row, format_table
 
 # 加载环境变量
 load_dotenv()
 
+# 设置了 METRICS_PORT 时暴露Prometheus格式的调用指标
+start_metrics_server()
+
+
+@st.cache_resource
+def get_llm_client(api_key):
+    """按API Key复用大模型客户端，连接池在所有会话间共享"""
+    return LLMClient(api_key, app="case2_weather")
+
+
+@st.cache_resource
+def get_geocoder():
+    """地理编码缓存在所有会话间共享"""
+    return Geocoder()
+
+
+@st.cache_resource
+def get_query_parser():
+    """本地查询解析器（城市名称前缀树）在所有会话间共享"""
+    return QueryParser(get_geocoder())
+
+
+@st.cache_resource
+def get_weather_service():
+    """天气数据服务（含HTTP连接池）在所有会话间共享"""
+    return WeatherService(get_geocoder())
+
+
+# 示例查询，其中的城市也会被后台预热
+EXAMPLE_QUERIES = [
+    "北京今天天气怎么样？",
+    "上海明天会下雨吗？",
+    "广州现在的温度是多少？",
+    "深圳未来几天的天气如何？"
+]
+
+
+@st.cache_resource
+def get_cache_warmer():
+    """
+    热门城市和示例查询城市的缓存预热任务，所有会话共享一个后台线程
+
+    只使用服务端环境变量 OPENWEATHER_API_KEY 配置的密钥；未配置时不预热，
+    绝不使用用户在侧边栏输入的密钥，避免用一个用户的额度为所有会话刷新缓存
+    """
+    parser = get_query_parser()
+    example_cities = [city for query in EXAMPLE_QUERIES for city in (parser.parse(query) or {}).get("cities", [])]
+    warmer = CacheWarmer(get_weather_service(), DEFAULT_HOT_CITIES + example_cities)
+    server_key = os.getenv("OPENWEATHER_API_KEY", "")
+    if server_key:
+        warmer.start(server_key)
+    return warmer
+
+
+# 一次对比查询最多涉及的城市数
+MAX_COMPARE_CITIES = 5
+
+
+def format_timings(timings):
+    """把各阶段耗时格式化为一行说明"""
+    labels = {
+        "parse_local": "解析查询（本地）",
+        "parse": "解析查询（大模型）",
+        "geocode": "地理编码",
+        "current": "当前天气",
+        "forecast": "天气预报",
+        "fetch": "天气数据（并发）",
+        "fanout": "多城市天气数据（并发）",
+        "answer": "生成回复",
+        "answer_template": "生成回复（模板）"
+    }
+    return " · ".join(f"{labels[name]} {seconds * 1000:.0f}ms" for name, seconds in timings.items() if name in labels)
+
 # 设置页面配置
 st.set_page_config(
     page_title="智能天气查询",
@@ -26,6 +109,34 @@ with st.sidebar:
     dashscope_api_key = st.text_input("阿里云API Key", type="password", value=os.getenv("DASHSCOPE_API_KEY", ""))
     openweather_api_key = st.text_input("OpenWeatherMap API Key", type="password", value=os.getenv("OPENWEATHER_API_KEY", ""))
     model = st.selectbox("选择模型", ["qwen-turbo", "qwen-plus", "qwen-max"], index=0)
+    use_templates = st.checkbox("简单问题使用模板回复", value=True, help="温度、湿度、风力、是否下雨等简单问题直接按模板回复，不调用大模型")
+    
+    cache_stats = get_default_cache().stats()
+    st.caption(f"响应缓存：命中 {cache_stats['hits']} 次 / 未命中 {cache_stats['misses']} 次")
+    weather_cache_stats = get_weather_service().cache.stats()
+    st.caption(
+        f"天气缓存：{weather_cache_stats['items']} 个坐标，新鲜命中 {weather_cache_stats['fresh']} 次 / "
+        f"过期命中 {weather_cache_stats['stale']} 次 / 未命中 {weather_cache_stats['miss']} 次"
+    )
+    geocode_stats = get_geocoder().stats()
+    st.caption(
+        f"地理编码缓存：已收录 {geocode_stats['cities']} 个地名，"
+        f"命中 {geocode_stats['hits']} 次 / 远程查询 {geocode_stats['remote']} 次"
+    )
+    
+    # 服务端配置了OpenWeatherMap API Key时后台预热已启动，这里只显示状态
+    cache_warmer = get_cache_warmer()
+    if cache_warmer.api_key:
+        warm_status = cache_warmer.status()
+        warm_failed = [item for item in warm_status if item["last_error"]]
+        last_run = datetime.fromtimestamp(cache_warmer.last_run).strftime('%H:%M:%S') if cache_warmer.last_run else "进行中"
+        with st.expander(f"🔥 缓存预热：{len(warm_status)} 个城市，上次 {last_run}，失败 {len(warm_failed)} 个"):
+            for item in warm_status:
+                refreshed = datetime.fromtimestamp(item["last_refresh"]).strftime('%H:%M:%S') if item["last_refresh"] else "未刷新"
+                line = f"{item['city']}：{refreshed}"
+                if item["last_error"]:
+                    line += f"（连续失败 {item['failures']} 次：{item['last_error']}）"
+                st.caption(line)
     
     st.markdown("---")
     st.markdown("### 使用说明")
@@ -34,82 +145,6 @@ with st.sidebar:
     st.markdown("3. AI会自动解析并调用OpenWeatherMap天气API")
     st.markdown("4. 获得智能化的天气信息")
 
-# OpenWeatherMap API函数
-def get_weather_data(city, api_key):
-    """获取OpenWeatherMap天气数据"""
-    try:
-        # 首先通过Geocoding API获取城市坐标（支持中文城市名称）
-        geocode_url = "http://api.openweathermap.org/geo/1.0/direct"
-        geocode_params = {
-            "q": city,
-            "limit": 1,
-            "appid": api_key
-        }
-        
-        geocode_response = requests.get(geocode_url, params=geocode_params)
-        if geocode_response.status_code == 200:
-            geocode_data = geocode_response.json()
-            
-            if geocode_data:
-                # 获取城市坐标和名称
-                lat = geocode_data[0]["lat"]
-                lon = geocode_data[0]["lon"]
-                city_name = geocode_data[0]["name"]
-                country = geocode_data[0]["country"]
-                
-                # 使用坐标获取当前天气数据
-                current_url = "https://api.openweathermap.org/data/2.5/weather"
-                current_params = {
-                    "lat": lat,
-                    "lon": lon,
-                    "appid": api_key,
-                    "units": "metric",  # 使用摄氏度
-                    "lang": "zh_cn"     # 中文
-                }
-                
-                current_response = requests.get(current_url, params=current_params)
-                if current_response.status_code == 200:
-                    current_data = current_response.json()
-                    
-                    # 使用坐标获取5天预报数据
-                    forecast_url = "https://api.openweathermap.org/data/2.5/forecast"
-                    forecast_params = {
-                        "lat": lat,
-                        "lon": lon,
-                        "appid": api_key,
-                        "units": "metric",
-                        "lang": "zh_cn"
-                    }
-                    
-                    forecast_response = requests.get(forecast_url, params=forecast_params)
-                    if forecast_response.status_code == 200:
-                        forecast_data = forecast_response.json()
-                        
-                        return {
-                            "success": True,
-                            "data": {
-                                "current": current_data,
-                                "forecast": forecast_data
-                            },
-                            "city_info": {
-                                "name": city_name,
-                                "country": country,
-                                "lat": lat,
-                                "lon": lon
-                            }
-                        }
-                    else:
-                        return {"success": False, "error": "预报API请求失败"}
-                else:
-                    return {"success": False, "error": f"天气API错误：{current_response.status_code}"}
-            else:
-                return {"success": False, "error": f"未找到城市：{city}"}
-        else:
-            return {"success": False, "error": "地理编码API请求失败"}
-            
-    except Exception as e:
-        return {"success": False, "error": f"API调用异常：{str(e)}"}
-
 # 主界面
 col1, col2 = st.columns([1, 1])
 
@@ -123,114 +158,126 @@ with col1:
     )
     
     if st.button("🌤️ 查询天气", type="primary"):
-        if not dashscope_api_key:
-            st.error("请输入阿里云API Key")
-        # 使用模拟数据，不需要检查API密钥
-        elif not query_input.strip():
+        # 本地解析并按模板回复的查询不调用大模型，只在需要大模型时才检查API Key
+        if not query_input.strip():
             st.error("请输入查询需求")
         else:
             with st.spinner("正在查询中..."):
                 try:
-                    # 设置API key
-                    dashscope.api_key = dashscope_api_key
-                    
-                    # 第一步：解析用户查询
-                    parse_prompt = f"""
-                    请解析以下天气查询需求，提取城市名称和查询内容。
-                    
-                    用户查询：{query_input}
+                    # 获取复用的客户端
+                    client = get_llm_client(dashscope_api_key) if dashscope_api_key else None
                     
-                    请按以下JSON格式输出：
-                    {{
-                        "city": "城市名称",
-                        "query_type": "查询类型（当前天气/未来天气/温度/降水等）",
-                        "time": "查询时间（今天/明天/后天等）"
-                    }}
-                    """
+                    # 记录各阶段耗时
+                    timings = {}
                     
-                    parse_response = dashscope.Generation.call(
-                        model=model,
-                        prompt=parse_prompt,
-                        result_format='message'
-                    )
-                    
-                    if parse_response.status_code == 200:
-                        parse_result = parse_response.output.choices[0].message.content
+                    # 第一步：解析用户查询，优先使用本地规则，识别不出城市时才调用大模型
+                    start = time.perf_counter()
+                    parsed_data = get_query_parser().parse(query_input)
+                    parse_error = None
+                    if parsed_data is not None:
+                        timings["parse_local"] = time.perf_counter() - start
+                    elif client is None:
+                        parse_error = "未能在本地识别出城市，需要大模型解析，请输入阿里云API Key"
+                    else:
+                        parse_response = client.generate(
+                            model=model,
+                            prompt=PARSE_PROMPT.format(query=query_input),
+                            result_format='message'
+                        )
+                        timings["parse"] = time.perf_counter() - start
                         
-                        # 尝试解析JSON
-                        try:
-                            parsed_data = json.loads(parse_result)
-                            city = parsed_data.get("city", "深圳")
-                            query_type = parsed_data.get("query_type", "当前天气")
-                            time = parsed_data.get("time", "今天")
-                        except:
-                            # 如果JSON解析失败，使用简单的城市提取
-                            city = "深圳"  # 默认城市
+                        if parse_response.status_code == 200:
+                            parsed_data = parse_llm_result(parse_response.output.choices[0].message.content)
+                            if not parsed_data or not parsed_data.get("city"):
+                                parse_error = "未能从查询中识别出城市，请在查询中写明城市名称"
+                        else:
+                            parse_error = f"解析查询失败：{parse_response.message}"
+                    
+                    if parse_error:
+                        st.error(parse_error)
+                    else:
+                        city = parsed_data["city"]
+                        query_type = parsed_data.get("query_type", "当前天气")
+                        query_time = parsed_data.get("time", "今天")
                         
-                        # 第二步：获取天气数据
-                        weather_result = get_weather_data(city, openweather_api_key)
+                        # 第二步：获取天气数据，涉及多个城市时并发获取
+                        cities = list(dict.fromkeys(parsed_data.get("cities") or [city]))[:MAX_COMPARE_CITIES]
+                        if len(cities) > 1:
+                            start = time.perf_counter()
+                            weather_results = get_weather_service().get_many(cities, openweather_api_key)
+                            timings["fanout"] = time.perf_counter() - start
+                            for name, item in zip(cities, weather_results):
+                                if not item["success"]:
+                                    st.warning(f"{name}：{item['error']}")
+                        else:
+                            weather_results = [get_weather_service().get_weather_data(city, openweather_api_key)]
+                            timings.update(weather_results[0]["timings"])
+
+                        # 地理编码接口解析出的城市收录到本地前缀树，之后的查询无需大模型解析
+                        for name, item in zip(cities, weather_results):
+                            if item["success"]:
+                                get_query_parser().add_city(name)
+
+                        # 同一地点（如“北京”和“Beijing”）只保留一次
+                        succeeded = list({
+                            (item["city_info"]["lat"], item["city_info"]["lon"]): item
+                            for item in weather_results if item["success"]
+                        }.values())
                         
-                        if weather_result["success"]:
+                        if succeeded:
+                            weather_result = succeeded[0]
                             weather_data = weather_result["data"]
                             city_info = weather_result["city_info"]
+                            comparison = None
+                            result = None
                             
-                            # 提取当前天气信息
-                            current_data = weather_data["current"]
-                            weather_info = f"""
-                            城市：{current_data['name']}, {current_data['sys']['country']}
-                            温度：{current_data['main']['temp']}°C
-                            体感温度：{current_data['main']['feels_like']}°C
-                            天气：{current_data['weather'][0]['description']}
-                            湿度：{current_data['main']['humidity']}%
-                            气压：{current_data['main']['pressure']} hPa
-                            风速：{current_data['wind']['speed']} m/s
-                            风向：{current_data['wind'].get('deg', 'N/A')}°
-                            能见度：{current_data.get('visibility', 'N/A')} m
-                            云量：{current_data['clouds']['all']}%
-                            更新时间：{datetime.fromtimestamp(current_data['dt']).strftime('%Y-%m-%d %H:%M:%S')}
-                            """
+                            # 简单问题（单个城市、无其他诉求）直接按模板回复，不调用大模型
+                            if use_templates and len(succeeded) == 1 and parsed_data.get("simple"):
+                                start = time.perf_counter()
+                                result = render_answer(parsed_data, weather_data, city_info["name"])
+                                timings["answer_template"] = time.perf_counter() - start
                             
-                            # 第三步：生成智能回复
-                            response_prompt = f"""
-                            你是一个专业的天气助手。以下是真实的天气数据，请基于这些数据回答用户的问题。
+                            if result is None and client is None:
+                                st.error("该问题需要大模型生成回复，请输入阿里云API Key")
+                            elif result is None:
+                                if len(succeeded) > 1:
+                                    # 多城市对比：压缩为一张表，只调用一次大模型
+                                    comparison = [comparison_row(item, query_time) for item in succeeded]
+                                    response_prompt = comparison_prompt(query_input, format_table(comparison))
+                                else:
+                                    # 第三步：基于当前天气数据生成智能回复
+                                    response_prompt = weather_prompt(query_input, weather_data["current"])
                             
-                            用户查询：{query_input}
+                                start = time.perf_counter()
+                                final_response = client.generate(
+                                    model=model,
+                                    prompt=response_prompt,
+                                    result_format='message'
+                                )
+                                timings["answer"] = time.perf_counter() - start
                             
-                            当前天气数据（这是真实数据，请直接使用）：
-                            {weather_info}
+                                if final_response.status_code == 200:
+                                    result = final_response.output.choices[0].message.content
+                                else:
+                                    st.error(f"生成回复失败：{final_response.message}")
                             
-                            请直接使用上述天气数据回答用户问题。数据中包含：
-                            - 城市名称
-                            - 当前温度
-                            - 天气状况
-                            - 湿度
-                            - 风向和风力
-                            - 发布时间
-                            
-                            请基于这些真实数据生成自然友好的回复，不要否认数据的存在。
-                            """
-                            
-                            final_response = dashscope.Generation.call(
-                                model=model,
-                                prompt=response_prompt,
-                                result_format='message'
-                            )
-                            
-                            if final_response.status_code == 200:
-                                result = final_response.output.choices[0].message.content
-                                
+                            if result is not None:
                                 # 保存结果
                                 st.session_state.last_weather_result = result
-                                st.session_state.last_weather_data = weather_data
+                                # 只保存展示所需的当前天气和按天汇总，不保留40条原始预报
+                                st.session_state.last_weather_view = {
+                                    "current": weather_data["current"],
+                                    "city": weather_data["forecast"].get("city", {}),
+                                    "daily": weather_data["daily"]
+                                }
+                                st.session_state.last_weather_timings = timings
+                                st.session_state.last_weather_cache = (weather_result["cache"], weather_result["cache_age"])
+                                st.session_state.last_comparison = comparison
                                 
                                 st.success("查询完成！")
-                            else:
-                                st.error(f"生成回复失败：{final_response.message}")
                                 
                         else:
-                            st.error(f"获取天气数据失败：{weather_result['error']}")
-                    else:
-                        st.error(f"解析查询失败：{parse_response.message}")
+                            st.error(f"获取天气数据失败：{weather_results[0]['error']}")
                         
                 except Exception as e:
                     st.error(f"查询失败：{str(e)}")
@@ -239,43 +286,34 @@ with col2:
     st.subheader("查询结果")
     if 'last_weather_result' in st.session_state:
         st.markdown(st.session_state.last_weather_result)
+        if st.session_state.get('last_comparison'):
+            st.dataframe(st.session_state.last_comparison, hide_index=True)
+        if 'last_weather_timings' in st.session_state:
+            st.caption(f"⏱️ {format_timings(st.session_state.last_weather_timings)}")
+        if 'last_weather_cache' in st.session_state:
+            cache_status, cache_age = st.session_state.last_weather_cache
+            if cache_status == "fresh":
+                st.caption(f"🗂️ 天气数据来自缓存（{cache_age:.0f} 秒前获取）")
+            elif cache_status == "stale":
+                st.caption(f"🗂️ 天气数据来自缓存（{cache_age:.0f} 秒前获取，已在后台刷新）")
         
-        # 显示原始天气数据
-        if 'last_weather_data' in st.session_state:
+        # 显示天气数据
+        if 'last_weather_view' in st.session_state:
+            weather_view = st.session_state.last_weather_view
             with st.expander("📊 详细天气数据"):
-                st.json(st.session_state.last_weather_data)
+                st.json(weather_view["current"])
                 
-            # 显示预报信息
-            weather_data = st.session_state.last_weather_data
-            if "forecast" in weather_data and weather_data["forecast"]["list"]:
+            # 显示预报信息（已按天汇总，无需每次重新分组）
+            daily = weather_view["daily"]
+            if not daily.empty:
                 with st.expander("📅 5天天气预报"):
-                    forecast_data = weather_data["forecast"]
-                    st.write(f"**城市：** {forecast_data['city']['name']}, {forecast_data['city']['country']}")
-                    
-                    # 按天分组显示预报
-                    daily_forecasts = {}
-                    for item in forecast_data["list"]:
-                        date = datetime.fromtimestamp(item['dt']).strftime('%Y-%m-%d')
-                        if date not in daily_forecasts:
-                            daily_forecasts[date] = []
-                        daily_forecasts[date].append(item)
+                    city_data = weather_view["city"]
+                    st.write(f"**城市：** {city_data.get('name', '')}, {city_data.get('country', '')}")
                     
-                    for date, items in list(daily_forecasts.items())[:5]:  # 显示5天
-                        day_name = datetime.fromtimestamp(items[0]['dt']).strftime('%A')
-                        min_temp = min(item['main']['temp'] for item in items)
-                        max_temp = max(item['main']['temp'] for item in items)
-                        weather_desc = items[0]['weather'][0]['description']
-                        humidity = items[0]['main']['humidity']
-                        wind_speed = items[0]['wind']['speed']
-                        
-                        st.write(f"**{date} ({day_name})：** {weather_desc}")
-                        st.write(f"温度：{min_temp:.1f}°C / {max_temp:.1f}°C, 湿度：{humidity}%, 风速：{wind_speed} m/s")
-                        
-                        # 显示降水概率
-                        if 'pop' in items[0]:
-                            pop_percent = items[0]['pop'] * 100
-                            st.write(f"降水概率：{pop_percent:.0f}%")
-                        
+                    for day in daily.head(5).itertuples(index=False):
+                        st.write(f"**{day.date} ({day.weekday})：** {day.description}")
+                        st.write(f"温度：{day.temp_min:.1f}°C / {day.temp_max:.1f}°C, 湿度：{day.humidity}%, 风速：{day.wind_speed} m/s")
+                        st.write(f"降水概率：{day.pop * 100:.0f}%")
                         st.write("---")
     else:
         st.info("请在左侧输入查询需求并点击查询按钮")
@@ -283,14 +321,7 @@ with col2:
 # 示例查询
 st.markdown("---")
 st.subheader("💡 查询示例")
-examples = [
-    "北京今天天气怎么样？",
-    "上海明天会下雨吗？",
-    "广州现在的温度是多少？",
-    "深圳未来几天的天气如何？"
-]
-
-for example in examples:
+for example in EXAMPLE_QUERIES:
     if st.button(example, key=example):
         st.session_state.query_input = example
         st.rerun()
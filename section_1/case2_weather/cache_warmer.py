@@ -0,0 +1,120 @@
+"""
+天气缓存预热
+后台线程定期为热门城市和示例查询中的城市预先获取天气数据，
+让缓存在过期前就被刷新，用户查询时直接命中新鲜缓存
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from weather_service import FANOUT_WORKERS
+
+# 热门城市，逗号分隔，可通过环境变量 WEATHER_HOT_CITIES 覆盖
+DEFAULT_HOT_CITIES = [
+    city.strip() for city in os.getenv("WEATHER_HOT_CITIES", "北京,上海,广州,深圳,杭州,成都").split(",") if city.strip()
+]
+
+# 预热间隔（秒），应小于天气缓存的新鲜期，可通过环境变量 WEATHER_WARM_INTERVAL 覆盖
+DEFAULT_INTERVAL = int(os.getenv("WEATHER_WARM_INTERVAL", "300"))
+
+
+class CacheWarmer:
+    """定期刷新热门城市天气缓存的后台任务"""
+
+    def __init__(self, service, cities, interval=DEFAULT_INTERVAL, max_workers=FANOUT_WORKERS):
+        """
+        Args:
+            service: WeatherService 实例，预热结果写入其缓存
+            cities: 需要预热的城市名称列表（重复的只保留一个）
+            interval: 两轮预热之间的间隔（秒）
+            max_workers: 同时预热的城市数上限
+        """
+        self.service = service
+        self.cities = list(dict.fromkeys(cities))
+        self.interval = interval
+        self.max_workers = max_workers
+
+        self.api_key = None
+        self.last_run = None
+        self._places = {}
+        self._status = {city: {"last_refresh": None, "last_error": None, "failures": 0} for city in self.cities}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self, api_key):
+        """更新API Key，并在后台线程未运行时启动；可重复调用"""
+        with self._lock:
+            self.api_key = api_key
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="weather-cache-warmer", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """停止后台线程"""
+        self._stop.set()
+
+    def run_once(self):
+        """
+        执行一轮预热：跳过在下一轮之前仍然新鲜的城市，其余并发刷新
+
+        Returns:
+            本轮刷新的城市数
+        """
+        api_key = self.api_key
+        pending = [city for city in self.cities if self._needs_refresh(city)]
+        if pending:
+            with ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(pending)))) as executor:
+                list(executor.map(lambda city: self._warm(city, api_key), pending))
+        self.last_run = time.time()
+        return len(pending)
+
+    def status(self):
+        """
+        Returns:
+            [{"city", "last_refresh", "last_error", "failures"}] 列表，last_refresh 为时间戳，
+            failures 为连续失败次数，成功刷新后清零
+        """
+        with self._lock:
+            return [{"city": city, **state} for city, state in self._status.items()]
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception:
+                # 单轮失败不影响后续预热，错误已记录在各城市状态中
+                pass
+            self._stop.wait(self.interval)
+
+    def _needs_refresh(self, city):
+        place = self._places.get(city)
+        if place is None:
+            return True
+        age = self.service.cache.age(place["lat"], place["lon"])
+        return age is None or age + self.interval >= self.service.cache.ttl
+
+    def _warm(self, city, api_key):
+        try:
+            # 记住解析过的坐标，避免每轮都计入地理编码缓存的命中统计
+            place = self._places.get(city) or self.service.geocoder.resolve(city, api_key, session=self.service.session)
+            if place is None:
+                error = f"未找到城市：{city}"
+            else:
+                data, error = self.service.fetch(place["lat"], place["lon"], api_key)
+                if error is None:
+                    self._places[city] = place
+                    self.service.cache.set(place["lat"], place["lon"], data)
+        except Exception as e:
+            error = f"预热异常：{str(e)}"
+
+        with self._lock:
+            state = self._status[city]
+            if error is None:
+                state.update(last_refresh=time.time(), last_error=None, failures=0)
+            else:
+                state.update(last_error=error, failures=state["failures"] + 1)
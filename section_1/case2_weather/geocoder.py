@@ -0,0 +1,171 @@
+"""
+城市地理编码
+城市名称 → (纬度, 经度, 名称, 国家) 的持久化缓存：启动时用内置的城市库（gazetteer.json）预热，
+未收录的城市才调用OpenWeatherMap地理编码接口，结果写入SQLite，下次查询直接命中
+"""
+
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+import requests
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.llm_cache import DEFAULT_CACHE_DIR
+
+# OpenWeatherMap服务地址，可通过环境变量 OPENWEATHER_BASE_URL 覆盖（例如指向本地模拟服务）
+OPENWEATHER_BASE_URL = os.getenv("OPENWEATHER_BASE_URL", "https://api.openweathermap.org").rstrip("/")
+GEOCODE_PATH = "/geo/1.0/direct"
+
+# 内置城市库：国内主要城市和世界主要城市
+GAZETTEER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "gazetteer.json")
+
+# 城市名称末尾可省略的行政区划后缀
+CITY_SUFFIXES = ("市", "省", "特别行政区")
+
+
+def normalize_city(name):
+    """规范化城市名称：去空白、英文转小写、去掉“市”等后缀"""
+    key = "".join(str(name).split()).lower()
+    for suffix in CITY_SUFFIXES:
+        if key.endswith(suffix) and len(key) > len(suffix) + 1:
+            key = key[:-len(suffix)]
+            break
+    return key
+
+
+def load_gazetteer(path=GAZETTEER_PATH):
+    """读取城市库，返回 {规范化名称: 地点} 字典，中文名、英文名和别名都会建立索引"""
+    with open(path, encoding="utf-8") as f:
+        entries = json.load(f)
+
+    index = {}
+    for entry in entries:
+        place = {key: entry[key] for key in ("name", "country", "lat", "lon")}
+        for name in [entry["name"], entry.get("en_name", "")] + entry.get("aliases", []):
+            if name:
+                index.setdefault(normalize_city(name), place)
+    return index
+
+
+class Geocoder:
+    """带持久化缓存的地理编码器（线程安全）"""
+
+    def __init__(self, db_path=None, gazetteer_path=GAZETTEER_PATH, timeout=10, base_url=None):
+        """
+        Args:
+            db_path: SQLite文件路径，默认位于 DEFAULT_CACHE_DIR/geocode.sqlite3
+            gazetteer_path: 内置城市库路径，为None时不预热
+            timeout: 地理编码接口的超时时间（秒）
+            base_url: OpenWeatherMap服务地址，默认 OPENWEATHER_BASE_URL
+        """
+        self.geocode_url = (base_url or OPENWEATHER_BASE_URL).rstrip("/") + GEOCODE_PATH
+        self.db_path = db_path or os.path.join(DEFAULT_CACHE_DIR, "geocode.sqlite3")
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "remote": 0, "misses": 0}
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        self._conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS geocode (
+                query TEXT PRIMARY KEY,
+                name TEXT NOT NULL,
+                country TEXT NOT NULL,
+                lat REAL NOT NULL,
+                lon REAL NOT NULL,
+                source TEXT NOT NULL,
+                updated REAL NOT NULL
+            )
+            """
+        )
+
+        # 内置城市库写入SQLite，已有记录（包括接口查询得到的）保持不变
+        if gazetteer_path:
+            now = time.time()
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO geocode (query, name, country, lat, lon, source, updated) "
+                "VALUES (?, ?, ?, ?, ?, 'gazetteer', ?)",
+                [
+                    (query, place["name"], place["country"], place["lat"], place["lon"], now)
+                    for query, place in load_gazetteer(gazetteer_path).items()
+                ]
+            )
+        self._conn.commit()
+
+        # 整张表很小，全部加载到内存，查询无需访问磁盘
+        self._places = {
+            query: {"name": name, "country": country, "lat": lat, "lon": lon}
+            for query, name, country, lat, lon in self._conn.execute(
+                "SELECT query, name, country, lat, lon FROM geocode"
+            )
+        }
+
+    def lookup(self, city):
+        """只查本地缓存，未命中返回None"""
+        place = self._places.get(normalize_city(city))
+        with self._lock:
+            self._stats["hits" if place else "misses"] += 1
+        return place
+
+    def resolve(self, city, api_key, session=None):
+        """
+        解析城市坐标：先查本地缓存，未命中时调用地理编码接口并持久化结果
+
+        Args:
+            city: 城市名称
+            api_key: OpenWeatherMap API Key
+            session: 复用的 requests.Session，默认直接使用 requests
+
+        Returns:
+            {"name", "country", "lat", "lon"}，找不到城市时返回None
+
+        Raises:
+            requests.RequestException: 地理编码接口请求失败
+        """
+        place = self.lookup(city)
+        if place is not None:
+            return place
+
+        response = (session or requests).get(
+            self.geocode_url,
+            params={"q": city, "limit": 1, "appid": api_key},
+            timeout=self.timeout
+        )
+        response.raise_for_status()
+        data = response.json()
+        with self._lock:
+            self._stats["remote"] += 1
+        if not data:
+            return None
+
+        place = {key: data[0][key] for key in ("name", "country", "lat", "lon")}
+        self.store(city, place)
+        return place
+
+    def names(self):
+        """已收录的全部地名（规范化后）"""
+        with self._lock:
+            return list(self._places)
+
+    def store(self, city, place):
+        """写入一条地理编码结果"""
+        query = normalize_city(city)
+        with self._lock:
+            self._places[query] = place
+            self._conn.execute(
+                "INSERT OR REPLACE INTO geocode (query, name, country, lat, lon, source, updated) "
+                "VALUES (?, ?, ?, ?, ?, 'remote', ?)",
+                (query, place["name"], place["country"], place["lat"], place["lon"], time.time())
+            )
+            self._conn.commit()
+
+    def stats(self):
+        """返回命中统计和已缓存的城市数"""
+        with self._lock:
+            return {**self._stats, "cities": len(self._places)}
@@ -0,0 +1,206 @@
+"""
+天气查询的本地解析
+用城市名称前缀树在查询中匹配城市，再按关键词规则识别查询时间和查询类型，
+能解析出城市时无需调用大模型
+"""
+
+import json
+import re
+
+from geocoder import normalize_city
+
+# 查询时间关键词，按顺序匹配
+TIME_KEYWORDS = [
+    ("后天", ("后天",)),
+    ("明天", ("明天", "明日", "明早", "明晚", "tomorrow")),
+    ("未来几天", ("未来", "这几天", "近几天", "最近几天", "本周", "这周", "周末", "一周", "几天", "五天", "5天")),
+    ("今天", ("今天", "今日", "现在", "当前", "目前", "此刻", "今晚", "今早", "实时", "today", "now")),
+]
+
+# 查询类型关键词，按顺序匹配
+QUERY_TYPE_KEYWORDS = [
+    ("降水", ("下雨", "降雨", "降水", "带伞", "下雪", "雨", "雪", "rain", "snow")),
+    ("温度", ("温度", "气温", "多少度", "几度", "冷", "热")),
+    ("湿度", ("湿度", "潮湿", "干燥")),
+    ("风力", ("风力", "风速", "风向", "大风", "刮风")),
+    ("空气质量", ("空气", "雾霾", "pm2.5", "aqi")),
+]
+
+# 不影响问题含义的常见用语；查询去掉城市、关键词和这些用语后没有剩余内容时视为简单问题
+FILLER_WORDS = (
+    "请问", "帮我", "查询", "查一下", "告诉我", "一下", "天气预报", "天气", "预报", "情况", "怎么样", "如何",
+    "是多少", "多少", "要不要", "会不会", "有没有", "需要", "要", "会", "有", "是", "的", "吗", "呢", "啊", "吧", "市",
+)
+
+# 时间、类型关键词和常见用语，按长度从长到短排列
+KEYWORDS = sorted(
+    [keyword for _, keywords in TIME_KEYWORDS + QUERY_TYPE_KEYWORDS for keyword in keywords] + list(FILLER_WORDS),
+    key=len,
+    reverse=True
+)
+
+# 表明是在查询天气的关键词；查询中不含这些词和类型关键词时，城市名称必须是独立的词
+WEATHER_KEYWORDS = ("天气", "预报", "气象", "weather", "forecast")
+
+
+# 本地无法识别城市时交给大模型解析的prompt
+PARSE_PROMPT = """
+请解析以下天气查询需求，提取城市名称和查询内容。
+
+用户查询：{query}
+
+请按以下JSON格式输出：
+{{
+    "city": "城市名称",
+    "cities": ["城市名称（涉及多个城市时全部列出）"],
+    "query_type": "查询类型（当前天气/未来天气/温度/降水等）",
+    "time": "查询时间（今天/明天/后天等）"
+}}
+"""
+
+
+class CityTrie:
+    """城市名称前缀树，在文本中做最长匹配；名称按 normalize_city 规范化（不含空格），匹配时跳过文本中的空格"""
+
+    def __init__(self, names=()):
+        self.root = {}
+        for name in names:
+            self.add(name)
+
+    def add(self, name):
+        node = self.root
+        for char in name.lower():
+            node = node.setdefault(char, {})
+        node[""] = name
+
+    def find_all(self, text):
+        """
+        从左到右查找所有不重叠的城市名称，每个位置取最长匹配
+
+        Returns:
+            [(起始位置, 结束位置, 名称)] 列表
+        """
+        text = text.lower()
+        matches = []
+        i = 0
+        while i < len(text):
+            node, j, found = self.root, i, None
+            while j < len(text):
+                if text[j].isspace() and node is not self.root:
+                    j += 1
+                    continue
+                if text[j] not in node:
+                    break
+                node = node[text[j]]
+                j += 1
+                if "" in node:
+                    found = (j, node[""])
+            # 英文名称需要完整单词匹配，避免 "la" 匹配到 "lang"
+            if found and self._is_word(text, i, found[0]):
+                matches.append((i, found[0], found[1]))
+                i = found[0]
+            else:
+                i += 1
+        return matches
+
+    @staticmethod
+    def _is_word(text, start, end):
+        if not text[start:end].isascii():
+            return True
+        before = text[start - 1] if start > 0 else " "
+        after = text[end] if end < len(text) else " "
+        return not (before.isascii() and before.isalnum()) and not (after.isascii() and after.isalnum())
+
+
+def is_simple_query(text, spans):
+    """
+    去掉城市名称、时间和类型关键词以及常见用语后，没有其他内容即为简单问题
+    （如"北京明天会下雨吗"），可直接用模板回答；含有其他诉求（如"适合跑步吗"）的不是
+    """
+    text = text.lower()
+    for start, end in reversed(spans):
+        text = text[:start] + " " + text[end:]
+    for word in KEYWORDS:
+        text = text.replace(word, " ")
+    return not re.sub(r"[\W_]+", "", text)
+
+
+def is_weather_query(text):
+    """查询中含有天气或查询类型关键词"""
+    text = text.lower()
+    return any(keyword in text for keyword in WEATHER_KEYWORDS) or \
+        any(keyword in text for _, keywords in QUERY_TYPE_KEYWORDS for keyword in keywords)
+
+
+def is_standalone(text, start, end):
+    """
+    城市名称两侧都是文本开头结尾、标点空白或关键词时视为独立的词，
+    避免"今天大同小异"中的"大同"被当作城市
+    """
+    text = text.lower()
+    before, after = text[:start], text[end:]
+    left = not before or not before[-1].isalnum() or any(before.endswith(word) for word in KEYWORDS)
+    right = not after or not after[0].isalnum() or any(after.startswith(word) for word in KEYWORDS)
+    return left and right
+
+
+def match_keyword(text, rules, default):
+    text = text.lower()
+    for label, keywords in rules:
+        if any(keyword in text for keyword in keywords):
+            return label
+    return default
+
+
+class QueryParser:
+    """基于城市库和关键词规则的查询解析器"""
+
+    def __init__(self, geocoder):
+        """
+        Args:
+            geocoder: Geocoder 实例，使用其已收录的地名建立前缀树
+        """
+        self.geocoder = geocoder
+        self.trie = CityTrie(geocoder.names())
+
+    def add_city(self, city):
+        """收录通过地理编码接口解析出的城市，之后的查询可在本地识别"""
+        self.trie.add(normalize_city(city))
+
+    def parse(self, query):
+        """
+        解析天气查询
+
+        Returns:
+            与大模型解析结果相同结构的 {"city", "cities", "query_type", "time"}，另加 simple 表示是否为简单问题；
+            cities 为查询中出现的全部城市（按出现顺序去重）；
+            未识别出城市，或查询中没有天气关键词且城市名称不是独立的词时返回None，交给大模型解析
+        """
+        matches = self.trie.find_all(query)
+        if not matches:
+            return None
+        if not is_weather_query(query) and not any(is_standalone(query, start, end) for start, end, _ in matches):
+            return None
+        cities = list(dict.fromkeys(name for _, _, name in matches))
+
+        time_word = match_keyword(query, TIME_KEYWORDS, "今天")
+        default_type = "当前天气" if time_word == "今天" else "未来天气"
+        return {
+            "city": cities[0],
+            "cities": cities,
+            "query_type": match_keyword(query, QUERY_TYPE_KEYWORDS, default_type),
+            "time": time_word,
+            "simple": is_simple_query(query, [(start, end) for start, end, _ in matches])
+        }
+
+
+def parse_llm_result(content):
+    """从大模型回复中提取JSON对象（兼容```json代码块），失败返回None"""
+    match = re.search(r"\{.*\}", content, re.S)
+    if not match:
+        return None
+    try:
+        data = json.loads(match.group(0))
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
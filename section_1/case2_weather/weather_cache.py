@@ -0,0 +1,116 @@
+"""
+天气数据缓存
+按四舍五入后的坐标缓存当前天气和预报数据，所有会话共享：
+新鲜期内直接返回；过期但仍可用时先返回旧数据，同时在后台刷新（stale-while-revalidate）
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# 新鲜期（秒），可通过环境变量 WEATHER_CACHE_TTL 覆盖
+DEFAULT_TTL = int(os.getenv("WEATHER_CACHE_TTL", "600"))
+
+# 过期数据最多还能继续使用的时长（秒），超过后视为未命中
+DEFAULT_MAX_STALE = int(os.getenv("WEATHER_CACHE_MAX_STALE", "3600"))
+
+FRESH = "fresh"
+STALE = "stale"
+MISS = "miss"
+
+
+class WeatherCache:
+    """线程安全的天气数据缓存"""
+
+    def __init__(self, ttl=DEFAULT_TTL, max_stale=DEFAULT_MAX_STALE, precision=2, max_items=1024):
+        """
+        Args:
+            ttl: 新鲜期（秒）
+            max_stale: 过期后仍可返回旧数据的时长（秒）
+            precision: 坐标保留的小数位数，2位约1公里
+            max_items: 最多缓存的坐标数，超出时淘汰最久未使用的
+        """
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.precision = precision
+        self.max_items = max_items
+
+        self._entries = OrderedDict()
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._stats = {FRESH: 0, STALE: 0, MISS: 0, "refreshes": 0}
+
+    def key(self, lat, lon):
+        """坐标四舍五入后作为缓存键"""
+        return round(lat, self.precision), round(lon, self.precision)
+
+    def get(self, lat, lon):
+        """
+        读取缓存
+
+        Returns:
+            (数据, 状态, 已缓存秒数)，状态为 FRESH / STALE / MISS，未命中时数据为None
+        """
+        key = self.key(lat, lon)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats[MISS] += 1
+                return None, MISS, None
+
+            fetched, value = entry
+            age = now - fetched
+            if age < self.ttl:
+                status = FRESH
+            elif age < self.ttl + self.max_stale:
+                status = STALE
+            else:
+                del self._entries[key]
+                self._stats[MISS] += 1
+                return None, MISS, None
+
+            self._entries.move_to_end(key)
+            self._stats[status] += 1
+            return value, status, age
+
+    def age(self, lat, lon):
+        """返回已缓存的秒数，不计入命中统计；未缓存时返回None"""
+        with self._lock:
+            entry = self._entries.get(self.key(lat, lon))
+        return None if entry is None else time.time() - entry[0]
+
+    def set(self, lat, lon, value):
+        """写入缓存"""
+        key = self.key(lat, lon)
+        with self._lock:
+            self._entries[key] = (time.time(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_items:
+                self._entries.popitem(last=False)
+
+    def try_begin_refresh(self, lat, lon):
+        """标记坐标正在后台刷新；已有刷新在进行时返回False，避免重复请求"""
+        key = self.key(lat, lon)
+        with self._lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+            self._stats["refreshes"] += 1
+            return True
+
+    def end_refresh(self, lat, lon):
+        """清除刷新标记"""
+        with self._lock:
+            self._refreshing.discard(self.key(lat, lon))
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """返回命中统计和当前缓存的坐标数"""
+        with self._lock:
+            return {**self._stats, "items": len(self._entries)}
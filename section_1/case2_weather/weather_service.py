@@ -0,0 +1,259 @@
+"""
+天气数据服务
+复用带keep-alive连接池的HTTP会话，地理编码后并发请求当前天气和5天预报，
+所有请求都有超时，并记录每个阶段的耗时；结果写入按坐标共享的缓存，过期数据先返回再后台刷新
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+
+from geocoder import OPENWEATHER_BASE_URL
+from weather_cache import STALE, WeatherCache
+
+CURRENT_PATH = "/data/2.5/weather"
+FORECAST_PATH = "/data/2.5/forecast"
+
+# (连接超时, 读取超时)，单位秒
+DEFAULT_TIMEOUT = (3.05, 10)
+
+# 多城市查询时同时请求的城市数上限
+FANOUT_WORKERS = 4
+
+# 查询时间对应的预报日期偏移，未列出的按整个预报期汇总
+TIME_OFFSETS = {"今天": 0, "明天": 1, "后天": 2}
+
+# 按天汇总的预报列
+DAILY_COLUMNS = ["date", "weekday", "temp_min", "temp_max", "description", "humidity", "wind_speed", "pop", "pop_max"]
+
+
+class WeatherService:
+    """OpenWeatherMap天气数据服务（线程安全，可在所有会话间共享）"""
+
+    def __init__(self, geocoder, cache=None, pool_size=16, timeout=DEFAULT_TIMEOUT, base_url=None):
+        """
+        Args:
+            geocoder: Geocoder 实例
+            cache: WeatherCache 实例，默认新建
+            pool_size: 连接池大小
+            timeout: 请求超时，(连接超时, 读取超时)
+            base_url: OpenWeatherMap服务地址，默认 OPENWEATHER_BASE_URL
+        """
+        self.geocoder = geocoder
+        self.cache = cache or WeatherCache()
+        self.base_url = (base_url or OPENWEATHER_BASE_URL).rstrip("/")
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.executor = ThreadPoolExecutor(max_workers=pool_size)
+        # 后台刷新使用独立线程池，避免占满请求线程池后互相等待
+        self.refresh_executor = ThreadPoolExecutor(max_workers=4)
+
+    def get_weather_data(self, city, api_key):
+        """
+        获取城市的当前天气和5天预报，优先使用共享缓存
+
+        Returns:
+            {"success": True, "data": {"current", "forecast", "daily"}, "city_info", "cache", "cache_age", "timings"}，
+            失败时为 {"success": False, "error", "timings"}；
+            cache 为缓存状态（fresh / stale / miss），stale 时已在后台刷新；
+            timings 为各阶段耗时（秒）：geocode、current、forecast、fetch（并发请求的总耗时）
+        """
+        timings = {}
+        try:
+            # 地理编码：优先命中本地缓存
+            start = time.perf_counter()
+            try:
+                place = self.geocoder.resolve(city, api_key, session=self.session)
+            except requests.RequestException:
+                return {"success": False, "error": "地理编码API请求失败", "timings": timings}
+            finally:
+                timings["geocode"] = time.perf_counter() - start
+
+            if place is None:
+                return {"success": False, "error": f"未找到城市：{city}", "timings": timings}
+
+            lat, lon = place["lat"], place["lon"]
+            data, status, age = self.cache.get(lat, lon)
+
+            # 过期数据先返回，同时在后台刷新
+            if status == STALE and self.cache.try_begin_refresh(lat, lon):
+                self.refresh_executor.submit(self._refresh, lat, lon, api_key)
+
+            if data is None:
+                data, error = self.fetch(lat, lon, api_key, timings)
+                if error:
+                    return {"success": False, "error": error, "timings": timings}
+                self.cache.set(lat, lon, data)
+
+            return {
+                "success": True,
+                "data": data,
+                "city_info": place,
+                "cache": status,
+                "cache_age": age,
+                "timings": timings
+            }
+
+        except Exception as e:
+            return {"success": False, "error": f"API调用异常：{str(e)}", "timings": timings}
+
+    def get_many(self, cities, api_key, max_workers=FANOUT_WORKERS):
+        """
+        并发获取多个城市的天气，并发数有上限
+
+        Returns:
+            与 cities 顺序一致的 get_weather_data 结果列表
+        """
+        # 每个城市内部还会并发请求当前天气和预报，这里用独立的线程池避免与 self.executor 互相等待
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(cities)))) as executor:
+            return list(executor.map(lambda city: self.get_weather_data(city, api_key), cities))
+
+    def fetch(self, lat, lon, api_key, timings=None):
+        """
+        直接请求当前天气和5天预报（不经过缓存）
+
+        Returns:
+            ({"current", "forecast", "daily"}, None)，失败时为 (None, 错误信息)；
+            daily 为 daily_aggregates() 的按天汇总结果，随原始数据一起缓存
+        """
+        timings = {} if timings is None else timings
+        params = {
+            "lat": lat,
+            "lon": lon,
+            "appid": api_key,
+            "units": "metric",  # 使用摄氏度
+            "lang": "zh_cn"     # 中文
+        }
+
+        # 当前天气和5天预报互不依赖，并发请求
+        start = time.perf_counter()
+        current_future = self.executor.submit(self._get, self.base_url + CURRENT_PATH, params)
+        forecast_future = self.executor.submit(self._get, self.base_url + FORECAST_PATH, params)
+        current_response, timings["current"] = current_future.result()
+        forecast_response, timings["forecast"] = forecast_future.result()
+        timings["fetch"] = time.perf_counter() - start
+
+        if current_response.status_code != 200:
+            return None, f"天气API错误：{current_response.status_code}"
+        if forecast_response.status_code != 200:
+            return None, "预报API请求失败"
+        forecast = forecast_response.json()
+        return {"current": current_response.json(), "forecast": forecast, "daily": daily_aggregates(forecast)}, None
+
+    def close(self):
+        """关闭连接池和线程池"""
+        self.executor.shutdown(wait=False)
+        self.refresh_executor.shutdown(wait=False)
+        self.session.close()
+
+    def _get(self, url, params):
+        start = time.perf_counter()
+        response = self.session.get(url, params=params, timeout=self.timeout)
+        return response, time.perf_counter() - start
+
+    def _refresh(self, lat, lon, api_key):
+        try:
+            data, error = self.fetch(lat, lon, api_key)
+            if error is None:
+                self.cache.set(lat, lon, data)
+        except Exception:
+            # 刷新失败时保留旧数据，下次请求会再次尝试
+            pass
+        finally:
+            self.cache.end_refresh(lat, lon)
+
+
+def daily_aggregates(forecast):
+    """
+    把3小时粒度的预报按天汇总为列式表格，每次获取数据时只计算一次
+
+    日期按城市当地时区划分（预报中的 city.timezone，缺失时使用服务器时区）
+
+    Returns:
+        DataFrame，列为 date、weekday、temp_min、temp_max、description、humidity、wind_speed、pop、pop_max；
+        description、humidity、wind_speed、pop 取当天第一条预报
+    """
+    items = forecast.get("list", [])
+    if not items:
+        return pd.DataFrame(columns=DAILY_COLUMNS)
+
+    shift = forecast.get("city", {}).get("timezone", time.localtime().tm_gmtoff)
+    frame = pd.DataFrame({
+        "time": pd.to_datetime(np.array([item["dt"] for item in items]) + shift, unit="s"),
+        "temp": np.array([item["main"]["temp"] for item in items], dtype=float),
+        "humidity": np.array([item["main"]["humidity"] for item in items]),
+        "wind_speed": np.array([item["wind"]["speed"] for item in items], dtype=float),
+        "description": [item["weather"][0]["description"] for item in items],
+        "pop": np.array([item.get("pop", 0.0) for item in items], dtype=float),
+    })
+    frame["date"] = frame["time"].dt.strftime("%Y-%m-%d")
+
+    daily = frame.groupby("date", sort=True).agg(
+        temp_min=("temp", "min"),
+        temp_max=("temp", "max"),
+        description=("description", "first"),
+        humidity=("humidity", "first"),
+        wind_speed=("wind_speed", "first"),
+        pop=("pop", "first"),
+        pop_max=("pop", "max"),
+    ).reset_index()
+    daily.insert(1, "weekday", pd.to_datetime(daily["date"]).dt.strftime("%A"))
+    return daily[DAILY_COLUMNS]
+
+
+def city_today(forecast):
+    """城市当地的今天日期"""
+    shift = forecast.get("city", {}).get("timezone", time.localtime().tm_gmtoff)
+    return (datetime.now(timezone.utc) + timedelta(seconds=shift)).date()
+
+
+def day_summary(data, query_time):
+    """
+    从按天汇总的预报中取出查询时间对应的最低/最高温度和最大降水概率
+
+    Returns:
+        (时间说明, 最低温度, 最高温度, 降水概率)，没有对应预报时温度为None
+    """
+    daily = data["daily"]
+    offset = TIME_OFFSETS.get(query_time)
+    if offset is not None:
+        target = (city_today(data["forecast"]) + timedelta(days=offset)).isoformat()
+        daily = daily[daily["date"] == target]
+        label = query_time
+    else:
+        label = "未来5天"
+    if daily.empty:
+        return label, None, None, None
+    return label, daily["temp_min"].min(), daily["temp_max"].max(), daily["pop_max"].max()
+
+
+def comparison_row(result, query_time):
+    """把一个城市的查询结果压缩为对比表中的一行"""
+    current = result["data"]["current"]
+    label, low, high, pop = day_summary(result["data"], query_time)
+    return {
+        "城市": result["city_info"]["name"],
+        "当前温度": f"{current['main']['temp']:.1f}°C",
+        "当前天气": current["weather"][0]["description"],
+        "湿度": f"{current['main']['humidity']}%",
+        "风速": f"{current['wind']['speed']} m/s",
+        f"{label}温度": f"{low:.1f}~{high:.1f}°C" if low is not None else "无预报",
+        f"{label}降水概率": f"{pop * 100:.0f}%" if pop is not None else "无预报",
+    }
+
+
+def format_table(rows):
+    """格式化为Markdown表格，作为大模型的输入"""
+    headers = list(rows[0])
+    lines = ["| " + " | ".join(headers) + " |", "|" + "---|" * len(headers)]
+    lines += ["| " + " | ".join(str(row[h]) for h in headers) + " |" for row in rows]
+    return "\n".join(lines)
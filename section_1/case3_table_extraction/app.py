@@ -1,14 +1,50 @@
 import streamlit as st
-import dashscope
 import pandas as pd
 import json
 import os
 from dotenv import load_dotenv
 import io
+import sys
+from datetime import datetime
+import tempfile
+import time
+
+# 引入 section_1 公共模块
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.llm_cache import get_default_cache
+from common.llm_client import LLMClient
+from common.metrics import start_metrics_server
+from batch_extraction import BATCH_ROOT, SUMMARY_FIELDS, list_sources, resolve_batch_dir, run_batch, summary_csv
+from file_ingest import PREVIEW_ROWS, is_table_file, iter_table, read_head, sheet_names
+from image_extraction import VL_MODEL, recognize_regions
+from image_preprocess import preprocess
+from result_cache import content_hash, open_result_cache, result_key
+from structured_output import OUTPUT_FORMATS, infer_schema, is_structured, output_file_name, write_chunks
+from table_extraction import DEFAULT_CHUNK_ROWS, DEFAULT_WORKERS, extract_blocks, extract_text, iter_blocks
 
 # 加载环境变量
 load_dotenv()
 
+# 设置了 METRICS_PORT 时暴露Prometheus格式的调用指标
+start_metrics_server()
+
+
+@st.cache_resource
+def get_llm_client(api_key):
+    """按API Key复用大模型客户端，连接池在所有会话间共享"""
+    return LLMClient(api_key, app="case3_table_extraction")
+
+
+@st.cache_resource
+def get_result_cache():
+    """提取结果缓存（按内容哈希）在所有会话间共享"""
+    return open_result_cache()
+
+
+def format_time(timestamp):
+    """时间戳格式化为本地时间"""
+    return datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S')
+
 # 设置页面配置
 st.set_page_config(
     page_title="表格提取工具",
@@ -26,6 +62,21 @@ with st.sidebar:
     api_key = st.text_input("阿里云API Key", type="password", value=os.getenv("DASHSCOPE_API_KEY", ""))
     model = st.selectbox("选择模型", ["qwen-turbo", "qwen-plus", "qwen-max"], index=0)
     
+    st.markdown("### 结构化文件")
+    local_convert = st.checkbox("结构化文件本地转换", value=True, help="规整的CSV/Excel直接用pandas转换，不调用大模型")
+    
+    st.markdown("### 分块提取")
+    chunk_rows = st.slider("每块行数", 50, 1000, DEFAULT_CHUNK_ROWS, step=50, help="超过该行数的CSV/Excel表格按行分块，每块重复表头后并发提取")
+    max_workers = st.slider("最大并发数", 1, 16, DEFAULT_WORKERS, help="同时进行的API调用数量（表格分块、图片条带），过高可能触发限流")
+    
+    cache_stats = get_default_cache().stats()
+    st.caption(f"响应缓存：命中 {cache_stats['hits']} 次 / 未命中 {cache_stats['misses']} 次")
+    result_cache_stats = get_result_cache().stats()
+    st.caption(
+        f"提取结果缓存：{result_cache_stats['disk_items']} 条，"
+        f"命中 {result_cache_stats['hits']} 次 / 未命中 {result_cache_stats['misses']} 次"
+    )
+    
     st.markdown("---")
     st.markdown("### 使用说明")
     st.markdown("1. 输入您的阿里云API Key")
@@ -34,7 +85,7 @@ with st.sidebar:
     st.markdown("4. 点击提取按钮")
 
 # 主界面
-tab2, tab3 = st.tabs(["📁 文件上传", "🖼️ 图片识别"])
+tab2, tab3, tab4 = st.tabs(["📁 文件上传", "🖼️ 图片识别", "📦 批量提取"])
 
 with tab2:
     col1, col2 = st.columns([1, 1])
@@ -47,63 +98,97 @@ with tab2:
             help="支持文本文件、CSV、Excel格式"
         )
         
+        head = None
+        sheet = None
         if uploaded_file is not None:
             st.success(f"已上传文件：{uploaded_file.name}")
             
-            # 读取文件内容
+            # 读取文件内容：表格只读取前几行用于预览和判断，完整内容在提取时流式读取
             try:
-                if uploaded_file.name.endswith('.csv'):
-                    df = pd.read_csv(uploaded_file)
-                    file_content = df.to_string()
-                elif uploaded_file.name.endswith(('.xlsx', '.xls')):
-                    df = pd.read_excel(uploaded_file)
-                    file_content = df.to_string()
+                if is_table_file(uploaded_file.name):
+                    sheets = sheet_names(uploaded_file, uploaded_file.name)
+                    if len(sheets) > 1:
+                        sheet = st.selectbox("选择工作表", sheets, key="sheet")
+                    # 多读一行，用于判断是否需要分块提取
+                    head = read_head(uploaded_file, uploaded_file.name, sheet, rows=max(PREVIEW_ROWS, chunk_rows + 1))
+                    file_content = head.head(PREVIEW_ROWS).to_string()
+                    st.text_area("文件内容预览", file_content, height=200)
+                    if len(head) > PREVIEW_ROWS:
+                        st.caption(f"仅预览前 {PREVIEW_ROWS} 行")
                 else:
-                    file_content = uploaded_file.read().decode('utf-8')
-                
-                st.text_area("文件内容预览", file_content, height=200)
+                    file_content = uploaded_file.getvalue().decode('utf-8')
+                    st.text_area("文件内容预览", file_content, height=200)
                 
             except Exception as e:
                 st.error(f"文件读取失败：{str(e)}")
         
-        st.info("文件提取功能将表格内容转换为清晰易读的文本格式")
+        # 规整的CSV/Excel本地转换，只有自由文本和不规整的表格才调用大模型
+        structured = local_convert and is_structured(head)
+        if structured:
+            output_format = st.selectbox("输出格式", list(OUTPUT_FORMATS), key="output_format")
+            st.info("检测到结构化表格，将在本地直接转换，不调用大模型")
+        else:
+            st.info("文件提取功能将表格内容转换为清晰易读的文本格式")
         
         if st.button("📊 提取表格", type="primary", key="file_extract"):
-            if not api_key:
-                st.error("请输入阿里云API Key")
-            elif uploaded_file is None:
+            if uploaded_file is None:
                 st.error("请先上传文件")
-            else:
-                with st.spinner("正在提取表格..."):
-                    try:
-                        # 设置API key
-                        dashscope.api_key = api_key
-                        
-                        # 构建prompt
-                        prompt = f"""
-                        请从以下文件内容中提取表格内容，将表格转换为清晰易读的文本格式。
-                        
-                        文件内容：
-                        {file_content}
-                        
-                        要求：
-                        1. 识别表格结构
-                        2. 提取所有数据
-                        3. 将表格内容转换为清晰、整洁的文本格式
-                        4. 保持数据的完整性和准确性
-                        5. 确保文本格式清晰易读，不要有乱码或格式错误
-                        6. 输出格式应该是清晰的行列结构，便于阅读
-                        """
-                        
-                        # 调用API
-                        response = dashscope.Generation.call(
-                            model=model,
-                            prompt=prompt,
-                            result_format='message'
+            elif structured:
+                try:
+                    # 逐块读取并写入临时文件，内存中只保留当前数据块
+                    start = time.perf_counter()
+                    output = tempfile.TemporaryFile()
+                    # Parquet先扫描一遍整张表确定列类型，避免后面的数据块类型变化导致写入失败
+                    schema = infer_schema(iter_table(uploaded_file, uploaded_file.name, sheet)) if output_format == "Parquet" else None
+                    row_count = write_chunks(iter_table(uploaded_file, uploaded_file.name, sheet), output_format, output, schema)
+                    output.seek(0)
+                    elapsed = time.perf_counter() - start
+                    
+                    with col2:
+                        st.subheader("提取结果")
+                        st.dataframe(head.head(PREVIEW_ROWS), hide_index=True)
+                        st.caption(f"⚡ 本地转换（未调用大模型）：{row_count} 行 × {len(head.columns)} 列，耗时 {elapsed * 1000:.0f} ms")
+                        st.download_button(
+                            label=f"📥 下载{output_format}结果",
+                            data=output,
+                            file_name=output_file_name(output_format),
+                            mime=OUTPUT_FORMATS[output_format][1]
                         )
-                        
-                        if response.status_code == 200:
-                            result = response.output.choices[0].message.content
+                except Exception as e:
+                    st.error(f"转换失败：{str(e)}")
+            else:
+                # 相同内容、模型和选项的提取结果直接从缓存返回
+                chunked = head is not None and len(head) > chunk_rows
+                cache_key = result_key(
+                    content_hash(uploaded_file), "file", model,
+                    sheet=sheet, chunk_rows=chunk_rows if chunked else None
+                )
+                cached = get_result_cache().get(cache_key)
+                if cached is None and not api_key:
+                    st.error("请输入阿里云API Key")
+                else:
+                    with st.spinner("正在提取表格..."):
+                        try:
+                            if cached is not None:
+                                result, chunk_count, elapsed = cached["result"], cached["calls"], cached["elapsed"]
+                            else:
+                                # 获取复用的客户端
+                                client = get_llm_client(api_key)
+                                
+                                # 大表格分块并发提取，其余内容一次提取
+                                start = time.perf_counter()
+                                chunk_count = 1
+                                if chunked:
+                                    frames = iter_table(uploaded_file, uploaded_file.name, sheet)
+                                    result, chunk_count = extract_blocks(iter_blocks(frames, chunk_rows), client, model, max_workers)
+                                elif head is not None:
+                                    result = extract_text(head.to_string(), client, model)
+                                else:
+                                    result = extract_text(file_content, client, model)
+                                elapsed = time.perf_counter() - start
+                                get_result_cache().set(cache_key, {
+                                    "result": result, "calls": chunk_count, "elapsed": elapsed, "created": time.time()
+                                })
                             
                             # 显示结果
                             with col2:
@@ -117,6 +202,10 @@ with tab2:
                                     md_result = result
                                 
                                 st.markdown(md_result)
+                                if cached is not None:
+                                    st.caption(f"🗂️ 来自缓存：相同内容已于 {format_time(cached['created'])} 提取过，未调用大模型")
+                                elif chunk_count > 1:
+                                    st.caption(f"⏱️ 分 {chunk_count} 块并发提取，耗时 {elapsed:.1f} 秒")
                                 
                                 # 下载按钮
                                 st.download_button(
@@ -125,11 +214,9 @@ with tab2:
                                     file_name="extracted_table.md",
                                     mime="text/markdown"
                                 )
-                        else:
-                            st.error(f"API调用失败：{response.message}")
-                        
-                    except Exception as e:
-                        st.error(f"提取失败：{str(e)}")
+                            
+                        except Exception as e:
+                            st.error(f"提取失败：{str(e)}")
 
 with tab3:
     col1, col2 = st.columns([1, 1])
@@ -149,76 +236,36 @@ with tab3:
             # 显示图片预览
             st.image(uploaded_image, caption="图片预览", use_container_width=True)
         
+        crop_tables = st.checkbox("自动裁剪表格区域", value=True, help="检测图片中带线框的表格，只把表格区域发给模型，每个表格单独识别")
         st.info("图片识别功能将表格内容转换为文本格式")
         
         if st.button("🖼️ 识别表格", type="primary", key="image_extract"):
-            if not api_key:
-                st.error("请输入阿里云API Key")
-            elif uploaded_image is None:
+            if uploaded_image is None:
                 st.error("请先上传图片")
             else:
-                with st.spinner("正在识别图片中的表格..."):
-                    try:
-                        # 设置API key
-                        dashscope.api_key = api_key
-                        
-                        # 保存图片到临时文件
-                        import tempfile
-                        import os
-                        
-                        with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as tmp_file:
-                            tmp_file.write(uploaded_image.read())
-                            tmp_file_path = tmp_file.name
-                        
-                        # 构建prompt
-                        prompt = f"""
-                        请仔细识别这张图片中的表格内容，将表格转换为清晰易读的文本格式。
-                        
-                        要求：
-                        1. 仔细识别图片中的表格结构和所有数据
-                        2. 将表格内容转换为清晰、整洁的文本格式
-                        3. 保持数据的完整性和准确性
-                        4. 确保文本格式清晰易读，不要有乱码或格式错误
-                        5. 如果图片中有多个表格，请分别提取
-                        6. 输出格式应该是清晰的行列结构，便于阅读
-                        7. 避免出现重复字符、乱码或格式混乱的情况
-                        """
-                        
-                        # 调用多模态API
-                        response = dashscope.MultiModalConversation.call(
-                            model='qwen-vl-max',
-                            messages=[
-                                {
-                                    'role': 'user',
-                                    'content': [
-                                        {'text': prompt},
-                                        {'image': tmp_file_path}
-                                    ]
-                                }
-                            ]
-                        )
-                        
-                        # 清理临时文件
+                # 相同图片和选项的识别结果直接从缓存返回
+                cache_key = result_key(content_hash(uploaded_image.getvalue()), "image", VL_MODEL, crop_tables=crop_tables)
+                cached = get_result_cache().get(cache_key)
+                if cached is None and not api_key:
+                    st.error("请输入阿里云API Key")
+                else:
+                    with st.spinner("正在识别图片中的表格..."):
                         try:
-                            os.unlink(tmp_file_path)
-                        except:
-                            pass
-                        
-                        if response.status_code == 200:
-                            # 解析多模态API响应
-                            if hasattr(response.output.choices[0].message, 'content'):
-                                content = response.output.choices[0].message.content
-                                if isinstance(content, list) and len(content) > 0:
-                                    if hasattr(content[0], 'text'):
-                                        result = content[0].text
-                                    elif isinstance(content[0], dict) and 'text' in content[0]:
-                                        result = content[0]['text']
-                                    else:
-                                        result = str(content[0])
-                                else:
-                                    result = str(content)
+                            if cached is not None:
+                                result, call_count, image_info, elapsed = cached["result"], cached["calls"], cached["info"], cached["elapsed"]
                             else:
-                                result = str(response.output.choices[0].message)
+                                # 获取复用的客户端
+                                client = get_llm_client(api_key)
+                                
+                                # 在内存中预处理：方向校正、灰度化、裁剪表格区域、缩放和压缩，超大图片切成重叠条带
+                                start = time.perf_counter()
+                                regions, image_info = preprocess(uploaded_image.getvalue(), crop_tables=crop_tables)
+                                result, call_count = recognize_regions(regions, client, max_workers, cropped=image_info["tables"] > 0)
+                                elapsed = time.perf_counter() - start
+                                get_result_cache().set(cache_key, {
+                                    "result": result, "calls": call_count, "info": image_info,
+                                    "elapsed": elapsed, "created": time.time()
+                                })
                             
                             # 显示结果
                             with col2:
@@ -232,6 +279,15 @@ with tab3:
                                     md_result = result
                                 
                                 st.markdown(md_result)
+                                if cached is not None:
+                                    st.caption(f"🗂️ 来自缓存：相同图片已于 {format_time(cached['created'])} 识别过，未调用大模型")
+                                else:
+                                    width, height = image_info["original_size"]
+                                    table_note = f"检测到 {image_info['tables']} 个表格，" if image_info["tables"] else ""
+                                    st.caption(
+                                        f"🖼️ {table_note}原图 {width}×{height}、{image_info['original_bytes'] / 1024:.0f} KB → "
+                                        f"{call_count} 张灰度图共 {image_info['output_bytes'] / 1024:.0f} KB，耗时 {elapsed:.1f} 秒"
+                                    )
                                 
                                 # 下载按钮
                                 st.download_button(
@@ -240,11 +296,135 @@ with tab3:
                                     file_name="extracted_table.md",
                                     mime="text/markdown"
                                 )
-                        else:
-                            st.error(f"API调用失败：{response.message}")
-                        
-                    except Exception as e:
-                        st.error(f"识别失败：{str(e)}")
+                            
+                        except Exception as e:
+                            st.error(f"识别失败：{str(e)}")
+
+with tab4:
+    st.subheader("批量提取")
+    st.markdown("上传包含CSV/Excel/TXT/图片的ZIP压缩包，或填写服务器上的目录路径；每个文件的结果写入同一个输出压缩包")
+    
+    batch_zip = st.file_uploader("选择ZIP压缩包", type=['zip'], key="batch_uploader")
+    # 只有运维配置了 BATCH_ROOT 时才允许按目录处理，且只能访问该目录之内
+    batch_dir = ""
+    if BATCH_ROOT:
+        batch_dir = st.text_input(f"或输入 {BATCH_ROOT} 下的目录路径", placeholder="tables", key="batch_dir")
+    
+    col1, col2, col3 = st.columns(3)
+    batch_format = col1.selectbox("结构化表格输出格式", list(OUTPUT_FORMATS), key="batch_format")
+    batch_crop = col2.checkbox("图片自动裁剪表格区域", value=True, key="batch_crop")
+    process_workers = col3.slider("本地解析进程数", 1, 16, min(4, os.cpu_count() or 1), help="读取表格、本地转换和图片预处理在进程池中并行")
+    
+    def start_batch(sources):
+        """运行批量任务，结果追加到会话中的输出压缩包"""
+        progress_bar = st.progress(0.0)
+        metric_cols = st.columns(4)
+        done_metric = metric_cols[0].empty()
+        failed_metric = metric_cols[1].empty()
+        calls_metric = metric_cols[2].empty()
+        throughput_metric = metric_cols[3].empty()
+        
+        def update_progress(stats):
+            progress_bar.progress(stats["done"] / max(stats["total"], 1))
+            done_metric.metric("已完成", f"{stats['done']}/{stats['total']}")
+            failed_metric.metric("失败", stats["failed"])
+            calls_metric.metric("API调用", stats["calls"])
+            throughput_metric.metric("吞吐量", f"{stats['throughput']:.2f} 个/秒")
+        
+        stats, summary = run_batch(
+            sources, get_llm_client(api_key) if api_key else None, model, st.session_state.batch_output_path,
+            output_format=batch_format, local_convert=local_convert, chunk_rows=chunk_rows,
+            crop_tables=batch_crop, max_workers=max_workers, process_workers=process_workers,
+            result_cache=get_result_cache(), on_progress=update_progress
+        )
+        # 重试时用新结果替换同一文件的旧记录
+        retried = {row["file"] for row in summary}
+        st.session_state.batch_summary = [
+            row for row in st.session_state.get("batch_summary", []) if row["file"] not in retried
+        ] + summary
+        failed = {row["file"] for row in summary if row["status"] != "ok"}
+        st.session_state.batch_failed = [source for source in sources if source[1] in failed]
+        st.success(
+            f"批量提取完成！共 {stats['done']} 个文件，失败 {stats['failed']} 个；本地转换 {stats['local']} 个，"
+            f"大模型提取 {stats['llm']} 个，来自缓存 {stats['cached']} 个，API调用 {stats['calls']} 次，耗时 {stats['elapsed']:.1f} 秒"
+        )
+    
+    def discard_batch_input():
+        """删除上传压缩包的临时副本（只在还需要重试失败文件时保留）"""
+        input_path = st.session_state.pop("batch_input_path", None)
+        if input_path and os.path.exists(input_path):
+            os.remove(input_path)
+    
+    def batch_temp_file(prefix):
+        """为本次任务创建唯一的临时ZIP文件，避免并发会话互相覆盖"""
+        fd, path = tempfile.mkstemp(prefix=f"{prefix}_{datetime.now().strftime('%Y%m%d_%H%M%S')}_", suffix=".zip")
+        os.close(fd)
+        return path
+    
+    if st.button("🚀 开始批量提取", type="primary", key="batch_extract"):
+        try:
+            # 开始新任务时清理本会话上一次任务的临时文件
+            discard_batch_input()
+            previous_output = st.session_state.pop("batch_output_path", None)
+            if previous_output and os.path.exists(previous_output):
+                os.remove(previous_output)
+            st.session_state.batch_failed = []
+            
+            if batch_zip is not None:
+                # 压缩包保存到临时文件，供本地解析进程读取
+                source_path = batch_temp_file("table_batch_input")
+                st.session_state.batch_input_path = source_path
+                with open(source_path, "wb") as f:
+                    f.write(batch_zip.getvalue())
+            else:
+                source_path = resolve_batch_dir(batch_dir)
+            
+            if source_path is None:
+                st.error(f"请上传ZIP压缩包或输入 {BATCH_ROOT} 下的有效目录路径" if BATCH_ROOT else "请上传ZIP压缩包")
+            else:
+                sources = list_sources(source_path)
+                if not sources:
+                    st.error("没有找到支持的文件（CSV、Excel、TXT、PNG、JPG、GIF、BMP）")
+                else:
+                    st.session_state.batch_output_path = batch_temp_file("table_batch")
+                    st.session_state.batch_summary = []
+                    start_batch(sources)
+        except Exception as e:
+            st.error(f"批量提取失败：{str(e)}")
+        finally:
+            # 没有需要重试的文件时，上传压缩包的临时副本立即删除
+            if not st.session_state.get("batch_failed"):
+                discard_batch_input()
+    
+    # 失败的文件可以单独重试，结果写入同一个输出压缩包
+    if st.session_state.get("batch_failed"):
+        st.warning(f"{len(st.session_state.batch_failed)} 个文件提取失败")
+        if st.button("🔁 重试失败文件", key="batch_retry"):
+            try:
+                start_batch(st.session_state.batch_failed)
+            except Exception as e:
+                st.error(f"重试失败：{str(e)}")
+            finally:
+                if not st.session_state.get("batch_failed"):
+                    discard_batch_input()
+    
+    if st.session_state.get("batch_summary"):
+        st.dataframe(pd.DataFrame(st.session_state.batch_summary, columns=SUMMARY_FIELDS), hide_index=True)
+        st.download_button(
+            label="📥 下载处理汇总",
+            data=summary_csv(st.session_state.batch_summary),
+            file_name="batch_summary.csv",
+            mime="text/csv"
+        )
+    
+    if 'batch_output_path' in st.session_state and os.path.exists(st.session_state.batch_output_path):
+        with open(st.session_state.batch_output_path, "rb") as f:
+            st.download_button(
+                label="📥 下载批量提取结果",
+                data=f,
+                file_name=os.path.basename(st.session_state.batch_output_path),
+                mime="application/zip"
+            )
 
 # 页脚
 st.markdown("---")
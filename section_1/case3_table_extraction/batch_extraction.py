@@ -0,0 +1,362 @@
+"""
+批量表格提取
+从ZIP压缩包或目录中读取CSV/Excel/TXT/图片文件：本地解析（读取表格、结构化转换、图片预处理）在进程池中进行，
+需要大模型的文件在线程池中提取，同时进行的API调用数受全局并发上限约束；
+每个文件完成后立即写入输出压缩包，失败的文件自动重试，也可以在任务结束后单独重试
+"""
+
+import csv
+import io
+import os
+import threading
+import time
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+
+import requests
+
+from file_ingest import is_table_file, iter_table, read_head
+from image_extraction import VL_MODEL, recognize_regions
+from image_preprocess import preprocess
+from result_cache import content_hash, result_key
+from structured_output import OUTPUT_FORMATS, infer_schema, is_structured, write_chunks
+from table_extraction import DEFAULT_CHUNK_ROWS, DEFAULT_WORKERS, extract_blocks, extract_text, iter_blocks
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.bmp')
+
+SUPPORTED_EXTENSIONS = ('.csv', '.xlsx', '.xls', '.txt') + IMAGE_EXTENSIONS
+
+# 汇总表的列
+SUMMARY_FIELDS = ["file", "status", "output", "method", "calls", "attempts", "seconds", "error"]
+
+# 失败文件的默认重试次数（不含第一次）
+DEFAULT_RETRIES = 2
+
+# 允许按目录批量处理的服务器根目录，由运维通过环境变量 BATCH_ROOT 配置；未配置时只能上传ZIP
+BATCH_ROOT = os.getenv("BATCH_ROOT", "")
+
+
+def _within(path, root):
+    return os.path.commonpath([path, root]) == root
+
+
+def resolve_batch_dir(path, root=BATCH_ROOT):
+    """
+    把用户填写的目录解析为 root 下的真实路径
+
+    相对路径按 root 解析；解析符号链接后不在 root 内、或不是目录时返回None，
+    防止通过 ../ 或符号链接读取服务器上的任意文件
+    """
+    if not root or not path.strip():
+        return None
+    root = os.path.realpath(root)
+    resolved = os.path.realpath(os.path.join(root, path.strip()))
+    if not _within(resolved, root) or not os.path.isdir(resolved):
+        return None
+    return resolved
+
+
+def list_sources(path):
+    """
+    列出ZIP压缩包或目录中支持的文件
+
+    Returns:
+        [(容器路径, 文件相对路径)] 列表，按相对路径排序
+    """
+    if os.path.isdir(path):
+        # 跳过指向目录外的符号链接
+        real = os.path.realpath(path)
+        names = [
+            os.path.relpath(os.path.join(root, name), path).replace(os.sep, "/")
+            for root, _, files in os.walk(path) for name in files
+            if _within(os.path.realpath(os.path.join(root, name)), real)
+        ]
+    else:
+        with zipfile.ZipFile(path) as archive:
+            names = [info.filename for info in archive.infolist() if not info.is_dir()]
+    return [
+        (path, name) for name in sorted(names)
+        if name.lower().endswith(SUPPORTED_EXTENSIONS) and not name.startswith("__MACOSX/")
+        and not os.path.basename(name).startswith(".")
+    ]
+
+
+@contextmanager
+def open_source(source):
+    """以二进制只读方式打开文件（目录中的文件或压缩包中的成员）"""
+    container, name = source
+    if os.path.isdir(container):
+        with open(os.path.join(container, name), "rb") as f:
+            yield f
+    else:
+        with zipfile.ZipFile(container) as archive, archive.open(name) as f:
+            yield f
+
+
+def read_source(source):
+    """读取文件字节"""
+    with open_source(source) as f:
+        return f.read()
+
+
+def prepare(source, options):
+    """
+    在子进程中完成一个文件的本地解析
+
+    Args:
+        source: (容器路径, 文件相对路径)
+        options: 批量任务选项，见 run_batch
+
+    Returns:
+        任务字典：kind 为 "converted"（已本地转换，data为输出字节）、
+        "blocks"（需分块提取的表格，提取时再从源文件流式读取）、"text"（需一次提取的文本）或 "image"（预处理后的图片区域）
+    """
+    name = source[1]
+    data = read_source(source)
+    job = {"source": source, "digest": content_hash(data)}
+    lower = name.lower()
+
+    if is_table_file(lower):
+        head = read_head(io.BytesIO(data), lower, rows=options["chunk_rows"] + 1)
+        if options["local_convert"] and is_structured(head):
+            output = io.BytesIO()
+            schema = infer_schema(iter_table(io.BytesIO(data), lower)) if options["output_format"] == "Parquet" else None
+            write_chunks(iter_table(io.BytesIO(data), lower), options["output_format"], output, schema)
+            job.update(kind="converted", data=output.getvalue(), extension=OUTPUT_FORMATS[options["output_format"]][0])
+        elif len(head) > options["chunk_rows"]:
+            # 不在这里切块：整张表的CSV文本会随结果传回主进程，文件多时占用大量内存
+            job.update(kind="blocks")
+        else:
+            job.update(kind="text", content=head.to_string())
+    elif lower.endswith(IMAGE_EXTENSIONS):
+        regions, info = preprocess(data, crop_tables=options["crop_tables"])
+        job.update(kind="image", regions=regions, cropped=info["tables"] > 0)
+    else:
+        job.update(kind="text", content=data.decode("utf-8"))
+    return job
+
+
+class ConcurrencyLimiter:
+    """包装 LLMClient，限制所有文件合计同时进行的API调用数"""
+
+    def __init__(self, client, limit):
+        self.client = client
+        self._semaphore = threading.BoundedSemaphore(max(1, limit))
+
+    def generate(self, *args, **kwargs):
+        with self._semaphore:
+            return self.client.generate(*args, **kwargs)
+
+    def multimodal(self, *args, **kwargs):
+        with self._semaphore:
+            return self.client.multimodal(*args, **kwargs)
+
+
+def is_transient(error):
+    """
+    是否为值得重试的临时错误：网络错误、限流（429）和服务端错误（5xx）；
+    缺少API Key、编码错误、格式不支持等错误重试也会同样失败
+    """
+    if isinstance(error, requests.RequestException):
+        return True
+    status = getattr(error, "status_code", None)
+    return status is not None and (status == 429 or status >= 500)
+
+
+def _job_key(job, model, options):
+    if job["kind"] == "image":
+        return result_key(job["digest"], "image", VL_MODEL, crop_tables=options["crop_tables"])
+    chunked = job["kind"] == "blocks"
+    return result_key(
+        job["digest"], "file", model,
+        sheet=None, chunk_rows=options["chunk_rows"] if chunked else None
+    )
+
+
+def cached_result(job, model, options, result_cache=None):
+    """查询结果缓存，未命中时返回None"""
+    cached = result_cache.get(_job_key(job, model, options)) if result_cache is not None else None
+    return None if cached is None else cached["result"]
+
+
+def extract_job(job, client, model, options, result_cache=None):
+    """
+    用大模型提取本地解析后的文件，优先使用结果缓存
+
+    Returns:
+        (Markdown结果, API调用次数)，命中缓存时调用次数为0
+    """
+    cached = cached_result(job, model, options, result_cache)
+    if cached is not None:
+        return cached, 0
+
+    start = time.perf_counter()
+    if job["kind"] == "image":
+        result, calls = recognize_regions(job["regions"], client, options["max_workers"], cropped=job["cropped"])
+    elif job["kind"] == "blocks":
+        with open_source(job["source"]) as f:
+            blocks = iter_blocks(iter_table(f, job["source"][1]), options["chunk_rows"])
+            result, calls = extract_blocks(blocks, client, model, options["max_workers"])
+    else:
+        result, calls = extract_text(job["content"], client, model), 1
+
+    if result_cache is not None:
+        result_cache.set(_job_key(job, model, options), {
+            "result": result, "calls": calls, "elapsed": time.perf_counter() - start, "created": time.time()
+        })
+    return result, calls
+
+
+def _after(delay, func, *args):
+    if delay:
+        time.sleep(delay)
+    return func(*args)
+
+
+def output_name(name, extension, used):
+    """输出文件名：替换扩展名，与已有文件重名时保留原扩展名，仍然重名时追加序号"""
+    stem, original = os.path.splitext(name)
+    candidate = f"{stem}.{extension}"
+    if candidate in used:
+        stem = f"{stem}_{original.lstrip('.')}"
+        candidate = f"{stem}.{extension}"
+    number = 2
+    while candidate in used:
+        candidate = f"{stem}_{number}.{extension}"
+        number += 1
+    used.add(candidate)
+    return candidate
+
+
+def run_batch(sources, client, model, output_path, output_format="Markdown", local_convert=True,
+              chunk_rows=DEFAULT_CHUNK_ROWS, crop_tables=True, max_workers=DEFAULT_WORKERS,
+              process_workers=None, retries=DEFAULT_RETRIES, result_cache=None, on_progress=None):
+    """
+    批量提取，每个文件完成后立即写入输出ZIP（追加模式，重试时写入同一个压缩包）
+
+    Args:
+        sources: list_sources() 返回的文件列表
+        client: LLMClient 实例，为None时只能处理可本地转换的文件
+        model: 文本提取使用的模型
+        output_path: 输出ZIP路径
+        output_format: 结构化表格本地转换的输出格式
+        local_convert: 是否本地转换结构化表格
+        chunk_rows: 大表格分块行数
+        crop_tables: 图片是否先裁剪表格区域
+        max_workers: 所有文件合计同时进行的API调用数上限
+        process_workers: 本地解析的进程数，默认CPU核数
+        retries: 每个文件遇到临时错误（网络错误、429、5xx）后的重试次数
+        result_cache: 结果缓存（LLMCache），为None时不使用
+        on_progress: 进度回调，在调用线程中执行，参数为统计信息字典
+
+    Returns:
+        (统计信息字典, 汇总行列表)；汇总行的 status 为 "ok" 或 "failed"
+    """
+    options = {
+        "output_format": output_format, "local_convert": local_convert, "chunk_rows": chunk_rows,
+        "crop_tables": crop_tables, "max_workers": max_workers
+    }
+    limited = ConcurrencyLimiter(client, max_workers) if client is not None else None
+    start = time.time()
+    stats = {"total": len(sources), "done": 0, "failed": 0, "local": 0, "llm": 0, "cached": 0, "calls": 0,
+             "elapsed": 0.0, "throughput": 0.0}
+    summary = []
+
+    def report():
+        stats["elapsed"] = time.time() - start
+        stats["throughput"] = stats["done"] / stats["elapsed"] if stats["elapsed"] > 0 else 0.0
+        if on_progress:
+            on_progress(stats)
+
+    # 同时在途的本地解析不超过进程数的2倍，已解析、等待或正在调用大模型的文件不超过并发数的2倍，
+    # 内存中的任务数与文件总数无关
+    max_preparing = (process_workers or os.cpu_count() or 1) * 2
+    max_jobs = max(1, max_workers) * 2
+    remaining = iter(sources)
+
+    with zipfile.ZipFile(output_path, "a", compression=zipfile.ZIP_DEFLATED) as archive, \
+            ProcessPoolExecutor(max_workers=process_workers) as processes, \
+            ThreadPoolExecutor(max_workers=max(1, max_workers)) as threads:
+        used = set(archive.namelist())
+        attempts, started, jobs, pending = {}, {}, {}, {}
+
+        def fill():
+            while len(jobs) < max_jobs and sum(stage == "prepare" for stage, _ in pending.values()) < max_preparing:
+                source = next(remaining, None)
+                if source is None:
+                    return
+                attempts[source] = 1
+                started[source] = time.perf_counter()
+                pending[processes.submit(prepare, source, options)] = ("prepare", source)
+
+        def submit_extract(source, delay=0.0):
+            future = threads.submit(_after, delay, extract_job, jobs[source], limited, model, options, result_cache)
+            pending[future] = ("extract", source)
+
+        def write_result(source, text, calls):
+            name = output_name(source[1], "md", used)
+            archive.writestr(name, text)
+            stats["calls"] += calls
+            stats["llm" if calls else "cached"] += 1
+            finish(source, "ok", name, "大模型" if calls else "缓存", calls)
+
+        def finish(source, status, output="", method="", calls=0, error=""):
+            jobs.pop(source, None)
+            summary.append({
+                "file": source[1], "status": status, "output": output, "method": method, "calls": calls,
+                "attempts": attempts.pop(source), "seconds": round(time.perf_counter() - started.pop(source), 2),
+                "error": error
+            })
+            stats["done"] += 1
+            if status != "ok":
+                stats["failed"] += 1
+            report()
+
+        report()
+        fill()
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage, source = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    # 只有API调用的临时错误才单独重试（按指数退避延迟），不影响其他文件；
+                    # 本地解析错误和其他API错误重试也会同样失败，直接记为失败
+                    if stage == "extract" and is_transient(e) and attempts[source] <= retries:
+                        attempts[source] += 1
+                        submit_extract(source, delay=min(0.5 * 2 ** attempts[source], 10))
+                    else:
+                        finish(source, "failed", error=str(e))
+                    continue
+
+                if stage == "prepare" and result["kind"] == "converted":
+                    name = output_name(source[1], result["extension"], used)
+                    archive.writestr(name, result["data"])
+                    stats["local"] += 1
+                    finish(source, "ok", name, "本地转换")
+                elif stage == "prepare" and limited is None:
+                    # 没有API Key：命中缓存的直接写入，其余立即失败，不提交提取任务
+                    cached = cached_result(result, model, options, result_cache)
+                    if cached is None:
+                        finish(source, "failed", error="需要大模型提取，请输入阿里云API Key")
+                    else:
+                        write_result(source, cached, 0)
+                elif stage == "prepare":
+                    jobs[source] = result
+                    submit_extract(source)
+                else:
+                    write_result(source, *result)
+            fill()
+
+    return stats, summary
+
+
+def summary_csv(summary):
+    """汇总行转换为CSV文本"""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=SUMMARY_FIELDS)
+    writer.writeheader()
+    writer.writerows(summary)
+    return buffer.getvalue()
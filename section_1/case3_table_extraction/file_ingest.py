@@ -0,0 +1,106 @@
+"""
+表格文件的流式读取
+CSV按块读取，XLSX使用openpyxl只读模式逐行读取、按需加载指定工作表，
+预览只读取前N行；无论文件多大，内存中同时只保留一个数据块
+"""
+
+import pandas as pd
+from openpyxl import load_workbook
+
+# 预览显示的行数
+PREVIEW_ROWS = 50
+
+# 流式读取时每块的行数
+READ_CHUNK_ROWS = 5000
+
+TABLE_EXTENSIONS = ('.csv', '.xlsx', '.xls')
+
+
+def is_table_file(name):
+    """是否为CSV/Excel表格文件"""
+    return name.lower().endswith(TABLE_EXTENSIONS)
+
+
+def _rewind(source):
+    if hasattr(source, "seek"):
+        source.seek(0)
+    return source
+
+
+def sheet_names(source, name):
+    """
+    列出Excel的工作表名称（只读模式，不加载单元格）；CSV返回空列表
+    """
+    lower = name.lower()
+    if lower.endswith('.xlsx'):
+        workbook = load_workbook(_rewind(source), read_only=True)
+        try:
+            return workbook.sheetnames
+        finally:
+            workbook.close()
+    if lower.endswith('.xls'):
+        return list(pd.ExcelFile(_rewind(source)).sheet_names)
+    return []
+
+
+def _iter_xlsx(source, sheet, chunksize, nrows):
+    workbook = load_workbook(_rewind(source), read_only=True, data_only=True)
+    try:
+        worksheet = workbook[sheet] if sheet else workbook.worksheets[0]
+        rows = worksheet.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = [f"Unnamed: {i}" if value is None else str(value) for i, value in enumerate(header)]
+
+        block, total = [], 0
+        for row in rows:
+            # 只读模式下末尾的空行也会返回，跳过
+            if all(value is None for value in row):
+                continue
+            block.append(row[:len(columns)])
+            total += 1
+            if len(block) == chunksize or total == nrows:
+                yield pd.DataFrame(block, columns=columns)
+                block = []
+            if total == nrows:
+                return
+        if block:
+            yield pd.DataFrame(block, columns=columns)
+    finally:
+        workbook.close()
+
+
+def iter_table(source, name, sheet=None, chunksize=READ_CHUNK_ROWS, nrows=None):
+    """
+    逐块读取表格文件
+
+    Args:
+        source: 文件路径或文件对象（如Streamlit的UploadedFile）
+        name: 文件名，用于判断格式
+        sheet: Excel工作表名称，默认第一个
+        chunksize: 每块行数
+        nrows: 最多读取的行数，默认全部
+
+    Yields:
+        DataFrame 数据块，各块列相同
+    """
+    lower = name.lower()
+    if lower.endswith('.csv'):
+        with pd.read_csv(_rewind(source), chunksize=chunksize, nrows=nrows) as reader:
+            yield from reader
+    elif lower.endswith('.xlsx'):
+        yield from _iter_xlsx(source, sheet, chunksize, nrows)
+    elif lower.endswith('.xls'):
+        # 旧版xls格式不支持流式读取，整张工作表读取后再分块
+        df = pd.read_excel(_rewind(source), sheet_name=sheet or 0, nrows=nrows)
+        for start in range(0, len(df), chunksize):
+            yield df.iloc[start:start + chunksize]
+    else:
+        raise ValueError(f"不支持的表格格式：{name}")
+
+
+def read_head(source, name, sheet=None, rows=PREVIEW_ROWS):
+    """只读取表格的前 rows 行"""
+    chunks = list(iter_table(source, name, sheet, chunksize=rows, nrows=rows))
+    return chunks[0] if chunks else pd.DataFrame()
@@ -0,0 +1,135 @@
+"""
+图片表格识别
+预处理后的图片直接以data URI随请求发送；检测出的各个表格和切块后的条带并发识别，
+条带按从上到下的顺序拼接，并去掉相邻条带重叠部分重复识别出的行
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+from common.llm_client import image_to_data_uri
+from table_extraction import DEFAULT_WORKERS, APIError
+
+VL_MODEL = 'qwen-vl-max'
+
+IMAGE_PROMPT = """
+请仔细识别这张图片中的表格内容，将表格转换为清晰易读的文本格式。
+
+要求：
+1. 仔细识别图片中的表格结构和所有数据
+2. 将表格内容转换为清晰、整洁的文本格式
+3. 保持数据的完整性和准确性
+4. 确保文本格式清晰易读，不要有乱码或格式错误
+5. 如果图片中有多个表格，请分别提取
+6. 输出格式应该是清晰的行列结构，便于阅读
+7. 避免出现重复字符、乱码或格式混乱的情况
+"""
+
+TABLE_PROMPT = """
+请仔细识别这张图片中的表格内容，将表格转换为Markdown表格。
+
+要求：
+1. 仔细识别表格结构和所有数据，第一行为表头
+2. 保持数据的完整性和准确性
+3. 只输出表格，不要输出标题、说明或其他内容
+4. 避免出现重复字符、乱码或格式混乱的情况
+"""
+
+TILE_PROMPT = """
+这是一张长表格图片从上到下的第{index}/{total}段（相邻两段之间有少量重叠），请识别其中的表格内容。
+
+要求：
+1. 只输出一张Markdown表格，不要输出标题、说明或其他内容
+2. 第一段的第一行为表头；后续各段如果看不到表头，直接输出数据行
+3. 逐行识别所有完整的数据行，顶部或底部被截断的行不要输出
+4. 保持数据的完整性和准确性，避免出现重复字符、乱码或格式混乱的情况
+"""
+
+
+def response_text(response):
+    """从多模态API响应中取出文本内容"""
+    message = response.output.choices[0].message
+    if not hasattr(message, 'content'):
+        return str(message)
+    content = message.content
+    if isinstance(content, list) and len(content) > 0:
+        if hasattr(content[0], 'text'):
+            return content[0].text
+        if isinstance(content[0], dict) and 'text' in content[0]:
+            return content[0]['text']
+        return str(content[0])
+    return str(content)
+
+
+def recognize(image, prompt, client):
+    """识别一张JPEG图片，返回文本结果"""
+    response = client.multimodal(
+        model=VL_MODEL,
+        messages=[
+            {
+                'role': 'user',
+                'content': [
+                    {'text': prompt},
+                    {'image': image_to_data_uri(image, "image/jpeg")}
+                ]
+            }
+        ]
+    )
+    if response.status_code != 200:
+        raise APIError(f"API调用失败：{response.message}", response.status_code)
+    return response_text(response)
+
+
+def stitch_tiles(results):
+    """
+    拼接各条带的识别结果：合并为一张表格，去掉后续各段重复的表头，
+    以及下一段开头与上一段结尾因重叠而重复识别的行
+    """
+    merged = []
+    for result in results:
+        rows = [line.strip() for line in result.strip().splitlines() if line.strip().startswith("|")]
+        if not rows:
+            merged.append(result.strip())
+            continue
+        if merged:
+            if len(rows) >= 2 and set(rows[1]) <= set("|-: "):
+                rows = rows[2:]
+            overlap = next(
+                (size for size in range(min(len(rows), len(merged)), 0, -1) if merged[-size:] == rows[:size]),
+                0
+            )
+            rows = rows[overlap:]
+        merged.extend(rows)
+    return "\n".join(merged)
+
+
+def recognize_regions(regions, client, max_workers=DEFAULT_WORKERS, cropped=False):
+    """
+    识别预处理后的图片区域：所有区域的所有条带在同一个有界线程池中并发识别，
+    每个区域的条带按顺序拼接，多个区域按从上到下的顺序分节输出
+
+    Args:
+        regions: preprocess() 返回的区域列表
+        client: LLMClient 实例
+        max_workers: 最大并发请求数
+        cropped: 区域是否为检测出的单个表格（否则为整张图片，可能包含多个表格）
+
+    Returns:
+        (识别结果, 调用次数)
+    """
+    tasks = []
+    for region in regions:
+        total = len(region)
+        for index, image in enumerate(region, start=1):
+            if total > 1:
+                prompt = TILE_PROMPT.format(index=index, total=total)
+            else:
+                prompt = TABLE_PROMPT if cropped else IMAGE_PROMPT
+            tasks.append((image, prompt))
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(tasks)))) as executor:
+        results = iter(list(executor.map(lambda task: recognize(task[0], task[1], client), tasks)))
+
+    sections = [stitch_tiles([next(results) for _ in region]) if len(region) > 1 else next(results) for region in regions]
+    if len(sections) == 1:
+        return sections[0], len(tasks)
+    return "\n\n".join(f"## 表格{i}\n\n{section}" for i, section in enumerate(sections, start=1)), len(tasks)
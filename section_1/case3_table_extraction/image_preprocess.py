@@ -0,0 +1,106 @@
+"""
+表格图片预处理
+在内存中完成方向校正、灰度化、裁剪出表格区域、缩放到模型的有效分辨率并重新压缩，
+减少上传字节数和图片token；特别大的扫描件先切成相互重叠的横向条带，分别识别后再拼接
+"""
+
+import io
+import math
+
+from PIL import Image, ImageOps
+
+from table_detection import detect_tables
+
+# qwen-vl 按 28×28 像素的块编码图片，单张图片最多约1280个块，超出部分会被模型自行缩小
+MAX_PIXELS = 1280 * 28 * 28
+
+# 缩放后文字仍可辨认的最小比例，原图需要缩得更小时改为切块
+MIN_SCALE = 0.5
+
+# 相邻条带的重叠高度占条带高度的比例，避免表格行被切断
+TILE_OVERLAP = 0.1
+
+# JPEG压缩质量
+JPEG_QUALITY = 85
+
+
+def load_image(data):
+    """读取图片字节并按EXIF方向校正，转换为灰度图；带透明通道的图片先合成到白色背景上"""
+    image = Image.open(io.BytesIO(data))
+    image = ImageOps.exif_transpose(image)
+    if image.mode in ("RGBA", "LA", "PA") or (image.mode == "P" and "transparency" in image.info):
+        # 直接转灰度会丢弃透明通道，透明背景变成黑色，黑色文字随之不可见
+        image = image.convert("RGBA")
+        image = Image.alpha_composite(Image.new("RGBA", image.size, "white"), image)
+    return image.convert("L")
+
+
+def fit(image, max_pixels=MAX_PIXELS):
+    """等比缩小到不超过 max_pixels 像素，已经足够小的图片保持不变"""
+    pixels = image.width * image.height
+    if pixels <= max_pixels:
+        return image
+    scale = (max_pixels / pixels) ** 0.5
+    return image.resize((max(1, int(image.width * scale)), max(1, int(image.height * scale))), Image.LANCZOS)
+
+
+def encode(image, quality=JPEG_QUALITY):
+    """压缩为JPEG字节"""
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=quality, optimize=True)
+    return buffer.getvalue()
+
+
+def split_tiles(image, max_pixels=MAX_PIXELS, min_scale=MIN_SCALE, overlap=TILE_OVERLAP):
+    """
+    把图片切成从上到下、高度相同、相互重叠的横向条带
+
+    条带数取使每个条带按 min_scale 缩放后不超过 max_pixels 的最小值；
+    整张图按 min_scale 缩放后已经足够小时不切块
+
+    Returns:
+        条带图片列表
+    """
+    max_height = max(1, int(max_pixels / (image.width * min_scale ** 2)))
+    if image.height <= max_height:
+        return [image]
+    count = math.ceil(image.height * (1 + overlap) / max_height)
+    tile_height = min(image.height, math.ceil(image.height / count * (1 + overlap)))
+    step = (image.height - tile_height) / (count - 1)
+    return [
+        image.crop((0, round(i * step), image.width, round(i * step) + tile_height))
+        for i in range(count)
+    ]
+
+
+def preprocess(data, max_pixels=MAX_PIXELS, min_scale=MIN_SCALE, crop_tables=True):
+    """
+    预处理上传的图片
+
+    Args:
+        data: 图片字节
+        max_pixels: 每张送入模型的图片的最大像素数
+        min_scale: 切块前允许的最小缩放比例
+        crop_tables: 是否先检测带线框的表格并只保留表格区域
+
+    Returns:
+        (区域列表, 处理信息)；每个区域是一个表格（未检测到表格时为整张图片）切块后的JPEG字节列表，
+        处理信息包含 original_size、original_bytes、tables（检测到的表格数）、tile_sizes、output_bytes
+    """
+    image = load_image(data)
+    boxes = detect_tables(image) if crop_tables else []
+    crops = [image.crop(box) for box in boxes] or [image]
+
+    regions, sizes = [], []
+    for crop in crops:
+        tiles = [fit(tile, max_pixels) for tile in split_tiles(crop, max_pixels, min_scale)]
+        regions.append([encode(tile) for tile in tiles])
+        sizes += [tile.size for tile in tiles]
+    info = {
+        "original_size": image.size,
+        "original_bytes": len(data),
+        "tables": len(boxes),
+        "tile_sizes": sizes,
+        "output_bytes": sum(len(item) for region in regions for item in region),
+    }
+    return regions, info
@@ -0,0 +1,75 @@
+"""
+提取结果缓存
+按上传内容的SHA-256、模型、prompt版本和影响结果的选项生成缓存键，
+重复上传同一文件或图片时直接返回上次的提取结果，不再调用大模型
+"""
+
+import hashlib
+import json
+import os
+
+from common.llm_cache import DEFAULT_CACHE_DIR, LLMCache
+from image_extraction import IMAGE_PROMPT, TABLE_PROMPT, TILE_PROMPT
+from table_extraction import CHUNK_PROMPT, EXTRACT_PROMPT
+
+# prompt版本：由全部prompt模板计算，修改任一prompt后旧的缓存结果自动失效
+PROMPT_VERSION = hashlib.sha256(
+    "\n".join([EXTRACT_PROMPT, CHUNK_PROMPT, IMAGE_PROMPT, TABLE_PROMPT, TILE_PROMPT]).encode("utf-8")
+).hexdigest()[:12]
+
+# 结果缓存有效期（秒），默认30天
+RESULT_TTL = 30 * 24 * 3600
+
+READ_BLOCK = 1024 * 1024
+
+
+def content_hash(source):
+    """
+    计算内容的SHA-256
+
+    Args:
+        source: 字节串、文件路径或文件对象；文件按块读取，不会整体载入内存
+    """
+    digest = hashlib.sha256()
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        digest.update(source)
+        return digest.hexdigest()
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            for block in iter(lambda: f.read(READ_BLOCK), b""):
+                digest.update(block)
+        return digest.hexdigest()
+    source.seek(0)
+    for block in iter(lambda: source.read(READ_BLOCK), b""):
+        digest.update(block)
+    source.seek(0)
+    return digest.hexdigest()
+
+
+def result_key(digest, kind, model, **options):
+    """
+    生成结果缓存键
+
+    Args:
+        digest: content_hash() 的结果
+        kind: 提取方式，如 "file"、"image"
+        model: 模型名称
+        options: 其他影响结果的选项（如工作表、分块行数、是否裁剪表格区域）
+    """
+    payload = json.dumps(
+        {"digest": digest, "kind": kind, "model": model, "prompt_version": PROMPT_VERSION, "options": options},
+        ensure_ascii=False,
+        sort_keys=True,
+        default=str
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def open_result_cache(path=None, ttl=RESULT_TTL):
+    """打开持久化的结果缓存，默认位于 DEFAULT_CACHE_DIR/case3_results.sqlite3"""
+    return LLMCache(
+        path=path or os.path.join(DEFAULT_CACHE_DIR, "case3_results.sqlite3"),
+        ttl=ttl,
+        max_memory_items=64,
+        max_disk_bytes=200 * 1024 * 1024
+    )
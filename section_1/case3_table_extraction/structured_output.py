@@ -0,0 +1,164 @@
+"""
+结构化表格的本地转换
+上传的CSV/Excel本身已经是规整的表格时，直接用pandas输出Markdown、CSV或Parquet，
+无需把整张表发给大模型重新排版；自由文本和图片仍由大模型提取
+"""
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# 输出格式：(文件扩展名, MIME类型)
+OUTPUT_FORMATS = {
+    "Markdown": ("md", "text/markdown"),
+    "CSV": ("csv", "text/csv"),
+    "Parquet": ("parquet", "application/vnd.apache.parquet"),
+}
+
+
+def is_structured(df):
+    """
+    判断读取出的表格是否规整，可以直接本地转换
+
+    规整的表格至少有一行数据，表头不是pandas自动生成的 "Unnamed: n"（说明首行不是表头），
+    单列时表头中没有其他分隔符（说明分隔符识别错误），且没有整列为空（常见于排版用的Excel）
+    """
+    if df is None or df.empty or len(df.columns) == 0:
+        return False
+    if len(df.columns) == 1 and any(sep in str(df.columns[0]) for sep in ("\t", ";", "|")):
+        return False
+    unnamed = sum(str(column).startswith("Unnamed:") for column in df.columns)
+    if unnamed * 2 > len(df.columns):
+        return False
+    return not df.isna().all().any()
+
+
+def _cell(value):
+    if value is None or value != value:  # NaN
+        return ""
+    return str(value).replace("|", "\\|").replace("\r", " ").replace("\n", "<br>")
+
+
+def to_markdown(df):
+    """转换为Markdown表格（不依赖tabulate）"""
+    lines = [
+        "| " + " | ".join(_cell(column) for column in df.columns) + " |",
+        "|" + "---|" * len(df.columns),
+    ]
+    lines += ["| " + " | ".join(_cell(value) for value in row) + " |" for row in df.itertuples(index=False)]
+    return "\n".join(lines)
+
+
+def _markdown_rows(df):
+    return "".join("| " + " | ".join(_cell(value) for value in row) + " |\n" for row in df.itertuples(index=False))
+
+
+def _column_type(series):
+    try:
+        return pa.Array.from_pandas(series).type
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+        # 同一块内混有数字和文本等无法统一的类型
+        return pa.string()
+
+
+def _is_text(column_type):
+    return pa.types.is_string(column_type) or pa.types.is_large_string(column_type)
+
+
+def _widen(a, b):
+    """两个列类型的公共类型：整数与小数合并为小数，其他不一致的类型合并为文本"""
+    if _is_text(a) and _is_text(b):
+        return pa.string()
+    if a == b or pa.types.is_null(b):
+        return a
+    if pa.types.is_null(a):
+        return b
+    if pa.types.is_integer(a) and pa.types.is_integer(b):
+        return pa.int64()
+    if all(pa.types.is_integer(t) or pa.types.is_floating(t) for t in (a, b)):
+        return pa.float64()
+    return pa.string()
+
+
+def infer_schema(frames):
+    """
+    逐块扫描整张表，推断能容纳所有数据块的Parquet列类型
+
+    只看第一块推断类型时，后面出现的文本或小数会导致写入失败；
+    扫描时同样只保留当前数据块
+
+    Args:
+        frames: DataFrame 数据块的可迭代对象，各块列相同
+    """
+    types = {}
+    for df in frames:
+        for column in df.columns:
+            name = str(column)
+            column_type = _column_type(df[column])
+            types[name] = _widen(types[name], column_type) if name in types else column_type
+    return pa.schema([
+        (name, pa.string() if pa.types.is_null(t) or _is_text(t) else t) for name, t in types.items()
+    ])
+
+
+def _as_text(value):
+    return None if pd.isna(value) else str(value)
+
+
+def _to_table(df, schema):
+    """按给定的列类型转换数据块，文本列中的数字等值先转换为字符串"""
+    df = df.rename(columns=str)
+    for field in schema:
+        if pa.types.is_string(field.type):
+            df[field.name] = df[field.name].map(_as_text)
+    return pa.Table.from_pandas(df, schema=schema, preserve_index=False)
+
+
+def write_chunks(frames, output_format, output, schema=None):
+    """
+    逐块写出表格，内存中只保留当前数据块
+
+    Args:
+        frames: DataFrame 数据块的可迭代对象，各块列相同
+        output_format: OUTPUT_FORMATS 中的格式名称
+        output: 以二进制模式打开的文件对象
+        schema: Parquet的列类型，通常由 infer_schema() 预先扫描得到；
+            为None时按第一块的列类型写入，后续数据块类型不一致会报错
+
+    Returns:
+        写出的总行数
+    """
+    total = 0
+    writer = None
+    try:
+        for position, df in enumerate(frames):
+            if output_format == "Markdown":
+                if position == 0:
+                    output.write(to_markdown(df.iloc[:0]).encode("utf-8") + b"\n")
+                output.write(_markdown_rows(df).encode("utf-8"))
+            elif output_format == "CSV":
+                output.write(df.to_csv(index=False, header=position == 0).encode("utf-8"))
+            else:
+                # Parquet要求列名为字符串；未给出列类型时后续数据块按第一块的列类型写入
+                if schema is not None:
+                    table = _to_table(df, schema)
+                else:
+                    table = pa.Table.from_pandas(df.rename(columns=str), preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(output, table.schema)
+                else:
+                    try:
+                        table = table.cast(writer.schema)
+                    except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+                        raise ValueError(f"第{total + 1}行之后的列类型与前面不一致，请改用CSV或Markdown格式输出")
+                writer.write_table(table)
+            total += len(df)
+    finally:
+        if writer is not None:
+            writer.close()
+    return total
+
+
+def output_file_name(output_format, stem="extracted_table"):
+    """输出文件名"""
+    return f"{stem}.{OUTPUT_FORMATS[output_format][0]}"
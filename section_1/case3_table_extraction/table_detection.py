@@ -0,0 +1,79 @@
+"""
+表格区域检测
+用OpenCV提取图片中的水平线和竖直线，线条交织的区域即为表格，
+只把裁剪出的表格区域发给多模态模型，减少每次请求的像素和token
+"""
+
+import cv2
+import numpy as np
+
+# 表格区域占整张图片面积的最小比例，过小的区域视为噪声
+MIN_AREA_RATIO = 0.005
+
+# 线段的最小长度占图片宽/高的比例
+LINE_RATIO = 1 / 30
+
+# 裁剪时向外扩展的边距（像素），避免切掉表格边框外的表头文字
+PADDING = 12
+
+
+def _line_mask(binary, kernel_size):
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, kernel_size)
+    return cv2.morphologyEx(binary, cv2.MORPH_OPEN, kernel)
+
+
+def _overlaps(a, b):
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+
+def _merge_boxes(boxes):
+    """合并相互重叠的区域"""
+    merged = []
+    for box in sorted(boxes):
+        for i, other in enumerate(merged):
+            if _overlaps(box, other):
+                merged[i] = (min(box[0], other[0]), min(box[1], other[1]), max(box[2], other[2]), max(box[3], other[3]))
+                break
+        else:
+            merged.append(box)
+    return merged if len(merged) == len(boxes) else _merge_boxes(merged)
+
+
+def detect_tables(image, min_area_ratio=MIN_AREA_RATIO, padding=PADDING):
+    """
+    检测图片中带线框的表格
+
+    Args:
+        image: PIL灰度图
+        min_area_ratio: 表格区域的最小面积比例
+        padding: 向外扩展的边距
+
+    Returns:
+        [(left, top, right, bottom)] 表格区域列表，按从上到下、从左到右排序；
+        没有检测到带线框的表格（如无框线表格）时返回空列表
+    """
+    gray = np.asarray(image)
+    height, width = gray.shape[:2]
+    binary = cv2.adaptiveThreshold(
+        gray, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY_INV, 15, 10
+    )
+
+    horizontal = _line_mask(binary, (max(10, int(width * LINE_RATIO)), 1))
+    vertical = _line_mask(binary, (1, max(10, int(height * LINE_RATIO))))
+    grid = cv2.dilate(cv2.add(horizontal, vertical), np.ones((3, 3), np.uint8), iterations=2)
+
+    contours, _ = cv2.findContours(grid, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    boxes = []
+    for contour in contours:
+        x, y, w, h = cv2.boundingRect(contour)
+        if w * h < width * height * min_area_ratio:
+            continue
+        # 表格至少要同时包含水平线和竖直线，排除单独的分隔线、下划线
+        if not horizontal[y:y + h, x:x + w].any() or not vertical[y:y + h, x:x + w].any():
+            continue
+        boxes.append((
+            max(0, x - padding), max(0, y - padding),
+            min(width, x + w + padding), min(height, y + h + padding)
+        ))
+
+    return sorted(_merge_boxes(boxes), key=lambda box: (box[1], box[0]))
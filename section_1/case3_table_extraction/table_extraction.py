@@ -0,0 +1,162 @@
+"""
+大表格分块提取
+把CSV/Excel表格按行切分为重复表头的数据块，在有界线程池中并发调用大模型提取，
+再按原始顺序合并为一张Markdown表格，耗时随文件大小线性增长而不会超出模型上下文
+"""
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+EXTRACT_PROMPT = """
+请从以下文件内容中提取表格内容，将表格转换为清晰易读的文本格式。
+
+文件内容：
+{content}
+
+要求：
+1. 识别表格结构
+2. 提取所有数据
+3. 将表格内容转换为清晰、整洁的文本格式
+4. 保持数据的完整性和准确性
+5. 确保文本格式清晰易读，不要有乱码或格式错误
+6. 输出格式应该是清晰的行列结构，便于阅读
+"""
+
+CHUNK_PROMPT = """
+以下是一张大表格的第{index}块（CSV格式，第一行为表头），请把这一块转换为Markdown表格。
+
+{content}
+
+要求：
+1. 只输出一张Markdown表格，不要输出标题、说明或其他内容
+2. 第一行为表头，列名和列顺序与原表头一致
+3. 逐行转换所有数据，不要省略、合并或增加行
+4. 保持数据的完整性和准确性，不要有乱码或格式错误
+"""
+
+# 每块的默认行数
+DEFAULT_CHUNK_ROWS = 200
+
+# 同时进行的提取请求数上限
+DEFAULT_WORKERS = 4
+
+
+class APIError(RuntimeError):
+    """API返回非200状态码，保留状态码以便区分限流、服务端错误和请求本身的错误"""
+
+    def __init__(self, message, status_code):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def split_table(df, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """
+    按行切分表格
+
+    Returns:
+        CSV文本列表，每块都带有表头
+    """
+    return [
+        df.iloc[start:start + chunk_rows].to_csv(index=False)
+        for start in range(0, len(df), chunk_rows)
+    ] or [df.to_csv(index=False)]
+
+
+def iter_blocks(frames, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """
+    把流式读取的数据块重新切分为 chunk_rows 行的提取块
+
+    Yields:
+        带表头的CSV文本
+    """
+    pending = None
+    for df in frames:
+        pending = df if pending is None else pd.concat([pending, df], ignore_index=True)
+        while len(pending) >= chunk_rows:
+            yield pending.iloc[:chunk_rows].to_csv(index=False)
+            pending = pending.iloc[chunk_rows:]
+    if pending is not None and len(pending):
+        yield pending.to_csv(index=False)
+
+
+def extract_text(content, client, model):
+    """用一次调用提取整段内容中的表格"""
+    response = client.generate(
+        model=model,
+        prompt=EXTRACT_PROMPT.format(content=content),
+        result_format='message'
+    )
+    if response.status_code != 200:
+        raise APIError(f"API调用失败：{response.message}", response.status_code)
+    return response.output.choices[0].message.content
+
+
+def extract_chunk(content, index, client, model):
+    """提取单个数据块，返回Markdown表格文本"""
+    response = client.generate(
+        model=model,
+        prompt=CHUNK_PROMPT.format(content=content, index=index),
+        result_format='message'
+    )
+    if response.status_code != 200:
+        raise APIError(f"第{index}块API调用失败：{response.message}", response.status_code)
+    return response.output.choices[0].message.content
+
+
+def merge_tables(results):
+    """
+    按顺序合并各块的Markdown表格：保留第一块的表头，去掉后续各块重复的表头和分隔行；
+    某一块没有返回表格时原样保留其内容
+    """
+    merged = []
+    for position, result in enumerate(results):
+        lines = [line.strip() for line in result.strip().splitlines()]
+        rows = [line for line in lines if line.startswith("|")]
+        if not rows:
+            merged.append(result.strip())
+            continue
+        if position > 0 and merged and len(rows) >= 2 and set(rows[1]) <= set("|-: "):
+            rows = rows[2:]
+        merged.extend(rows)
+    return "\n".join(merged)
+
+
+def extract_blocks(blocks, client, model, max_workers=DEFAULT_WORKERS):
+    """
+    并发提取各块并按顺序合并
+
+    块按需从 blocks 中读取，同时在途的块不超过 max_workers 的两倍，
+    blocks 为流式读取的生成器时内存占用与文件大小无关
+
+    Returns:
+        (合并后的Markdown表格, 块数)
+    """
+    results = []
+    in_flight = deque()
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        for index, content in enumerate(blocks, start=1):
+            if len(in_flight) >= max_workers * 2:
+                results.append(in_flight.popleft().result())
+            in_flight.append(executor.submit(extract_chunk, content, index, client, model))
+        # 按提交顺序取结果，合并时无需重新排序
+        results.extend(future.result() for future in in_flight)
+    return merge_tables(results), len(results)
+
+
+def extract_table(df, client, model, chunk_rows=DEFAULT_CHUNK_ROWS, max_workers=DEFAULT_WORKERS):
+    """
+    分块并发提取已读入内存的表格
+
+    Args:
+        df: 待提取的DataFrame
+        client: LLMClient 实例
+        model: 模型名称
+        chunk_rows: 每块行数
+        max_workers: 最大并发请求数
+
+    Returns:
+        (合并后的Markdown表格, 块数)
+    """
+    return extract_blocks(split_table(df, chunk_rows), client, model, max_workers)
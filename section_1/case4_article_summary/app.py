@@ -1,12 +1,28 @@
 import streamlit as st
-import dashscope
 import os
 import requests
 from dotenv import load_dotenv
+import sys
+
+# 引入 section_1 公共模块
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.llm_cache import get_default_cache
+from common.llm_client import LLMClient
+from common.metrics import start_metrics_server
+from summary_prompt import LENGTH_OPTIONS, STYLE_OPTIONS, build_summary_prompt
 
 # 加载环境变量
 load_dotenv()
 
+# 设置了 METRICS_PORT 时暴露Prometheus格式的调用指标
+start_metrics_server()
+
+
+@st.cache_resource
+def get_llm_client(api_key):
+    """按API Key复用大模型客户端，连接池在所有会话间共享"""
+    return LLMClient(api_key, app="case4_article_summary")
+
 # 设置页面配置
 st.set_page_config(
     page_title="文章总结工具",
@@ -28,19 +44,22 @@ with st.sidebar:
     st.markdown("### 总结选项")
     summary_length = st.selectbox(
         "总结长度",
-        ["简短", "中等", "详细"],
+        list(LENGTH_OPTIONS),
         index=1
     )
     
     summary_style = st.selectbox(
         "总结风格",
-        ["学术", "通俗", "新闻", "技术"],
+        list(STYLE_OPTIONS),
         index=1
     )
     
     include_key_points = st.checkbox("包含关键点", value=True)
     include_quotes = st.checkbox("包含重要引用", value=False)
     
+    cache_stats = get_default_cache().stats()
+    st.caption(f"响应缓存：命中 {cache_stats['hits']} 次 / 未命中 {cache_stats['misses']} 次")
+    
     st.markdown("---")
     st.markdown("### 使用说明")
     st.markdown("1. 输入您的阿里云API Key")
@@ -100,44 +119,16 @@ with tab1:
                         
                         st.success(f"成功获取文章内容，长度：{len(text)}字符")
                         
-                        # 设置API key
-                        dashscope.api_key = api_key
+                        # 获取复用的客户端
+                        client = get_llm_client(api_key)
                         
                         # 构建prompt
-                        length_map = {"简短": "100字以内", "中等": "200-300字", "详细": "500字左右"}
-                        style_map = {
-                            "学术": "学术论文风格，注重逻辑性和专业性",
-                            "通俗": "通俗易懂，适合大众阅读",
-                            "新闻": "新闻稿风格，突出重要信息",
-                            "技术": "技术文档风格，注重准确性和实用性"
-                        }
-                        
-                        prompt = f"""
-                        请对以下文章进行智能总结。
-                        
-                        文章内容：
-                        {text[:3000]}  # 限制长度避免token超限
-                        
-                        总结要求：
-                        1. 长度：{length_map[summary_length]}
-                        2. 风格：{style_map[summary_style]}
-                        3. 包含关键点：{'是' if include_key_points else '否'}
-                        4. 包含重要引用：{'是' if include_quotes else '否'}
-                        
-                        请按以下格式输出：
-                        
-                        ## 文章总结
-                        [总结内容]
-                        
-                        ## 主要观点
-                        [关键观点列表]
-                        
-                        ## 核心信息
-                        [核心信息提取]
-                        """
+                        prompt = build_summary_prompt(
+                            text, summary_length, summary_style, include_key_points, include_quotes
+                        )
                         
                         # 调用API
-                        response = dashscope.Generation.call(
+                        response = client.generate(
                             model=model,
                             prompt=prompt,
                             result_format='message'
@@ -207,44 +198,16 @@ with tab2:
             else:
                 with st.spinner("正在总结中..."):
                     try:
-                        # 设置API key
-                        dashscope.api_key = api_key
+                        # 获取复用的客户端
+                        client = get_llm_client(api_key)
                         
                         # 构建prompt
-                        length_map = {"简短": "100字以内", "中等": "200-300字", "详细": "500字左右"}
-                        style_map = {
-                            "学术": "学术论文风格，注重逻辑性和专业性",
-                            "通俗": "通俗易懂，适合大众阅读",
-                            "新闻": "新闻稿风格，突出重要信息",
-                            "技术": "技术文档风格，注重准确性和实用性"
-                        }
-                        
-                        prompt = f"""
-                        请对以下文章进行智能总结。
-                        
-                        文章内容：
-                        {file_content[:3000]}  # 限制长度避免token超限
-                        
-                        总结要求：
-                        1. 长度：{length_map[summary_length]}
-                        2. 风格：{style_map[summary_style]}
-                        3. 包含关键点：{'是' if include_key_points else '否'}
-                        4. 包含重要引用：{'是' if include_quotes else '否'}
-                        
-                        请按以下格式输出：
-                        
-                        ## 文章总结
-                        [总结内容]
-                        
-                        ## 主要观点
-                        [关键观点列表]
-                        
-                        ## 核心信息
-                        [核心信息提取]
-                        """
+                        prompt = build_summary_prompt(
+                            file_content, summary_length, summary_style, include_key_points, include_quotes
+                        )
                         
                         # 调用API
-                        response = dashscope.Generation.call(
+                        response = client.generate(
                             model=model,
                             prompt=prompt,
                             result_format='message'
@@ -0,0 +1,53 @@
+"""
+文章总结的prompt
+URL总结和文件总结共用同一个prompt模板，压测脚本也直接调用这里，保证测到的是应用实际发送的内容
+"""
+
+# 送入模型的文章最大字符数，避免token超限
+MAX_ARTICLE_CHARS = 3000
+
+LENGTH_OPTIONS = {"简短": "100字以内", "中等": "200-300字", "详细": "500字左右"}
+
+STYLE_OPTIONS = {
+    "学术": "学术论文风格，注重逻辑性和专业性",
+    "通俗": "通俗易懂，适合大众阅读",
+    "新闻": "新闻稿风格，突出重要信息",
+    "技术": "技术文档风格，注重准确性和实用性"
+}
+
+
+def build_summary_prompt(text, summary_length="中等", summary_style="通俗", include_key_points=True,
+                         include_quotes=False):
+    """
+    构建文章总结prompt
+
+    Args:
+        text: 文章内容，超过 MAX_ARTICLE_CHARS 的部分截掉
+        summary_length: LENGTH_OPTIONS 中的总结长度
+        summary_style: STYLE_OPTIONS 中的总结风格
+        include_key_points: 是否包含关键点
+        include_quotes: 是否包含重要引用
+    """
+    return f"""
+请对以下文章进行智能总结。
+
+文章内容：
+{text[:MAX_ARTICLE_CHARS]}
+
+总结要求：
+1. 长度：{LENGTH_OPTIONS[summary_length]}
+2. 风格：{STYLE_OPTIONS[summary_style]}
+3. 包含关键点：{'是' if include_key_points else '否'}
+4. 包含重要引用：{'是' if include_quotes else '否'}
+
+请按以下格式输出：
+
+## 文章总结
+[总结内容]
+
+## 主要观点
+[关键观点列表]
+
+## 核心信息
+[核心信息提取]
+"""
@@ -1,16 +1,31 @@
 import streamlit as st
-import dashscope
 import os
 import platform
 import psutil
 import subprocess
 from dotenv import load_dotenv
-import json
 from datetime import datetime
+import sys
+
+# 引入 section_1 公共模块
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.llm_cache import get_default_cache
+from common.llm_client import LLMClient
+from common.metrics import start_metrics_server
+from incident_prompt import build_analysis_prompt, format_system_info
 
 # 加载环境变量
 load_dotenv()
 
+# 设置了 METRICS_PORT 时暴露Prometheus格式的调用指标
+start_metrics_server()
+
+
+@st.cache_resource
+def get_llm_client(api_key):
+    """按API Key复用大模型客户端，连接池在所有会话间共享"""
+    return LLMClient(api_key, app="case5_ops_incident")
+
 # 设置页面配置
 st.set_page_config(
     page_title="系统信息分析助手",
@@ -34,6 +49,9 @@ with st.sidebar:
     include_network = st.checkbox("包含网络信息", value=True)
     include_disk = st.checkbox("包含磁盘信息", value=True)
     
+    cache_stats = get_default_cache().stats()
+    st.caption(f"响应缓存：命中 {cache_stats['hits']} 次 / 未命中 {cache_stats['misses']} 次")
+    
     st.markdown("---")
     st.markdown("### 使用说明")
     st.markdown("1. 输入您的阿里云API Key")
@@ -162,45 +180,15 @@ with col2:
         else:
             with st.spinner("正在分析问题..."):
                 try:
-                    # 设置API key
-                    dashscope.api_key = api_key
+                    # 获取复用的客户端
+                    client = get_llm_client(api_key)
                     
                     # 构建prompt
-                    system_info_text = json.dumps(st.session_state.system_info, ensure_ascii=False, indent=2)
-                    
-                    error_log_text = f"错误日志：{error_log}" if error_log.strip() else ""
-                    
-                    prompt = f"""
-                    请根据以下系统信息和问题描述，提供详细的分析和解决方案。
-                    
-                    系统信息：
-                    {system_info_text}
-                    
-                    问题描述：
-                    {problem_description}
-                    
-                    {error_log_text}
-                    
-                    请按以下格式提供分析结果：
-                    
-                    ## 问题分析
-                    [基于系统信息的问题分析]
-                    
-                    ## 可能原因
-                    [列出可能的原因]
-                    
-                    ## 解决方案
-                    [具体的解决步骤]
-                    
-                    ## 预防措施
-                    [如何避免类似问题]
-                    
-                    ## 相关命令
-                    [可能用到的诊断和修复命令]
-                    """
+                    system_info_text = format_system_info(st.session_state.system_info)
+                    prompt = build_analysis_prompt(st.session_state.system_info, problem_description, error_log)
                     
                     # 调用API
-                    response = dashscope.Generation.call(
+                    response = client.generate(
                         model=model,
                         prompt=prompt,
                         result_format='message'
@@ -0,0 +1,51 @@
+"""
+运维故障分析的prompt
+根据收集到的系统信息、问题描述和错误日志构建分析prompt，压测脚本也直接调用这里，保证测到的是应用实际发送的内容
+"""
+
+import json
+
+
+def format_system_info(system_info):
+    """系统信息格式化为缩进的JSON文本"""
+    return json.dumps(system_info, ensure_ascii=False, indent=2)
+
+
+def build_analysis_prompt(system_info, problem_description, error_log=""):
+    """
+    构建故障分析prompt
+
+    Args:
+        system_info: 系统信息字典
+        problem_description: 问题描述
+        error_log: 错误日志，为空时不写入prompt
+    """
+    error_log_text = f"错误日志：{error_log}" if error_log.strip() else ""
+    return f"""
+请根据以下系统信息和问题描述，提供详细的分析和解决方案。
+
+系统信息：
+{format_system_info(system_info)}
+
+问题描述：
+{problem_description}
+
+{error_log_text}
+
+请按以下格式提供分析结果：
+
+## 问题分析
+[基于系统信息的问题分析]
+
+## 可能原因
+[列出可能的原因]
+
+## 解决方案
+[具体的解决步骤]
+
+## 预防措施
+[如何避免类似问题]
+
+## 相关命令
+[可能用到的诊断和修复命令]
+"""
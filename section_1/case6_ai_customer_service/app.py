@@ -1,13 +1,30 @@
 import streamlit as st
-import dashscope
 import os
 from dotenv import load_dotenv
 import json
+import time
 from datetime import datetime
+import sys
+
+# 引入 section_1 公共模块
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.llm_cache import get_default_cache
+from common.llm_client import LLMClient
+from common.metrics import start_metrics_server
+from conversation_context import ConversationContext
 
 # 加载环境变量
 load_dotenv()
 
+# 设置了 METRICS_PORT 时暴露Prometheus格式的调用指标
+start_metrics_server()
+
+
+@st.cache_resource
+def get_llm_client(api_key):
+    """按API Key复用大模型客户端，连接池在所有会话间共享"""
+    return LLMClient(api_key, app="case6_ai_customer_service")
+
 # 设置页面配置
 st.set_page_config(
     page_title="AI智能客服",
@@ -45,6 +62,15 @@ with st.sidebar:
         index=0
     )
     
+    stream_output = st.checkbox("流式输出", value=True, help="边生成边显示回复，降低等待感")
+    context_budget = st.slider(
+        "上下文token预算", 500, 8000, 2000, step=500,
+        help="超出预算时，较早的对话会被压缩成摘要，保证每轮prompt长度可控"
+    )
+    
+    cache_stats = get_default_cache().stats()
+    st.caption(f"响应缓存：命中 {cache_stats['hits']} 次 / 未命中 {cache_stats['misses']} 次")
+    
     st.markdown("---")
     st.markdown("### 使用说明")
     st.markdown("1. 输入您的阿里云API Key")
@@ -62,6 +88,105 @@ if "chat_history" not in st.session_state:
 if "quick_reply" not in st.session_state:
     st.session_state.quick_reply = None
 
+if "context" not in st.session_state:
+    st.session_state.context = ConversationContext()
+st.session_state.context.budget = context_budget
+
+# 构建系统提示
+SYSTEM_PROMPTS = {
+    "电商客服": "你是一个专业的电商客服，熟悉产品知识、订单处理、退换货政策等。请用友好、专业的态度回答客户问题。",
+    "技术支持": "你是一个技术专家，能够解决各种技术问题，包括软件使用、系统故障、网络问题等。请提供准确、详细的技术支持。",
+    "银行服务": "你是一个银行客服代表，熟悉各种银行业务，包括开户、转账、理财、贷款等。请提供专业、安全的金融服务咨询。",
+    "保险咨询": "你是一个保险顾问，了解各种保险产品，包括人寿保险、健康保险、车险等。请为客户提供专业的保险建议。",
+    "教育咨询": "你是一个教育顾问，熟悉各种教育课程、学习方法、考试信息等。请为学生和家长提供教育咨询服务。",
+    "通用客服": "你是一个专业的客服代表，能够处理各种客户咨询和问题。请用友好、专业的态度为客户提供帮助。"
+}
+
+PERSONALITY_PROMPTS = {
+    "专业严谨": "请保持专业、严谨的态度，提供准确、详细的信息。",
+    "友好亲切": "请用友好、亲切的语气，让客户感受到温暖和关怀。",
+    "幽默风趣": "请在回答中适当加入幽默元素，让对话更加轻松愉快。",
+    "简洁高效": "请提供简洁、高效的回复，直接回答客户问题。"
+}
+
+
+def format_latency(latency):
+    """格式化单条回复的延迟信息"""
+    return f"首字延迟 {latency['ttft']:.2f}s · 总耗时 {latency['total']:.2f}s"
+
+
+def respond(prompt):
+    """添加用户消息，生成并渲染AI回复"""
+    # 添加用户消息
+    st.session_state.messages.append({"role": "user", "content": prompt})
+    st.session_state.context.append("user", prompt)
+    with st.chat_message("user"):
+        st.markdown(prompt)
+    
+    if not api_key:
+        st.error("请输入阿里云API Key")
+        return
+    
+    with st.chat_message("assistant"):
+        placeholder = st.empty()
+        placeholder.markdown("正在思考...")
+        try:
+            # 获取复用的客户端
+            client = get_llm_client(api_key)
+            
+            system_content = f"{SYSTEM_PROMPTS[service_type]} {PERSONALITY_PROMPTS[personality]}"
+            
+            # 构建对话历史：超出token预算时先把早期对话折叠进摘要
+            def summarize(summary_prompt):
+                return client.generate(model=model, prompt=summary_prompt).text
+            
+            context = st.session_state.context
+            context.compact(summarize)
+            conversation_history = context.build_prompt(system_content)
+            
+            start_time = time.time()
+            if stream_output:
+                # 流式输出：收到第一个片段即开始渲染
+                first_token_time = None
+                assistant_response = ""
+                for chunk in client.stream_generate(model=model, prompt=conversation_history):
+                    if first_token_time is None:
+                        first_token_time = time.time() - start_time
+                    assistant_response += chunk
+                    placeholder.markdown(assistant_response + "▌")
+            else:
+                response = client.generate(
+                    model=model,
+                    prompt=conversation_history,
+                    result_format='message'
+                )
+                if response.status_code != 200:
+                    raise RuntimeError(response.message)
+                assistant_response = response.output.choices[0].message.content
+                first_token_time = None
+            
+            total_time = time.time() - start_time
+            latency = {"ttft": first_token_time if first_token_time is not None else total_time, "total": total_time}
+            
+            # 添加助手回复
+            placeholder.markdown(assistant_response)
+            st.caption(format_latency(latency))
+            st.session_state.messages.append({"role": "assistant", "content": assistant_response, "latency": latency})
+            context.append("assistant", assistant_response)
+            
+            # 保存对话历史
+            st.session_state.chat_history.append({
+                "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                "user": prompt,
+                "assistant": assistant_response,
+                "service_type": service_type
+            })
+            
+        except Exception as e:
+            error_msg = f"抱歉，我遇到了一些问题：{str(e)}"
+            st.session_state.messages.append({"role": "assistant", "content": error_msg})
+            placeholder.error(error_msg)
+
 # 主界面
 col1, col2 = st.columns([2, 1])
 
@@ -72,153 +197,18 @@ with col1:
     if st.session_state.quick_reply:
         prompt = st.session_state.quick_reply
         st.session_state.quick_reply = None  # 清除快速回复状态
-        
-        # 添加用户消息
-        st.session_state.messages.append({"role": "user", "content": prompt})
-        with st.chat_message("user"):
-            st.markdown(prompt)
-        
-        # 生成AI回复
-        if api_key:
-            with st.chat_message("assistant"):
-                with st.spinner("正在思考..."):
-                    try:
-                        # 设置API key
-                        dashscope.api_key = api_key
-                        
-                        # 构建系统提示
-                        system_prompts = {
-                            "电商客服": "你是一个专业的电商客服，熟悉产品知识、订单处理、退换货政策等。请用友好、专业的态度回答客户问题。",
-                            "技术支持": "你是一个技术专家，能够解决各种技术问题，包括软件使用、系统故障、网络问题等。请提供准确、详细的技术支持。",
-                            "银行服务": "你是一个银行客服代表，熟悉各种银行业务，包括开户、转账、理财、贷款等。请提供专业、安全的金融服务咨询。",
-                            "保险咨询": "你是一个保险顾问，了解各种保险产品，包括人寿保险、健康保险、车险等。请为客户提供专业的保险建议。",
-                            "教育咨询": "你是一个教育顾问，熟悉各种教育课程、学习方法、考试信息等。请为学生和家长提供教育咨询服务。",
-                            "通用客服": "你是一个专业的客服代表，能够处理各种客户咨询和问题。请用友好、专业的态度为客户提供帮助。"
-                        }
-                        
-                        personality_prompts = {
-                            "专业严谨": "请保持专业、严谨的态度，提供准确、详细的信息。",
-                            "友好亲切": "请用友好、亲切的语气，让客户感受到温暖和关怀。",
-                            "幽默风趣": "请在回答中适当加入幽默元素，让对话更加轻松愉快。",
-                            "简洁高效": "请提供简洁、高效的回复，直接回答客户问题。"
-                        }
-                        
-                        system_content = f"{system_prompts[service_type]} {personality_prompts[personality]}"
-                        
-                        # 构建对话历史
-                        conversation_history = f"系统角色：{system_content}\n\n"
-                        for msg in st.session_state.messages[-10:]:  # 保留最近10条消息
-                            conversation_history += f"{msg['role']}: {msg['content']}\n"
-                        
-                        # 调用API
-                        response = dashscope.Generation.call(
-                            model=model,
-                            prompt=conversation_history,
-                            result_format='message'
-                        )
-                        
-                        if response.status_code == 200:
-                            assistant_response = response.output.choices[0].message.content
-                            
-                            # 添加助手回复
-                            st.session_state.messages.append({"role": "assistant", "content": assistant_response})
-                            st.markdown(assistant_response)
-                            
-                            # 保存对话历史
-                            st.session_state.chat_history.append({
-                                "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                                "user": prompt,
-                                "assistant": assistant_response,
-                                "service_type": service_type
-                            })
-                        else:
-                            error_msg = f"抱歉，我遇到了一些问题：{response.message}"
-                            st.session_state.messages.append({"role": "assistant", "content": error_msg})
-                            st.error(error_msg)
-                        
-                    except Exception as e:
-                        error_msg = f"抱歉，我遇到了一些问题：{str(e)}"
-                        st.session_state.messages.append({"role": "assistant", "content": error_msg})
-                        st.error(error_msg)
-        else:
-            st.error("请输入阿里云API Key")
+        respond(prompt)
     
     # 显示对话历史
     for message in st.session_state.messages:
         with st.chat_message(message["role"]):
             st.markdown(message["content"])
+            if "latency" in message:
+                st.caption(format_latency(message["latency"]))
     
     # 用户输入
     if prompt := st.chat_input("请输入您的问题..."):
-        # 添加用户消息
-        st.session_state.messages.append({"role": "user", "content": prompt})
-        with st.chat_message("user"):
-            st.markdown(prompt)
-        
-        # 生成AI回复
-        if api_key:
-            with st.chat_message("assistant"):
-                with st.spinner("正在思考..."):
-                    try:
-                        # 设置API key
-                        dashscope.api_key = api_key
-                        
-                        # 构建系统提示
-                        system_prompts = {
-                            "电商客服": "你是一个专业的电商客服，熟悉产品知识、订单处理、退换货政策等。请用友好、专业的态度回答客户问题。",
-                            "技术支持": "你是一个技术专家，能够解决各种技术问题，包括软件使用、系统故障、网络问题等。请提供准确、详细的技术支持。",
-                            "银行服务": "你是一个银行客服代表，熟悉各种银行业务，包括开户、转账、理财、贷款等。请提供专业、安全的金融服务咨询。",
-                            "保险咨询": "你是一个保险顾问，了解各种保险产品，包括人寿保险、健康保险、车险等。请为客户提供专业的保险建议。",
-                            "教育咨询": "你是一个教育顾问，熟悉各种教育课程、学习方法、考试信息等。请为学生和家长提供教育咨询服务。",
-                            "通用客服": "你是一个专业的客服代表，能够处理各种客户咨询和问题。请用友好、专业的态度为客户提供帮助。"
-                        }
-                        
-                        personality_prompts = {
-                            "专业严谨": "请保持专业、严谨的态度，提供准确、详细的信息。",
-                            "友好亲切": "请用友好、亲切的语气，让客户感受到温暖和关怀。",
-                            "幽默风趣": "请在回答中适当加入幽默元素，让对话更加轻松愉快。",
-                            "简洁高效": "请提供简洁、高效的回复，直接回答客户问题。"
-                        }
-                        
-                        system_content = f"{system_prompts[service_type]} {personality_prompts[personality]}"
-                        
-                        # 构建对话历史
-                        conversation_history = f"系统角色：{system_content}\n\n"
-                        for msg in st.session_state.messages[-10:]:  # 保留最近10条消息
-                            conversation_history += f"{msg['role']}: {msg['content']}\n"
-                        
-                        # 调用API
-                        response = dashscope.Generation.call(
-                            model=model,
-                            prompt=conversation_history,
-                            result_format='message'
-                        )
-                        
-                        if response.status_code == 200:
-                            assistant_response = response.output.choices[0].message.content
-                            
-                            # 添加助手回复
-                            st.session_state.messages.append({"role": "assistant", "content": assistant_response})
-                            st.markdown(assistant_response)
-                            
-                            # 保存对话历史
-                            st.session_state.chat_history.append({
-                                "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                                "user": prompt,
-                                "assistant": assistant_response,
-                                "service_type": service_type
-                            })
-                        else:
-                            error_msg = f"抱歉，我遇到了一些问题：{response.message}"
-                            st.session_state.messages.append({"role": "assistant", "content": error_msg})
-                            st.error(error_msg)
-                        
-                    except Exception as e:
-                        error_msg = f"抱歉，我遇到了一些问题：{str(e)}"
-                        st.session_state.messages.append({"role": "assistant", "content": error_msg})
-                        st.error(error_msg)
-        else:
-            st.error("请输入阿里云API Key")
+        respond(prompt)
 
 with col2:
     st.subheader("📊 对话统计")
@@ -232,6 +222,18 @@ with col2:
         st.metric("总对话数", total_messages)
         st.metric("用户消息", user_messages)
         st.metric("AI回复", assistant_messages)
+        
+        latencies = [m["latency"] for m in st.session_state.messages if "latency" in m]
+        if latencies:
+            st.metric("平均首字延迟", f"{sum(l['ttft'] for l in latencies) / len(latencies):.2f}s")
+            st.metric("平均总耗时", f"{sum(l['total'] for l in latencies) / len(latencies):.2f}s")
+        
+        context = st.session_state.context
+        st.metric("上下文token", f"{context.total_tokens}/{context.budget}")
+        if context.folded_count:
+            st.caption(f"已有 {context.folded_count} 条早期消息折叠进摘要")
+        if context.dropped_count:
+            st.caption(f"已有 {context.dropped_count} 条早期消息超出预算被直接丢弃，未进入摘要")
     
     st.markdown("---")
     
@@ -272,6 +274,7 @@ with col_manage1:
     if st.button("🗑️ 清空对话"):
         st.session_state.messages = []
         st.session_state.chat_history = []
+        st.session_state.context.clear()
         st.rerun()
 
 with col_manage2:
@@ -321,8 +324,8 @@ if service_type in knowledge_topics:
         else:
             with st.spinner("正在获取相关知识..."):
                 try:
-                    # 设置API key
-                    dashscope.api_key = api_key
+                    # 获取复用的客户端
+                    client = get_llm_client(api_key)
                     
                     knowledge_prompt = f"""
                     请提供关于"{selected_knowledge}"的详细知识，包括：
@@ -333,7 +336,7 @@ if service_type in knowledge_topics:
                     5. 相关链接
                     """
                     
-                    knowledge_response = dashscope.Generation.call(
+                    knowledge_response = client.generate(
                         model=model,
                         prompt=knowledge_prompt,
                         result_format='message'
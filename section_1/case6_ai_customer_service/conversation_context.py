@@ -0,0 +1,173 @@
+"""
+对话上下文管理
+按token预算维护多轮对话：最近的消息保留原文，超出预算的早期消息折叠进滚动摘要，
+使每轮prompt的长度有上限且可预期
+"""
+
+import math
+import re
+
+# 中日韩字符和全角标点，大致按每字1个token估算
+CJK_PATTERN = re.compile(r"[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uff00-\uffef]")
+
+SUMMARY_PROMPT = """
+请把以下客服对话压缩成一段摘要，供后续对话参考。
+要求：保留客户的诉求、已提供的关键信息（订单号、账号、产品等）和客服已给出的结论，不要编造内容，不超过{max_chars}字。
+
+已有摘要：
+{summary}
+
+需要并入摘要的对话：
+{dialogue}
+"""
+
+
+def estimate_tokens(text):
+    """粗略估算token数：中文按字计，其余按每4个字符1个token计"""
+    cjk = len(CJK_PATTERN.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+
+# 被截断的消息末尾追加的标记
+TRUNCATED_MARK = "…（已截断）"
+
+
+def clip_tokens(text, max_tokens, keep_end=False):
+    """
+    截断文本使估算的token数不超过 max_tokens
+
+    Args:
+        keep_end: 为True时保留末尾部分，否则保留开头部分
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    cjk = other = count = 0
+    for char in (reversed(text) if keep_end else text):
+        if CJK_PATTERN.match(char):
+            cjk += 1
+        else:
+            other += 1
+        if cjk + math.ceil(other / 4) > max_tokens:
+            break
+        count += 1
+    if count == 0:
+        return ""
+    return text[-count:] if keep_end else text[:count]
+
+
+def format_message(message):
+    """把单条消息格式化为prompt中的一行"""
+    return f"{message['role']}: {message['content']}\n"
+
+
+class ConversationContext:
+    """带token预算的对话上下文"""
+
+    def __init__(self, budget=2000, keep_recent=4):
+        """
+        Args:
+            budget: 对话部分（摘要+原文消息）的token预算，不含系统角色
+            keep_recent: 无论是否超出预算，至少保留原文的最近消息条数
+        """
+        self.budget = budget
+        self.keep_recent = keep_recent
+        self.messages = []
+        self.message_tokens = 0
+        self.summary = ""
+        self.summary_tokens = 0
+        self.folded_count = 0
+        # 超出预算、未进入摘要就被丢弃的消息数
+        self.dropped_count = 0
+
+    @property
+    def total_tokens(self):
+        """当前上下文的token数"""
+        return self.message_tokens + self.summary_tokens
+
+    def append(self, role, content):
+        """追加一条消息并累加token计数"""
+        message = {"role": role, "content": content}
+        tokens = estimate_tokens(format_message(message))
+        self.messages.append((message, tokens))
+        self.message_tokens += tokens
+
+    def compact(self, summarize=None):
+        """
+        超出预算时把最早的消息折叠进摘要；摘要和保留的最近消息仍超出预算时截断，
+        保证 total_tokens 不超过预算
+
+        Args:
+            summarize: 摘要函数，参数为摘要prompt，返回摘要文本；
+                为None或调用失败时退化为截断拼接，保证预算仍然生效
+        """
+        if self.total_tokens <= self.budget:
+            return
+
+        # 摘要最多占用预算的三分之一，其余留给原文消息
+        summary_budget = self.budget // 3
+        folded = []
+        while len(self.messages) > self.keep_recent and self.message_tokens + summary_budget > self.budget:
+            message, tokens = self.messages.pop(0)
+            self.message_tokens -= tokens
+            folded.append(message)
+
+        if folded:
+            dialogue = "".join(format_message(m) for m in folded)
+            summary = None
+            if summarize is not None:
+                try:
+                    summary = summarize(SUMMARY_PROMPT.format(
+                        max_chars=summary_budget,
+                        summary=self.summary or "（无）",
+                        dialogue=dialogue
+                    ))
+                except Exception:
+                    summary = None
+            if summary:
+                # 模型不一定遵守字数要求，超出部分直接截掉
+                summary = clip_tokens(summary.strip(), summary_budget)
+            else:
+                summary = clip_tokens((self.summary + "\n" + dialogue).strip(), summary_budget, keep_end=True)
+
+            self.summary = summary.strip()
+            self.summary_tokens = estimate_tokens(self.summary)
+            self.folded_count += len(folded)
+
+        self._trim_messages()
+
+    def _trim_messages(self):
+        """保留的最近消息本身超出预算时，从最早的一条开始截断，放不下的早期消息直接丢弃，最新一条始终保留"""
+        while self.total_tokens > self.budget and self.messages:
+            message, tokens = self.messages[0]
+            available = self.budget - (self.total_tokens - tokens)
+            content = clip_tokens(
+                message["content"],
+                available - estimate_tokens(format_message({"role": message["role"], "content": TRUNCATED_MARK}))
+            )
+            if not content and len(self.messages) > 1:
+                self.messages.pop(0)
+                self.message_tokens -= tokens
+                self.dropped_count += 1
+                continue
+            trimmed = {"role": message["role"], "content": content + TRUNCATED_MARK}
+            trimmed_tokens = estimate_tokens(format_message(trimmed))
+            self.messages[0] = (trimmed, trimmed_tokens)
+            self.message_tokens += trimmed_tokens - tokens
+            break
+
+    def build_prompt(self, system_content):
+        """拼接系统角色、滚动摘要和最近消息"""
+        prompt = f"系统角色：{system_content}\n\n"
+        if self.summary:
+            prompt += f"此前对话摘要：{self.summary}\n\n"
+        prompt += "".join(format_message(message) for message, _ in self.messages)
+        return prompt
+
+    def clear(self):
+        """清空上下文"""
+        self.messages = []
+        self.message_tokens = 0
+        self.summary = ""
+        self.summary_tokens = 0
+        self.folded_count = 0
+        self.dropped_count = 0
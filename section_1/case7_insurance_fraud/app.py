@@ -1,5 +1,4 @@
 import streamlit as st
-import dashscope
 import os
 import pandas as pd
 import numpy as np
@@ -9,14 +8,30 @@ from sklearn.preprocessing import LabelEncoder, StandardScaler
 from sklearn.metrics import classification_report, confusion_matrix, accuracy_score
 import pickle
 from dotenv import load_dotenv
-import json
 from datetime import datetime
 import plotly.express as px
 import plotly.graph_objects as go
+import sys
+
+# 引入 section_1 公共模块
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.llm_cache import get_default_cache
+from common.llm_client import LLMClient
+from common.metrics import start_metrics_server
+from fraud_prompt import build_fraud_prompt
 
 # 加载环境变量
 load_dotenv()
 
+# 设置了 METRICS_PORT 时暴露Prometheus格式的调用指标
+start_metrics_server()
+
+
+@st.cache_resource
+def get_llm_client(api_key):
+    """按API Key复用大模型客户端，连接池在所有会话间共享"""
+    return LLMClient(api_key, app="case7_insurance_fraud")
+
 # 设置页面配置
 st.set_page_config(
     page_title="保险欺诈检测系统",
@@ -39,6 +54,9 @@ with st.sidebar:
     test_size = st.slider("测试集比例", 0.1, 0.5, 0.2, 0.1)
     random_state = st.number_input("随机种子", value=42, min_value=1, max_value=1000)
     
+    cache_stats = get_default_cache().stats()
+    st.caption(f"响应缓存：命中 {cache_stats['hits']} 次 / 未命中 {cache_stats['misses']} 次")
+    
     st.markdown("---")
     st.markdown("### 使用说明")
     st.markdown("1. 输入您的阿里云API Key")
@@ -349,26 +367,11 @@ with tab2:
                     # 详细分析
                     if api_key:
                         try:
-                            dashscope.api_key = api_key
-                            
-                            analysis_prompt = f"""
-                            请分析以下保险理赔数据的欺诈风险：
-                            
-                            理赔数据：
-                            {json.dumps(input_data, ensure_ascii=False, indent=2)}
-                            
-                            检测结果：
-                            - 风险等级：{risk_level}
-                            - 欺诈概率：{fraud_probability:.2%}
+                            client = get_llm_client(api_key)
                             
-                            请提供：
-                            1. 风险因素分析
-                            2. 可疑指标识别
-                            3. 建议措施
-                            4. 进一步调查建议
-                            """
+                            analysis_prompt = build_fraud_prompt(input_data, risk_level, fraud_probability)
                             
-                            response = dashscope.Generation.call(
+                            response = client.generate(
                                 model="qwen-turbo",
                                 prompt=analysis_prompt,
                                 result_format='message'
@@ -0,0 +1,33 @@
+"""
+保险欺诈风险分析的prompt
+把理赔数据和模型检测结果交给大模型解读，压测脚本也直接调用这里，保证测到的是应用实际发送的内容
+"""
+
+import json
+
+
+def build_fraud_prompt(claim, risk_level, fraud_probability):
+    """
+    构建欺诈风险分析prompt
+
+    Args:
+        claim: 理赔数据字典
+        risk_level: 风险等级（高风险/低风险）
+        fraud_probability: 模型给出的欺诈概率（0-1）
+    """
+    return f"""
+请分析以下保险理赔数据的欺诈风险：
+
+理赔数据：
+{json.dumps(claim, ensure_ascii=False, indent=2)}
+
+检测结果：
+- 风险等级：{risk_level}
+- 欺诈概率：{fraud_probability:.2%}
+
+请提供：
+1. 风险因素分析
+2. 可疑指标识别
+3. 建议措施
+4. 进一步调查建议
+"""
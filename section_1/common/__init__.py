@@ -0,0 +1,3 @@
+"""
+Section 1 各案例共享的公共模块
+"""
@@ -0,0 +1,190 @@
+"""
+大模型响应缓存
+两级缓存：进程内LRU + 磁盘SQLite，支持TTL过期和按条数/体积淘汰，并统计命中率
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# 默认缓存目录，可通过环境变量 LLM_CACHE_DIR 覆盖
+DEFAULT_CACHE_DIR = os.getenv(
+    "LLM_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".cache")
+)
+
+
+def normalize_prompt(prompt):
+    """规范化prompt：去掉每行首尾空白，避免f-string缩进差异导致缓存未命中"""
+    if isinstance(prompt, str):
+        return "\n".join(line.strip() for line in prompt.strip().splitlines())
+    if isinstance(prompt, list):
+        return [
+            {**item, "content": normalize_prompt(item["content"])} if isinstance(item, dict) and "content" in item else item
+            for item in prompt
+        ]
+    return prompt
+
+
+def make_key(model, prompt, **params):
+    """根据 (模型, 规范化prompt, 调用参数) 生成缓存键"""
+    payload = json.dumps(
+        {"model": model, "prompt": normalize_prompt(prompt), "params": params},
+        ensure_ascii=False,
+        sort_keys=True,
+        default=str
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    """两级响应缓存（线程安全）"""
+
+    def __init__(self, path=None, ttl=24 * 3600, max_memory_items=256,
+                 max_disk_items=10000, max_disk_bytes=100 * 1024 * 1024):
+        """
+        Args:
+            path: SQLite文件路径，默认位于 DEFAULT_CACHE_DIR/llm_cache.sqlite3
+            ttl: 缓存有效期（秒）
+            max_memory_items: 内存LRU最多保留的条数
+            max_disk_items: 磁盘缓存最多保留的条数
+            max_disk_bytes: 磁盘缓存最多占用的字节数
+        """
+        self.path = path or os.path.join(DEFAULT_CACHE_DIR, "llm_cache.sqlite3")
+        self.ttl = ttl
+        self.max_memory_items = max_memory_items
+        self.max_disk_items = max_disk_items
+        self.max_disk_bytes = max_disk_bytes
+
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "memory_hits": 0, "disk_hits": 0, "evictions": 0}
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS cache (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_accessed ON cache (accessed)")
+        self._conn.commit()
+
+    def get(self, key):
+        """读取缓存，未命中或已过期返回None"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                created, value = entry
+                if now - created < self.ttl:
+                    self._memory.move_to_end(key)
+                    self._stats["hits"] += 1
+                    self._stats["memory_hits"] += 1
+                    return value
+                del self._memory[key]
+
+            row = self._conn.execute(
+                "SELECT value, created FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None:
+                value, created = row
+                if now - created < self.ttl:
+                    self._conn.execute("UPDATE cache SET accessed = ? WHERE key = ?", (now, key))
+                    self._conn.commit()
+                    value = json.loads(value)
+                    self._remember(key, created, value)
+                    self._stats["hits"] += 1
+                    self._stats["disk_hits"] += 1
+                    return value
+                self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                self._conn.commit()
+
+            self._stats["misses"] += 1
+            return None
+
+    def set(self, key, value):
+        """写入缓存，value需可JSON序列化"""
+        now = time.time()
+        data = json.dumps(value, ensure_ascii=False)
+        with self._lock:
+            self._remember(key, now, value)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, data, len(data.encode("utf-8")), now, now)
+            )
+            self._evict_disk(now)
+            self._conn.commit()
+
+    def clear(self):
+        """清空两级缓存"""
+        with self._lock:
+            self._memory.clear()
+            self._conn.execute("DELETE FROM cache")
+            self._conn.commit()
+
+    def stats(self):
+        """返回命中统计和当前缓存规模"""
+        with self._lock:
+            disk_items, disk_bytes = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache"
+            ).fetchone()
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                **self._stats,
+                "hit_rate": self._stats["hits"] / lookups if lookups else 0.0,
+                "memory_items": len(self._memory),
+                "disk_items": disk_items,
+                "disk_bytes": disk_bytes
+            }
+
+    def _remember(self, key, created, value):
+        self._memory[key] = (created, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+
+    def _evict_disk(self, now):
+        # 先清理过期条目，再按最近访问时间淘汰超出条数/体积限制的部分
+        self._conn.execute("DELETE FROM cache WHERE created <= ?", (now - self.ttl,))
+        count, total = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache"
+        ).fetchone()
+        if count <= self.max_disk_items and total <= self.max_disk_bytes:
+            return
+
+        rows = self._conn.execute("SELECT key, size FROM cache ORDER BY accessed").fetchall()
+        evicted = []
+        for key, size in rows:
+            if count <= self.max_disk_items and total <= self.max_disk_bytes:
+                break
+            evicted.append((key,))
+            count -= 1
+            total -= size
+        self._conn.executemany("DELETE FROM cache WHERE key = ?", evicted)
+        self._stats["evictions"] += len(evicted)
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_default_cache():
+    """获取进程内共享的默认缓存实例"""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = LLMCache()
+        return _default_cache
+
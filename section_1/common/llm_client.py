@@ -0,0 +1,237 @@
+"""
+DashScope 大模型客户端
+每个实例持有独立的API Key和带keep-alive连接池的HTTP会话，可在多个线程和Streamlit会话间复用，
+避免修改进程级的 dashscope.api_key
+"""
+
+import asyncio
+import base64
+import json
+import os
+import time
+from types import SimpleNamespace
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from common.llm_cache import get_default_cache, make_key
+from common.metrics import LLM_FIRST_TOKEN, record_call
+
+# DashScope服务地址，可通过环境变量 DASHSCOPE_BASE_URL 覆盖（例如指向本地模拟服务）
+DEFAULT_BASE_URL = os.getenv("DASHSCOPE_BASE_URL", "https://dashscope.aliyuncs.com/api/v1")
+GENERATION_PATH = "/services/aigc/text-generation/generation"
+MULTIMODAL_PATH = "/services/aigc/multimodal-generation/generation"
+
+
+class LLMResponse:
+    """与 dashscope SDK 响应保持相同访问方式的轻量响应对象"""
+
+    def __init__(self, status_code, content=None, message="", code="", usage=None,
+                 request_id="", finish_reason="stop", from_cache=False):
+        self.status_code = status_code
+        self.code = code
+        self.message = message
+        self.request_id = request_id
+        self.usage = usage or {}
+        self.from_cache = from_cache
+        self.output = None
+        if content is not None:
+            message_obj = SimpleNamespace(role="assistant", content=content)
+            self.output = SimpleNamespace(
+                choices=[SimpleNamespace(finish_reason=finish_reason, message=message_obj)]
+            )
+
+    @property
+    def text(self):
+        """回复的文本内容，多模态回复会拼接所有文本片段"""
+        if self.output is None:
+            return ""
+        content = self.output.choices[0].message.content
+        if isinstance(content, list):
+            return "".join(item.get("text", "") for item in content if isinstance(item, dict))
+        return content or ""
+
+
+def image_to_data_uri(data, mime="image/jpeg"):
+    """把图片字节编码为多模态接口可直接使用的data URI"""
+    return f"data:{mime};base64,{base64.b64encode(data).decode('ascii')}"
+
+
+class LLMClient:
+    """线程安全、带连接池的DashScope客户端，提供同步和asyncio两套接口"""
+
+    def __init__(self, api_key, base_url=None, pool_size=16, timeout=60, cache=None, app="default"):
+        """
+        Args:
+            api_key: 阿里云API Key（仅对当前实例生效）
+            base_url: 服务地址，默认 DEFAULT_BASE_URL
+            pool_size: 连接池大小，应不小于最大并发数
+            timeout: 单次请求超时时间（秒）
+            cache: 响应缓存，默认使用进程共享的 get_default_cache()
+            app: 应用名称，作为调用指标的标签
+        """
+        self.app = app
+        self.base_url = (base_url or DEFAULT_BASE_URL).rstrip("/")
+        self.timeout = timeout
+        self.cache = cache or get_default_cache()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json"
+        })
+
+    def generate(self, model, prompt=None, messages=None, use_cache=True, **parameters):
+        """
+        文本生成
+
+        Args:
+            model: 模型名称
+            prompt: 单轮提示词
+            messages: 多轮消息列表，与prompt二选一
+            use_cache: 是否先查询响应缓存
+            **parameters: 其他生成参数（temperature、max_tokens等）
+
+        Returns:
+            LLMResponse
+        """
+        parameters.setdefault("result_format", "message")
+        model_input = {"messages": messages} if messages is not None else {"prompt": prompt}
+        return self._call(GENERATION_PATH, model, model_input, parameters, use_cache)
+
+    def stream_generate(self, model, prompt=None, messages=None, use_cache=True, **parameters):
+        """
+        流式文本生成（SSE），逐段产出新增的文本
+
+        与 generate 共用缓存：命中时一次性产出完整回复，生成结束后写入缓存。
+        """
+        parameters.setdefault("result_format", "message")
+        model_input = {"messages": messages} if messages is not None else {"prompt": prompt}
+        key = self._cache_key(GENERATION_PATH, model, model_input, parameters)
+
+        if use_cache:
+            value = self.cache.get(key)
+            if value is not None:
+                record_call(self.app, model, "cache")
+                yield value["content"]
+                return
+
+        start = time.perf_counter()
+        try:
+            response = self.session.post(
+                self.base_url + GENERATION_PATH,
+                json={"model": model, "input": model_input, "parameters": {**parameters, "incremental_output": True}},
+                headers={"X-DashScope-SSE": "enable", "Accept": "text/event-stream"},
+                stream=True,
+                timeout=self.timeout
+            )
+        except requests.RequestException:
+            record_call(self.app, model, "error", time.perf_counter() - start)
+            raise
+
+        with response:
+            if response.status_code != 200:
+                record_call(self.app, model, response.status_code, time.perf_counter() - start)
+                try:
+                    message = response.json().get("message", "")
+                except ValueError:
+                    message = response.text
+                raise RuntimeError(f"API调用失败：{message}")
+
+            chunks, usage = [], {}
+            for line in response.iter_lines():
+                # 按字节读取后再解码，避免text/event-stream缺少charset时中文乱码
+                line = line.decode("utf-8")
+                if not line.startswith("data:"):
+                    continue
+                data = json.loads(line[5:])
+                if "output" not in data:
+                    record_call(self.app, model, data.get("code") or "error", time.perf_counter() - start)
+                    raise RuntimeError(f"API调用失败：{data.get('message', '')}")
+                usage = data.get("usage", usage)
+                delta = data["output"]["choices"][0]["message"]["content"]
+                if delta:
+                    if not chunks:
+                        LLM_FIRST_TOKEN.observe(time.perf_counter() - start, app=self.app, model=model)
+                    chunks.append(delta)
+                    yield delta
+
+        record_call(self.app, model, 200, time.perf_counter() - start, usage)
+        self.cache.set(key, {"content": "".join(chunks), "usage": usage})
+
+    def multimodal(self, model, messages, use_cache=False, **parameters):
+        """
+        多模态对话，图片内容可以是URL或 image_to_data_uri() 生成的data URI
+
+        Returns:
+            LLMResponse
+        """
+        return self._call(MULTIMODAL_PATH, model, {"messages": messages}, parameters, use_cache)
+
+    async def agenerate(self, model, prompt=None, messages=None, use_cache=True, **parameters):
+        """generate 的asyncio版本，在线程池中复用同一个连接池"""
+        return await asyncio.to_thread(
+            self.generate, model, prompt=prompt, messages=messages, use_cache=use_cache, **parameters
+        )
+
+    async def amultimodal(self, model, messages, use_cache=False, **parameters):
+        """multimodal 的asyncio版本"""
+        return await asyncio.to_thread(
+            self.multimodal, model, messages, use_cache=use_cache, **parameters
+        )
+
+    def close(self):
+        """关闭连接池"""
+        self.session.close()
+
+    def _cache_key(self, path, model, model_input, parameters):
+        return make_key(model, model_input.get("prompt", model_input.get("messages")), path=path, **parameters)
+
+    def _call(self, path, model, model_input, parameters, use_cache):
+        key = self._cache_key(path, model, model_input, parameters)
+        if use_cache:
+            value = self.cache.get(key)
+            if value is not None:
+                record_call(self.app, model, "cache")
+                return LLMResponse(200, value["content"], usage=value.get("usage"), from_cache=True)
+
+        start = time.perf_counter()
+        try:
+            response = self.session.post(
+                self.base_url + path,
+                json={"model": model, "input": model_input, "parameters": parameters},
+                timeout=self.timeout
+            )
+        except requests.RequestException:
+            record_call(self.app, model, "error", time.perf_counter() - start)
+            raise
+        latency = time.perf_counter() - start
+
+        try:
+            data = response.json()
+        except ValueError:
+            data = {"message": response.text}
+
+        if response.status_code != 200:
+            record_call(self.app, model, response.status_code, latency)
+            return LLMResponse(
+                response.status_code,
+                message=data.get("message", ""),
+                code=data.get("code", ""),
+                request_id=data.get("request_id", "")
+            )
+
+        choice = data["output"]["choices"][0]
+        result = LLMResponse(
+            200,
+            choice["message"]["content"],
+            usage=data.get("usage"),
+            request_id=data.get("request_id", ""),
+            finish_reason=choice.get("finish_reason", "stop")
+        )
+        record_call(self.app, model, 200, latency, result.usage)
+        self.cache.set(key, {"content": choice["message"]["content"], "usage": result.usage})
+        return result
@@ -0,0 +1,193 @@
+"""
+大模型调用指标
+进程内汇总每次调用的延迟、状态码和token用量，并以Prometheus文本格式通过HTTP暴露，
+便于对延迟回归和费用异常设置告警
+
+用法：
+    METRICS_PORT=9100 streamlit run case1_sentiment_analysis/app.py
+    curl http://localhost:9100/metrics
+"""
+
+import os
+import threading
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 延迟直方图的分桶上限（秒）
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def format_labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{escape(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Counter:
+    """按标签累加的计数器"""
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels[name]) for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(str(labels[name]) for name in self.labels), 0)
+
+    def collect(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{format_labels(self.labels, key)} {value}")
+        return lines
+
+
+class Histogram:
+    """按标签统计分布的直方图"""
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    def collect(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(float(bound))
+                    labels = format_labels(self.labels + ("le",), key + (le,))
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = format_labels(self.labels, key)
+                lines.append(f"{self.name}_sum{labels} {total}")
+                lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    """指标注册表"""
+
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        """导出Prometheus文本格式"""
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+LLM_REQUESTS = REGISTRY.register(Counter(
+    "llm_requests_total", "大模型调用次数", ("app", "model", "status")
+))
+LLM_LATENCY = REGISTRY.register(Histogram(
+    "llm_request_duration_seconds", "大模型调用耗时（不含缓存命中）", ("app", "model")
+))
+LLM_FIRST_TOKEN = REGISTRY.register(Histogram(
+    "llm_time_to_first_token_seconds", "流式调用的首字延迟", ("app", "model")
+))
+LLM_TOKENS = REGISTRY.register(Counter(
+    "llm_tokens_total", "大模型token用量", ("app", "model", "type")
+))
+LLM_CACHE_HITS = REGISTRY.register(Counter(
+    "llm_cache_hits_total", "响应缓存命中次数", ("app", "model")
+))
+
+
+def record_call(app, model, status, latency=None, usage=None):
+    """
+    记录一次大模型调用
+
+    Args:
+        app: 应用名称
+        model: 模型名称
+        status: HTTP状态码；请求异常时为 "error"，缓存命中时为 "cache"
+        latency: 调用耗时（秒），缓存命中时为None
+        usage: 响应中的usage字段
+    """
+    LLM_REQUESTS.inc(app=app, model=model, status=status)
+    if status == "cache":
+        LLM_CACHE_HITS.inc(app=app, model=model)
+    if latency is not None:
+        LLM_LATENCY.observe(latency, app=app, model=model)
+    for name in ("input_tokens", "output_tokens"):
+        if usage and usage.get(name):
+            LLM_TOKENS.inc(usage[name], app=app, model=model, type=name.split("_")[0])
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port=None, host="0.0.0.0"):
+    """
+    在后台线程启动 /metrics 服务，重复调用只启动一次
+
+    Args:
+        port: 监听端口，默认读取环境变量 METRICS_PORT，均未设置时不启动
+
+    Returns:
+        服务实例；未启动或端口被占用时返回None
+    """
+    global _server
+    port = port or os.getenv("METRICS_PORT")
+    if not port:
+        return None
+
+    with _server_lock:
+        if _server is None:
+            try:
+                _server = ThreadingHTTPServer((host, int(port)), MetricsHandler)
+            except OSError as e:
+                print(f"指标服务启动失败（端口 {port}）：{e}")
+                return None
+            _server.daemon_threads = True
+            threading.Thread(target=_server.serve_forever, daemon=True).start()
+        return _server